@@ -14,6 +14,16 @@
 
 """ADK Documentation Agent - Refactored Version."""
 
-from .agent import root_agent
+from typing import Any
 
-__all__ = ["root_agent"]
\ No newline at end of file
+__all__ = ["root_agent"]
+
+
+def __getattr__(name: str) -> Any:
+    # The agent tree is imported on first access, so importing `app.config`
+    # or the `app.corpus_index` CLI does not load every agent.
+    if name == "root_agent":
+        from .agent import root_agent
+
+        return root_agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -12,23 +12,81 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import contextlib
 import datetime
 import logging
-import re
-from collections.abc import AsyncGenerator
-from typing import Literal
+import time
+import weakref
+from collections.abc import AsyncGenerator, Callable
+from typing import Any, ClassVar, Literal
 
 from google.adk.agents import BaseAgent, LlmAgent, LoopAgent, SequentialAgent
 from google.adk.agents.callback_context import CallbackContext
 from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.llm_agent import InstructionProvider, ToolUnion
+from google.adk.agents.readonly_context import ReadonlyContext
 from google.adk.events import Event, EventActions
+from google.adk.models import LlmRequest, LlmResponse
 from google.adk.planners import BuiltInPlanner
-from google.adk.tools import google_search
+from google.adk.sessions import Session, State
+from google.adk.tools import BaseTool, ToolContext, google_search
 from google.adk.tools.agent_tool import AgentTool
+from google.adk.utils.instructions_utils import inject_session_state
 from google.genai import types as genai_types
 from pydantic import BaseModel, Field
 
-from .config import config
+from .agent_cache import PlanCache, ReportCache
+from .citations import CitationRewriter
+from .compaction import (
+    COMPACTION_CURSOR_KEY,
+    CompactionPolicy,
+    CompactionStats,
+    compact_contents,
+    compact_session_events,
+    current_findings_records,
+)
+from .config import config, ensure_environment
+from .confirmation import APPROVAL_TERMS, classify_reply, is_cancel_request
+from .corpus_index import CorpusIndex, LocalIndexSearchBackend, trigram_embedding
+from .findings import (
+    merge_findings_delta,
+    render_evaluator_view,
+    render_findings,
+    render_index,
+    sections_from_text,
+)
+from .pipeline import DependencyPipelineAgent, PipelineStage
+from .plan import PlanGoal, parse_research_plan
+from .report import remap_citations, route_section, split_outline
+from .resilience import (
+    CallPolicy,
+    ResilientCaller,
+    ResilientSearchBackend,
+    apply_resilience,
+)
+from .routing import ModelRouter, RoutedLlm, RouteRule, estimate_prompt_tokens
+from .scheduling import QueueFullError, RunScheduler
+from .search import (
+    SEARCH_TOOL_NAME,
+    GeminiSearchBackend,
+    SearchBackend,
+    SearchTool,
+    SqliteCache,
+    dedup_queries,
+    find_executed,
+    normalize_query,
+    query_similarity,
+    scope_query,
+)
+from .sources import (
+    SOURCES_CURSOR_KEY,
+    ClaimIndexCache,
+    collect_sources,
+    render_source_digest,
+)
+from .throttling import AsyncRateLimiter
+from .tracing import Tracer, build_exporters, iter_agents
 
 
 # --- Structured Output Models ---
@@ -56,6 +114,9 @@ class Feedback(BaseModel):
 
 
 # --- Callbacks ---
+_claim_index_cache = ClaimIndexCache()
+
+
 def collect_research_sources_callback(callback_context: CallbackContext) -> None:
     """Collects and organizes web-based research sources and their supported claims from agent events.
 
@@ -64,6 +125,10 @@ def collect_research_sources_callback(callback_context: CallbackContext) -> None
     (from `grounding_supports`). The aggregated source information and a mapping of URLs to short
     IDs are cumulatively stored in `callback_context.state`.
 
+    Collection is incremental: a per-session event cursor is kept in state so that only events
+    appended since the previous call are parsed, and claims are deduplicated on
+    (url, text segment) so repeated loop iterations never re-append the same claim.
+
     Args:
         callback_context (CallbackContext): The context object providing access to the agent's
             session events and persistent state.
@@ -71,51 +136,18 @@ def collect_research_sources_callback(callback_context: CallbackContext) -> None
     session = callback_context._invocation_context.session
     url_to_short_id = callback_context.state.get("url_to_short_id", {})
     sources = callback_context.state.get("sources", {})
-    id_counter = len(url_to_short_id) + 1
-    for event in session.events:
-        if not (event.grounding_metadata and event.grounding_metadata.grounding_chunks):
-            continue
-        chunks_info = {}
-        for idx, chunk in enumerate(event.grounding_metadata.grounding_chunks):
-            if not chunk.web:
-                continue
-            url = chunk.web.uri
-            title = (
-                chunk.web.title
-                if chunk.web.title != chunk.web.domain
-                else chunk.web.domain
-            )
-            if url not in url_to_short_id:
-                short_id = f"src-{id_counter}"
-                url_to_short_id[url] = short_id
-                sources[short_id] = {
-                    "short_id": short_id,
-                    "title": title,
-                    "url": url,
-                    "domain": chunk.web.domain,
-                    "supported_claims": [],
-                }
-                id_counter += 1
-            chunks_info[idx] = url_to_short_id[url]
-        if event.grounding_metadata.grounding_supports:
-            for support in event.grounding_metadata.grounding_supports:
-                confidence_scores = support.confidence_scores or []
-                chunk_indices = support.grounding_chunk_indices or []
-                for i, chunk_idx in enumerate(chunk_indices):
-                    if chunk_idx in chunks_info:
-                        short_id = chunks_info[chunk_idx]
-                        confidence = (
-                            confidence_scores[i] if i < len(confidence_scores) else 0.5
-                        )
-                        text_segment = support.segment.text if support.segment else ""
-                        sources[short_id]["supported_claims"].append(
-                            {
-                                "text_segment": text_segment,
-                                "confidence": confidence,
-                            }
-                        )
+    cursor = callback_context.state.get(SOURCES_CURSOR_KEY, 0)
+    if cursor > len(session.events):
+        # Events were removed since the last pass; the claim index makes a rescan safe.
+        cursor = 0
+    claim_index = _claim_index_cache.get(session.id, sources)
+    cursor = collect_sources(
+        session.events, sources, url_to_short_id, cursor, claim_index
+    )
+    _claim_index_cache.update(session.id, sources, claim_index)
     callback_context.state["url_to_short_id"] = url_to_short_id
     callback_context.state["sources"] = sources
+    callback_context.state[SOURCES_CURSOR_KEY] = cursor
 
 
 def citation_replacement_callback(
@@ -135,28 +167,554 @@ def citation_replacement_callback(
     """
     final_report = callback_context.state.get("final_cited_report", "")
     sources = callback_context.state.get("sources", {})
-
-    def tag_replacer(match: re.Match) -> str:
-        short_id = match.group(1)
-        if not (source_info := sources.get(short_id)):
-            logging.warning(f"Invalid citation tag found and removed: {match.group(0)}")
-            return ""
-        display_text = source_info.get("title", source_info.get("domain", short_id))
-        return f" [{display_text}]({source_info['url']})"
-
-    processed_report = re.sub(
-        r'<cite\s+source\s*=\s*["\']?\s*(src-\d+)\s*["\']?\s*/>',
-        tag_replacer,
-        final_report,
-    )
-    processed_report = re.sub(r"\s+([.,;:])", r"\1", processed_report)
+    processed_report = CitationRewriter(sources).rewrite(final_report)
     callback_context.state["final_report_with_citations"] = processed_report
     return genai_types.Content(parts=[genai_types.Part(text=processed_report)])
 
 
+# Rewriters of the reports being streamed, keyed by the id of the agent run's
+# invocation context. An entry goes away with its context, so runs that fail
+# or are cancelled before their final response do not leave one behind.
+_streaming_rewriters: dict[int, CitationRewriter] = {}
+
+
+def _streaming_rewriter(callback_context: CallbackContext) -> CitationRewriter:
+    ctx = callback_context._invocation_context
+    key = id(ctx)
+    if key not in _streaming_rewriters:
+        _streaming_rewriters[key] = CitationRewriter(
+            callback_context.state.get("sources", {})
+        )
+        weakref.finalize(ctx, _streaming_rewriters.pop, key, None)
+    return _streaming_rewriters[key]
+
+
+def stream_citations_callback(
+    callback_context: CallbackContext, llm_response: LlmResponse
+) -> LlmResponse | None:
+    """Rewrites citation tags in streamed (partial) report chunks.
+
+    Each partial response is fed to a `CitationRewriter` for the agent run, so
+    clients receive Markdown links while the report is still being generated.
+    Text that may belong to a tag split across chunks is held back until the
+    next chunk, and flushed when the stream ends: a turn-complete response
+    without content carries it as a last partial chunk, while the final,
+    non-partial response carries it in `custom_metadata["stream_tail"]`. The
+    final response's text is left untouched; it is stored under
+    `final_cited_report` and rewritten by `citation_replacement_callback`.
+
+    Args:
+        callback_context (CallbackContext): Provides `sources`.
+        llm_response (LlmResponse): A response of the report composer.
+
+    Returns:
+        LlmResponse | None: The response, if it was changed.
+    """
+    if not llm_response.partial:
+        rewriter = _streaming_rewriters.pop(
+            id(callback_context._invocation_context), None
+        )
+        tail = rewriter.flush() if rewriter else ""
+        if not tail:
+            return None
+        if llm_response.content and llm_response.content.parts:
+            llm_response.custom_metadata = {
+                **(llm_response.custom_metadata or {}),
+                "stream_tail": tail,
+            }
+        else:
+            # A bare turn-complete signal: send the tail as the last chunk,
+            # partial so that it is not saved as the agent's output.
+            llm_response.content = genai_types.Content(
+                role="model", parts=[genai_types.Part(text=tail)]
+            )
+            llm_response.partial = True
+        return llm_response
+    if not (llm_response.content and llm_response.content.parts):
+        return None
+    rewriter = _streaming_rewriter(callback_context)
+    for part in llm_response.content.parts:
+        if part.text and not part.thought:
+            part.text = rewriter.feed(part.text)
+    return llm_response
+
+
+def seed_findings_callback(callback_context: CallbackContext) -> None:
+    """Splits the first-pass findings into the structured section records.
+
+    Resets the refinement loop bookkeeping: `findings_sections`,
+    `findings_index`, `findings_last_delta`, `refinement_iteration`,
+    `refinement_metrics` and the convergence state read by `EscalationChecker`.
+
+    Args:
+        callback_context (CallbackContext): Provides `section_research_findings`.
+    """
+    state = callback_context.state
+    records = sections_from_text(state.get("section_research_findings", ""))
+    state["findings_sections"] = records
+    state["findings_index"] = render_index(records)
+    state["findings_last_delta"] = None
+    state["refinement_iteration"] = 0
+    state["refinement_metrics"] = []
+    state["refinement_progress"] = []
+    state["refinement_queries"] = []
+    state["refinement_started_at"] = None
+    state["refinement_stop_reason"] = None
+
+
+def apply_findings_delta_callback(callback_context: CallbackContext) -> None:
+    """Merges the sections emitted by a refinement pass into the findings.
+
+    Appends the new section versions from `findings_delta` to
+    `findings_sections` and re-renders `section_research_findings` and
+    `findings_index` from them. The change summary is kept under
+    `findings_last_delta` for the next evaluation.
+
+    Args:
+        callback_context (CallbackContext): Provides the delta and the records.
+    """
+    state = callback_context.state
+    records, change = merge_findings_delta(
+        state.get("findings_sections", []),
+        state.get("findings_delta", ""),
+        state.get("refinement_iteration", 0),
+    )
+    logging.info(f"[{callback_context.agent_name}] {change['summary']}")
+    state["findings_sections"] = records
+    state["section_research_findings"] = render_findings(records)
+    state["findings_index"] = render_index(records)
+    state["findings_last_delta"] = change
+
+
+def advance_refinement_iteration_callback(callback_context: CallbackContext) -> None:
+    """Counts refinement loop iterations and stamps the loop start time."""
+    state = callback_context.state
+    if state.get("refinement_started_at") is None:
+        state["refinement_started_at"] = time.time()
+    state["refinement_iteration"] = state.get("refinement_iteration", 0) + 1
+
+
+# Per-run counters of the agents in the refinement loop, keyed by
+# (invocation_id, agent_name) until the agent finishes.
+_running_metrics: dict[tuple[str, str], dict[str, Any]] = {}
+
+
+def start_refinement_metrics_callback(callback_context: CallbackContext) -> None:
+    """Starts the latency and token counters of a refinement loop agent."""
+    _running_metrics[(callback_context.invocation_id, callback_context.agent_name)] = {
+        "started": time.perf_counter(),
+        "model_calls": 0,
+        "prompt_tokens": 0,
+        "output_tokens": 0,
+        "thought_tokens": 0,
+    }
+
+
+def record_model_usage_callback(
+    callback_context: CallbackContext, llm_response: LlmResponse
+) -> None:
+    """Adds the token usage of a model response to the running counters."""
+    metrics = _running_metrics.get(
+        (callback_context.invocation_id, callback_context.agent_name)
+    )
+    usage = llm_response.usage_metadata
+    if metrics is None or llm_response.partial or usage is None:
+        return
+    metrics["model_calls"] += 1
+    metrics["prompt_tokens"] += usage.prompt_token_count or 0
+    metrics["output_tokens"] += usage.candidates_token_count or 0
+    metrics["thought_tokens"] += usage.thoughts_token_count or 0
+
+
+def finish_refinement_metrics_callback(callback_context: CallbackContext) -> None:
+    """Appends the agent's counters for this iteration to `refinement_metrics`."""
+    metrics = _running_metrics.pop(
+        (callback_context.invocation_id, callback_context.agent_name), None
+    )
+    if metrics is None:
+        return
+    state = callback_context.state
+    started = metrics.pop("started")
+    state["refinement_metrics"] = [
+        *state.get("refinement_metrics", []),
+        {
+            "iteration": state.get("refinement_iteration", 0),
+            "agent": callback_context.agent_name,
+            "latency_s": round(time.perf_counter() - started, 3),
+            **metrics,
+        },
+    ]
+
+
+# State keys of the executed-query ledger and its counters.
+EXECUTED_QUERIES_KEY = "executed_queries"
+SEARCH_DEDUP_KEY = "search_dedup"
+
+
+def _count_searches(state: Any, **counts: int) -> None:
+    stats = {
+        "executed": 0,
+        "rescoped": 0,
+        "duplicates_avoided": 0,
+        "follow_ups_dropped": 0,
+        **(state.get(SEARCH_DEDUP_KEY) or {}),
+    }
+    for name, count in counts.items():
+        stats[name] += count
+    state[SEARCH_DEDUP_KEY] = stats
+
+
+def dedup_search_callback(
+    tool: BaseTool, args: dict[str, Any], tool_context: ToolContext
+) -> dict[str, Any] | None:
+    """Scopes every search to the ADK docs and skips already executed queries.
+
+    The `site:` prefix is rewritten into the call arguments, so it no longer
+    depends on the prompt. A query that matches the session's executed-query
+    ledger exactly, or by `search_query_similarity`, is answered with a note
+    instead of a search round trip. Counts go to `search_dedup`.
+
+    Args:
+        tool (BaseTool): The tool about to run.
+        args (dict[str, Any]): The call arguments, rewritten in place.
+        tool_context (ToolContext): Provides the session state.
+
+    Returns:
+        dict[str, Any] | None: The response replacing a duplicate search, or
+        None to run the tool.
+    """
+    if not config.search_dedup or tool.name != SEARCH_TOOL_NAME:
+        return None
+    state = tool_context.state
+    query = str(args.get("query", ""))
+    scoped = scope_query(query)
+    if scoped != query:
+        args["query"] = scoped
+    ledger = state.get(EXECUTED_QUERIES_KEY, [])
+    # Both keys are written on every call: ADK keeps only the state delta of
+    # the last call when it merges the responses of parallel function calls.
+    if duplicate := find_executed(scoped, ledger, config.search_query_similarity):
+        logging.info(
+            f"[{tool_context.agent_name}] Skipped search {scoped!r}: "
+            f"already executed as {duplicate!r}."
+        )
+        state[EXECUTED_QUERIES_KEY] = ledger
+        _count_searches(state, rescoped=scoped != query, duplicates_avoided=1)
+        return {
+            "query": scoped,
+            "summary": (
+                f"Not searched again: this session already executed {duplicate!r}. "
+                "Use the earlier results, or search a different aspect."
+            ),
+            "results": [],
+        }
+    state[EXECUTED_QUERIES_KEY] = [*ledger, normalize_query(scoped)]
+    _count_searches(state, executed=1, rescoped=scoped != query)
+    return None
+
+
+def record_grounded_queries_callback(
+    callback_context: CallbackContext, llm_response: LlmResponse
+) -> None:
+    """Adds the queries the built-in `google_search` ran to the ledger."""
+    grounding = llm_response.grounding_metadata
+    if llm_response.partial or not grounding or not grounding.web_search_queries:
+        return
+    state = callback_context.state
+    ledger = state.get(EXECUTED_QUERIES_KEY, [])
+    new = [
+        query
+        for query in dict.fromkeys(map(normalize_query, grounding.web_search_queries))
+        if query not in ledger
+    ]
+    state[EXECUTED_QUERIES_KEY] = [*ledger, *new]
+    _count_searches(state, executed=len(new))
+
+
+def filter_follow_up_queries_callback(callback_context: CallbackContext) -> None:
+    """Drops follow-up queries of the evaluation that were already executed.
+
+    The remaining queries are scoped to the ADK docs, so `enhanced_search_executor`
+    only sees searches that still need a round trip. The dropped ones are kept
+    under `dropped_follow_up_queries`, so `EscalationChecker` can tell repeated
+    follow-ups from none at all.
+    """
+    if not config.search_dedup:
+        return
+    state = callback_context.state
+    evaluation = state.get("research_evaluation")
+    if not isinstance(evaluation, dict) or not evaluation.get("follow_up_queries"):
+        return
+    queries = [
+        q["search_query"]
+        for q in evaluation["follow_up_queries"]
+        if q.get("search_query")
+    ]
+    kept, dropped = dedup_queries(
+        queries, state.get(EXECUTED_QUERIES_KEY, []), config.search_query_similarity
+    )
+    if dropped:
+        logging.info(
+            f"[{callback_context.agent_name}] Dropped {len(dropped)} follow-up "
+            f"queries already executed: {dropped}"
+        )
+    state["research_evaluation"] = {
+        **evaluation,
+        "follow_up_queries": [{"search_query": query} for query in kept],
+        "dropped_follow_up_queries": dropped,
+    }
+    _count_searches(state, follow_ups_dropped=len(dropped))
+
+
+def route_model_callback(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> None:
+    """Picks the model tier of a routed agent's call (see `app.routing`).
+
+    Plan refinements, i.e. calls while a plan awaits approval, count as
+    revisions. Agents without a `RoutedLlm` are left alone.
+    """
+    model = getattr(callback_context._invocation_context.agent, "model", None)
+    if not isinstance(model, RoutedLlm):
+        return None
+    state = callback_context.state
+    plan = state.get("research_plan")
+    llm_request.model = model.router.choose(
+        model.task_class,
+        prompt_tokens=estimate_prompt_tokens(llm_request),
+        iteration=state.get("refinement_iteration") or 0,
+        revision=bool(plan) and plan != state.get("executed_research_plan"),
+    )
+    return None
+
+
+def record_route_metrics_callback(
+    callback_context: CallbackContext, llm_response: LlmResponse
+) -> None:
+    """Publishes the per-route metrics under `model_routing` after a routed call."""
+    model = getattr(callback_context._invocation_context.agent, "model", None)
+    if isinstance(model, RoutedLlm) and not llm_response.partial:
+        callback_context.state["model_routing"] = model.router.metrics()
+
+
+compaction_policy = CompactionPolicy(
+    strip_thoughts=config.compaction_strip_thoughts,
+    strip_grounding=config.compaction_strip_grounding,
+    drop_superseded=config.compaction_drop_superseded,
+    max_events=config.compaction_max_events,
+)
+
+
+def _keeps_contents(author: str) -> bool:
+    """Whether compaction keeps an author's contents: researchers and loop agents."""
+    # Goal researchers run as numbered copies of `goal_researcher`.
+    return author in compaction_kept_authors or author.startswith(
+        f"{goal_researcher.name}_"
+    )
+
+
+def _compact_stored_events(
+    session: Session, state: State | dict[str, Any], policy: CompactionPolicy
+) -> tuple[dict[str, Any], CompactionStats]:
+    """Compacts the session events whose sources are collected, in place.
+
+    Returns:
+        tuple[dict[str, Any], CompactionStats]: The state delta with the new
+            compaction cursor, empty when it did not move, and the removals.
+    """
+    previous = state.get(COMPACTION_CURSOR_KEY) or {}
+    cursor, stats = compact_session_events(
+        session.events,
+        policy,
+        _keeps_contents,
+        previous,
+        state.get(SOURCES_CURSOR_KEY, 0),
+    )
+    moved = any(cursor[key] != previous.get(key, 0) for key in ("stripped", "checked"))
+    return ({COMPACTION_CURSOR_KEY: cursor} if moved else {}), stats
+
+
+def _compaction_totals(
+    state: State | dict[str, Any], stats: CompactionStats
+) -> dict[str, Any]:
+    """The state delta adding `stats` to `session_compaction`, if anything changed."""
+    removed = stats.as_dict()
+    if not any(value for key, value in removed.items() if key != "events_kept"):
+        return {}
+    totals = dict(state.get("session_compaction") or {})
+    for key, value in removed.items():
+        totals[key] = value if key == "events_kept" else totals.get(key, 0) + value
+    return {"session_compaction": totals}
+
+
+def compact_request_callback(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> None:
+    """Compacts the stored session events and a model request (see `app.compaction`).
+
+    Events whose sources are collected are compacted in place, from the cursor
+    under `compaction_event_cursor`, so later requests and the stored session
+    stay small. The request's own copy of the remaining events is stripped
+    too. Events of the researchers, which hold the findings, and of the
+    refinement loop's agents are never dropped. The counts are added up under
+    `session_compaction`.
+    """
+    state = callback_context.state
+    delta, stats = _compact_stored_events(
+        callback_context._invocation_context.session, state, compaction_policy
+    )
+    llm_request.contents, request_stats = compact_contents(
+        llm_request.contents, compaction_policy
+    )
+    stats.add(request_stats)
+    stats.events_kept = request_stats.events_kept
+    delta |= _compaction_totals(state, stats)
+    for key, value in delta.items():
+        state[key] = value
+    return None
+
+
+def compact_session_callback(callback_context: CallbackContext) -> None:
+    """Compacts the stored events whose sources a pipeline run collected."""
+    state = callback_context.state
+    delta, stats = _compact_stored_events(
+        callback_context._invocation_context.session, state, compaction_policy
+    )
+    delta |= _compaction_totals(state, stats)
+    for key, value in delta.items():
+        state[key] = value
+    return None
+
+
+# Added to the agents that see the session history.
+compaction_callback = compact_request_callback if config.session_compaction else None
+
+
 # --- Custom Agent for Loop Control ---
 class EscalationChecker(BaseAgent):
-    """Checks research evaluation and escalates to stop the loop if grade is 'pass'."""
+    """Stops the refinement loop once more research is unlikely to pay off.
+
+    Escalates when the evaluation grade is 'pass', and also when the loop has
+    converged or exhausted its budget:
+
+    - no new sources or claims were collected in the last `stall_iterations`
+      iterations;
+    - every follow-up query of the evaluation repeats an earlier one, by
+      `query_similarity` of at least `query_similarity`, or was dropped as
+      already executed by `filter_follow_up_queries_callback`;
+    - the loop ran longer than `max_seconds` or its agents used more than
+      `max_tokens` model tokens, as recorded in `refinement_metrics`.
+
+    The reason is stored under `refinement_stop_reason`.
+    """
+
+    stall_iterations: int = 0
+    query_similarity: float = 1.0
+    max_seconds: float = 0.0
+    max_tokens: int = 0
+    max_iterations: int = 0
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        state = ctx.session.state
+        sources = state.get("sources", {})
+        progress = [
+            *state.get("refinement_progress", []),
+            [
+                len(sources),
+                sum(len(s.get("supported_claims", [])) for s in sources.values()),
+            ],
+        ]
+        evaluation_result = state.get("research_evaluation") or {}
+        queries = [
+            normalize_query(q["search_query"])
+            for q in evaluation_result.get("follow_up_queries") or []
+            if q.get("search_query")
+        ]
+        seen_queries = state.get("refinement_queries", [])
+        reason = self._stop_reason(
+            state, evaluation_result, progress, queries, seen_queries
+        )
+        state_delta: dict[str, Any] = {
+            "refinement_progress": progress,
+            "refinement_queries": [*seen_queries, *queries],
+        }
+        if reason is None:
+            logging.info(
+                f"[{self.name}] Research evaluation failed or not found. Loop will continue."
+            )
+            # Yielding an event without escalation just lets the flow continue.
+            yield Event(author=self.name, actions=EventActions(state_delta=state_delta))
+            return
+        state_delta["refinement_stop_reason"] = reason
+        if reason == "max_iterations":
+            # The loop ends by itself after this iteration's search pass.
+            logging.info(f"[{self.name}] Last refinement iteration reached.")
+            yield Event(author=self.name, actions=EventActions(state_delta=state_delta))
+            return
+        logging.info(f"[{self.name}] Stopping refinement loop: {reason}.")
+        yield Event(
+            author=self.name,
+            actions=EventActions(state_delta=state_delta, escalate=True),
+        )
+
+    def _stop_reason(
+        self,
+        state: dict[str, Any],
+        evaluation_result: dict[str, Any],
+        progress: list[list[int]],
+        queries: list[str],
+        seen_queries: list[str],
+    ) -> str | None:
+        """Returns why the loop should stop now, or None to keep refining."""
+        if evaluation_result.get("grade") == "pass":
+            return "pass"
+        metrics = state.get("refinement_metrics", [])
+        started_at = state.get("refinement_started_at")
+        if self.max_seconds > 0 and started_at is not None:
+            if time.time() - started_at >= self.max_seconds:
+                return "time_budget"
+        if self.max_tokens > 0:
+            used = sum(
+                m["prompt_tokens"] + m["output_tokens"] + m["thought_tokens"]
+                for m in metrics
+            )
+            if used >= self.max_tokens:
+                return "token_budget"
+        if (
+            self.stall_iterations > 0
+            and len(progress) > self.stall_iterations
+            and progress[-1] == progress[-1 - self.stall_iterations]
+        ):
+            return "no_new_sources"
+        if evaluation_result and not queries:
+            if evaluation_result.get("dropped_follow_up_queries"):
+                return "repeated_queries"
+            return "no_follow_up_queries"
+        if queries and all(
+            any(
+                query_similarity(q, seen) >= self.query_similarity
+                for seen in seen_queries
+            )
+            for q in queries
+        ):
+            return "repeated_queries"
+        if (
+            self.max_iterations
+            and state.get("refinement_iteration", 0) >= self.max_iterations
+        ):
+            return "max_iterations"
+        return None
+
+
+class SourceDigestBuilder(BaseAgent):
+    """Renders a compact, budgeted digest of `sources` for the report composer.
+
+    Stores the digest under `sources_digest` and records how many prompt bytes
+    it saved compared to interpolating the full registry under
+    `source_digest_stats`.
+    """
 
     def __init__(self, name: str):
         super().__init__(name=name)
@@ -164,31 +722,407 @@ class EscalationChecker(BaseAgent):
     async def _run_async_impl(
         self, ctx: InvocationContext
     ) -> AsyncGenerator[Event, None]:
-        evaluation_result = ctx.session.state.get("research_evaluation")
-        if evaluation_result and evaluation_result.get("grade") == "pass":
+        sources = ctx.session.state.get("sources", {})
+        digest, stats = render_source_digest(
+            sources,
+            max_chars=config.source_digest_max_chars,
+            claims_per_source=config.source_digest_claims_per_source,
+        )
+        # Session state is interpolated into instructions with str().
+        full_bytes = len(str(sources).encode("utf-8"))
+        digest_bytes = len(digest.encode("utf-8"))
+        stats.update(
+            sources_bytes=full_bytes,
+            digest_bytes=digest_bytes,
+            saved_bytes=max(full_bytes - digest_bytes, 0),
+        )
+        logging.info(
+            f"[{self.name}] Source digest: {digest_bytes} bytes instead of "
+            f"{full_bytes} ({stats['saved_bytes']} saved, "
+            f"{stats['sources_included']}/{stats['sources_total']} sources)."
+        )
+        yield Event(
+            author=self.name,
+            actions=EventActions(
+                state_delta={"sources_digest": digest, "source_digest_stats": stats}
+            ),
+        )
+
+
+class SessionCompactor(BaseAgent):
+    """Compacts the session after every refinement loop iteration.
+
+    Drops superseded `findings_sections` versions, since readers only use the
+    latest version of each section, and compacts the stored events whose
+    sources were collected during the iteration (see `app.compaction`).
+    """
+
+    policy: CompactionPolicy
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        state = ctx.session.state
+        delta, stats = _compact_stored_events(ctx.session, state, self.policy)
+        delta |= _compaction_totals(state, stats)
+        if self.policy.drop_superseded:
+            records = state.get("findings_sections", [])
+            current = current_findings_records(records)
+            delta["findings_sections"] = current
             logging.info(
-                f"[{self.name}] Research evaluation passed. Escalating to stop loop."
+                f"[{self.name}] Dropped {len(records) - len(current)} superseded "
+                "findings section versions."
             )
-            yield Event(author=self.name, actions=EventActions(escalate=True))
-        else:
+        if not delta:
+            return
+        yield Event(author=self.name, actions=EventActions(state_delta=delta))
+
+
+def _copy_name(name: str, index: int, count: int) -> str:
+    """Names the `index`-th of `count` copies of an agent, e.g. `writer_07`.
+
+    The number is zero-padded to the width of `count`: ADK shows an agent the
+    events of every branch that prefixes its own, so `writer_1` must not be a
+    prefix of `writer_10`.
+    """
+    return f"{name}_{index + 1:0{len(str(count))}d}"
+
+
+class ParallelSectionResearcher(BaseAgent):
+    """Researches every `[RESEARCH]` goal of the plan concurrently.
+
+    The `research_plan` bullets are parsed by their task type prefix. Each
+    `[RESEARCH]` goal gets its own copy of `goal_researcher`, run on an
+    isolated branch under a concurrency limit and a start-rate limiter. Once
+    all goals finished, the per-goal summaries and grounding sources are merged
+    in plan order, so `section_research_findings` and the `src-N` numbering do
+    not depend on completion order. `deliverable_synthesizer` then produces the
+    `[DELIVERABLE]` artifacts from the merged summaries.
+
+    Plans without recognizable `[RESEARCH]` bullets are handed to
+    `fallback_researcher` unchanged.
+    """
+
+    goal_researcher: LlmAgent
+    deliverable_synthesizer: LlmAgent
+    fallback_researcher: BaseAgent
+    max_concurrency: int = 4
+    requests_per_second: float = 0.0
+
+    def __init__(
+        self,
+        name: str,
+        goal_researcher: LlmAgent,
+        deliverable_synthesizer: LlmAgent,
+        fallback_researcher: BaseAgent,
+        max_concurrency: int = 4,
+        requests_per_second: float = 0.0,
+        **kwargs: Any,
+    ):
+        # BaseAgent's signature does not list the fields of subclasses.
+        super().__init__(  # type: ignore[call-arg]
+            name=name,
+            goal_researcher=goal_researcher,
+            deliverable_synthesizer=deliverable_synthesizer,
+            fallback_researcher=fallback_researcher,
+            max_concurrency=max_concurrency,
+            requests_per_second=requests_per_second,
+            sub_agents=[goal_researcher, deliverable_synthesizer, fallback_researcher],
+            **kwargs,
+        )
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        goals = parse_research_plan(ctx.session.state.get("research_plan", ""))
+        research_goals = [goal for goal in goals if goal.kind == "RESEARCH"]
+        if not research_goals:
             logging.info(
-                f"[{self.name}] Research evaluation failed or not found. Loop will continue."
+                f"[{self.name}] No [RESEARCH] goals found in the plan. "
+                f"Falling back to {self.fallback_researcher.name}."
             )
-            # Yielding an event without content or actions just lets the flow continue.
-            yield Event(author=self.name)
+            async for event in self.fallback_researcher.run_async(ctx):
+                yield event
+            return
+
+        backlog_end = len(ctx.session.events)
+        goal_events: list[list[Event]] = [[] for _ in research_goals]
+        async for goal_index, event in self._run_goals(ctx, research_goals):
+            yield event
+            goal_events[goal_index].append(event)
+
+        findings = "\n\n".join(
+            f"## [RESEARCH] {goal.text}\n\n{_final_text(events) or '(no findings)'}"
+            for goal, events in zip(research_goals, goal_events, strict=True)
+        )
+        state_delta = self._merge_sources(ctx, backlog_end, goal_events)
+        state_delta["research_goal_summaries"] = findings
+        state_delta["section_research_findings"] = findings
+        yield Event(author=self.name, actions=EventActions(state_delta=state_delta))
+
+        if any(goal.kind == "DELIVERABLE" for goal in goals):
+            async for event in self.deliverable_synthesizer.run_async(ctx):
+                yield event
+            artifacts = ctx.session.state.get("deliverable_artifacts", "")
+            findings = f"{findings}\n\n{artifacts}".strip()
+        yield Event(
+            author=self.name,
+            content=genai_types.Content(
+                role="model", parts=[genai_types.Part(text=findings)]
+            ),
+            actions=EventActions(state_delta={"section_research_findings": findings}),
+        )
+
+    async def _run_goals(
+        self, ctx: InvocationContext, goals: list[PlanGoal]
+    ) -> AsyncGenerator[tuple[int, Event], None]:
+        """Runs one researcher per goal and yields their events as they arrive.
+
+        Like `ParallelAgent`, a researcher does not resume until its previous
+        event was processed upstream, so its own events are in the session
+        before its next model call.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        limiter = AsyncRateLimiter(self.requests_per_second)
+        queue: asyncio.Queue[tuple[int, Event | None, asyncio.Event | None]] = (
+            asyncio.Queue()
+        )
+
+        async def research(index: int, goal: PlanGoal) -> None:
+            try:
+                async with semaphore:
+                    await limiter.acquire()
+                    researcher = self.goal_researcher.model_copy(
+                        update={
+                            "name": _copy_name(
+                                self.goal_researcher.name, index, len(goals)
+                            ),
+                            "instruction": _goal_instruction_provider(goal),
+                        }
+                    )
+                    branch = f"{self.name}.{researcher.name}"
+                    branch_ctx = ctx.model_copy(
+                        update={
+                            "branch": f"{ctx.branch}.{branch}" if ctx.branch else branch
+                        }
+                    )
+                    async for event in researcher.run_async(branch_ctx):
+                        processed = asyncio.Event()
+                        await queue.put((index, event, processed))
+                        await processed.wait()
+            finally:
+                await queue.put((index, None, None))
+
+        tasks = [
+            asyncio.create_task(research(index, goal))
+            for index, goal in enumerate(goals)
+        ]
+        running = len(tasks)
+        try:
+            while running:
+                index, event, processed = await queue.get()
+                if event is None or processed is None:
+                    running -= 1
+                    continue
+                yield index, event
+                processed.set()
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _merge_sources(
+        self,
+        ctx: InvocationContext,
+        backlog_end: int,
+        goal_events: list[list[Event]],
+    ) -> dict[str, Any]:
+        """Registers grounding sources goal by goal, in plan order."""
+        session = ctx.session
+        sources = session.state.get("sources", {})
+        url_to_short_id = session.state.get("url_to_short_id", {})
+        cursor = min(session.state.get(SOURCES_CURSOR_KEY, 0), backlog_end)
+        claim_index = _claim_index_cache.get(session.id, sources)
+        collect_sources(
+            session.events[:backlog_end], sources, url_to_short_id, cursor, claim_index
+        )
+        for events in goal_events:
+            collect_sources(events, sources, url_to_short_id, 0, claim_index)
+        _claim_index_cache.update(session.id, sources, claim_index)
+        return {
+            "sources": sources,
+            "url_to_short_id": url_to_short_id,
+            SOURCES_CURSOR_KEY: len(session.events),
+        }
+
+
+def _final_text(events: list[Event]) -> str:
+    """Returns the visible text of the last final response among `events`."""
+    for event in reversed(events):
+        if event.is_final_response() and event.content and event.content.parts:
+            return "".join(
+                part.text
+                for part in event.content.parts
+                if part.text and not part.thought
+            ).strip()
+    return ""
+
+
+# --- Call resilience ---
+def call_policy(route: str) -> CallPolicy:
+    """Returns the deadlines, retries and hedging of an agent or "search"."""
+    deadline, attempt_timeout = (
+        config.call_deadline_seconds,
+        config.call_attempt_timeout_seconds,
+    )
+    for name, route_deadline, route_timeout in config.call_deadlines:
+        if name == route:
+            deadline, attempt_timeout = route_deadline, route_timeout
+    return CallPolicy(
+        deadline_s=deadline,
+        attempt_timeout_s=attempt_timeout,
+        max_attempts=config.call_max_attempts,
+        backoff_base_s=config.call_backoff_base_seconds,
+        backoff_max_s=config.call_backoff_max_seconds,
+        hedge=route in config.hedged_calls,
+        hedge_quantile=config.hedge_quantile,
+        hedge_min_samples=config.hedge_min_samples,
+    )
+
+
+resilient_caller = (
+    ResilientCaller(
+        rate_limits={
+            model: (rate, burst) for model, rate, burst in config.model_rate_limits
+        }
+    )
+    if config.resilient_calls
+    else None
+)
+
+
+# --- Tools ---
+def build_search_tools(backend_name: str) -> list[ToolUnion]:
+    """Returns the search tools for a `ResearchConfiguration` search backend.
+
+    Args:
+        backend_name (str): "google_search", "gemini" or "local_index".
+
+    Returns:
+        list[ToolUnion]: The built-in `google_search` tool, or a `SearchTool`
+            backed by the persistent search cache or the offline corpus index.
+    """
+    if backend_name == "google_search":
+        return [google_search]
+    if backend_name == "local_index":
+        index = CorpusIndex(
+            config.local_index_path,
+            embed_fn=trigram_embedding if config.local_index_vectors else None,
+        )
+        return [SearchTool(LocalIndexSearchBackend(index, config.local_index_top_k))]
+    if backend_name == "gemini":
+        backend: SearchBackend = GeminiSearchBackend(config.search_model)
+        if resilient_caller is not None:
+            backend = ResilientSearchBackend(
+                backend, resilient_caller, call_policy("search"), config.search_model
+            )
+    else:
+        raise ValueError(f"Unknown search backend: {backend_name!r}")
+    cache = SqliteCache(
+        config.search_cache_path,
+        namespace="search",
+        ttl_seconds=config.search_cache_ttl_seconds,
+        max_entries=config.search_cache_max_entries,
+        max_entry_bytes=config.search_cache_max_entry_bytes,
+    )
+    return [SearchTool(backend, cache)]
+
+
+search_tools = build_search_tools(config.search_backend)
+research_search_tools = (
+    build_search_tools(config.research_search_backend)
+    if config.research_search_backend
+    else search_tools
+)
+
+
+def dated_instruction(template: str) -> InstructionProvider:
+    """Builds an instruction whose `{current_date}` is stamped per model call.
+
+    The rest of the template keeps the usual `{state_key}` injection.
+
+    Args:
+        template (str): The instruction text.
+
+    Returns:
+        InstructionProvider: A provider for `LlmAgent.instruction`.
+    """
+
+    async def instruction(ctx: ReadonlyContext) -> str:
+        today = datetime.datetime.now().strftime("%Y-%m-%d")
+        return await inject_session_state(
+            template.replace("{current_date}", today), ctx
+        )
+
+    return instruction
+
+
+def ensure_environment_callback(callback_context: CallbackContext) -> None:
+    """Resolves credentials and environment before the first model call."""
+    ensure_environment()
 
 
 # --- AGENT DEFINITIONS ---
+model_router = (
+    ModelRouter(
+        config.model_tiers,
+        rules={
+            # First plans on the strongest tier, refinements on the weakest.
+            "plan": RouteRule(tier=len(config.model_tiers) - 1, revision_tier=0),
+            "outline": RouteRule(
+                tier=0, max_prompt_tokens=config.routing_max_prompt_tokens
+            ),
+            "evaluation": RouteRule(
+                tier=0,
+                max_prompt_tokens=config.routing_max_prompt_tokens,
+                escalate_from_iteration=config.routing_escalate_from_iteration,
+                min_pass_rate=config.routing_min_pass_rate,
+            ),
+        },
+        prices={name: (prompt, output) for name, prompt, output in config.model_prices},
+        window=config.routing_window,
+    )
+    if config.model_routing
+    else None
+)
+
+
+def routed_model(task_class: str, model: str) -> str | RoutedLlm:
+    """Returns the model of an agent of `task_class`, or `model` without routing."""
+    return model_router.llm(task_class) if model_router else model
+
+
+plan_cache = (
+    PlanCache(
+        config.plan_cache_path,
+        ttl_seconds=config.plan_cache_ttl_seconds,
+        max_entries=config.plan_cache_max_entries,
+        min_similarity=config.plan_cache_similarity,
+    )
+    if config.plan_cache
+    else None
+)
+
 plan_generator = LlmAgent(
-    model=config.worker_model,
+    model=routed_model("plan", config.worker_model),
     name="plan_generator",
     description="Generates or refine the existing 5 line action-oriented research plan, using minimal search only for topic clarification.",
-    instruction=f"""
+    instruction=dated_instruction("""
     You are a research strategist. Your job is to create a high-level RESEARCH PLAN, not a summary. If there is already a RESEARCH PLAN in the session state,
     improve upon it based on the user feedback.
 
     RESEARCH PLAN(SO FAR):
-    {{ research_plan? }}
+    { research_plan? }
 
     **GENERAL INSTRUCTION: CLASSIFY TASK TYPES**
     Your plan must clearly classify each goal for downstream execution. Each bullet point should start with a task type prefix:
@@ -213,17 +1147,25 @@ plan_generator = LlmAgent(
     Your goal is to create a generic, high-quality plan *without searching*.
     Only use `google_search` if a topic is ambiguous or time-sensitive and you absolutely cannot create a plan without a key piece of identifying information.
     You are explicitly forbidden from researching the *content* or *themes* of the topic. That is the next agent's job. Your search is only to identify the subject, not to investigate it.
-    Current date: {datetime.datetime.now().strftime("%Y-%m-%d")}
+    Current date: {current_date}
 
     ### [URL-RESTRICTION ADDED] ###
     **HARD URL RESTRICTION (MANDATORY):** If you use `google_search` for any reason, you MUST prefix every query with `site:google.github.io/adk-docs/`. Never search outside this URL and never remove this prefix.
-    """,
-    tools=[google_search],
+    """),
+    tools=search_tools,
+    before_agent_callback=plan_cache.before_agent if plan_cache else None,
+    after_agent_callback=plan_cache.after_agent if plan_cache else None,
+    before_model_callback=route_model_callback,
+    before_tool_callback=dedup_search_callback,
+    after_model_callback=[
+        record_grounded_queries_callback,
+        record_route_metrics_callback,
+    ],
 )
 
 
 section_planner = LlmAgent(
-    model=config.worker_model,
+    model=routed_model("outline", config.worker_model),
     name="section_planner",
     description="Breaks down the research plan into a structured markdown outline of report sections.",
     instruction="""
@@ -238,6 +1180,8 @@ section_planner = LlmAgent(
     Do not include a "References" or "Sources" section in your outline. Citations will be handled in-line.
     """,
     output_key="report_sections",
+    before_model_callback=route_model_callback,
+    after_model_callback=record_route_metrics_callback,
 )
 
 
@@ -290,17 +1234,93 @@ section_researcher = LlmAgent(
 
     **Final Output:** Your final output will comprise the complete set of processed summaries from `[RESEARCH]` tasks AND all the generated artifacts from `[DELIVERABLE]` tasks, presented clearly and distinctly.
     """,
-    tools=[google_search],
+    tools=research_search_tools,
+    before_model_callback=compaction_callback,
+    before_tool_callback=dedup_search_callback,
+    after_model_callback=record_grounded_queries_callback,
     output_key="section_research_findings",
-    after_agent_callback=collect_research_sources_callback,
+    after_agent_callback=[collect_research_sources_callback, seed_findings_callback],
 )
 
-research_evaluator = LlmAgent(
-    model=config.critic_model,
-    name="research_evaluator",
-    description="Critically evaluates research and generates follow-up queries.",
-    instruction=f"""
-    You are a meticulous quality assurance analyst evaluating the research findings in 'section_research_findings'.
+GOAL_RESEARCHER_INSTRUCTION = """
+    You are a highly capable and diligent research agent. You are responsible for exactly ONE goal of a larger research plan; other goals are handled by other researchers in parallel.
+
+    **Research goal:** {goal}
+
+    ### [URL-RESTRICTION ADDED] ###
+    **HARD URL RESTRICTION (MANDATORY):** All search queries MUST begin with the prefix `site:google.github.io/adk-docs/`. You may not issue, rewrite, or execute any query that would search outside this URL.
+
+    *   **Query Generation:** Formulate a comprehensive set of 4-5 targeted search queries that cover the intent of the goal from multiple angles. **Prefix every query with `site:google.github.io/adk-docs/`.**
+    *   **Execution:** Utilize the `google_search` tool to execute **all** generated queries.
+    *   **Summarization:** Synthesize the search results into a detailed, coherent summary that directly addresses the goal.
+
+    **Final Output:** Only the summary for this goal. Do not address other goals and do not produce deliverables.
+    """
+
+
+def _goal_instruction_provider(goal: PlanGoal) -> Callable[[ReadonlyContext], str]:
+    """Builds the instruction of the researcher assigned to `goal`.
+
+    Providers bypass state injection, so braces in the goal text are safe.
+    """
+    instruction = GOAL_RESEARCHER_INSTRUCTION.format(goal=goal.text)
+    return lambda _ctx: instruction
+
+
+goal_researcher = LlmAgent(
+    model=config.worker_model,
+    name="goal_researcher",
+    description="Researches a single [RESEARCH] goal of the plan.",
+    planner=BuiltInPlanner(
+        thinking_config=genai_types.ThinkingConfig(include_thoughts=True)
+    ),
+    instruction=GOAL_RESEARCHER_INSTRUCTION,
+    tools=research_search_tools,
+    before_tool_callback=dedup_search_callback,
+    after_model_callback=record_grounded_queries_callback,
+)
+
+deliverable_synthesizer = LlmAgent(
+    model=config.worker_model,
+    name="deliverable_synthesizer",
+    include_contents="none",
+    description="Produces the [DELIVERABLE] artifacts from the per-goal research summaries.",
+    instruction="""
+    You are a synthesis agent. The research for every `[RESEARCH]` goal of the plan below has already been completed.
+
+    ---
+    ### INPUT DATA
+    *   Research Plan: `{research_plan}`
+    *   Research Summaries: `{research_goal_summaries}`
+
+    ---
+    For **every** goal prefixed with `[DELIVERABLE]`, interpret the goal's text as a **direct and non-negotiable instruction** and PRODUCE the artifact it describes.
+    *   If the instruction details a table, your output for this step **MUST** be a properly formatted Markdown table.
+    *   Use **ONLY** the Research Summaries. You **MUST NOT** perform new searches.
+
+    **Final Output:** All `[DELIVERABLE]` artifacts, each under a `## [DELIVERABLE] <goal>` heading.
+    """,
+    output_key="deliverable_artifacts",
+)
+
+# Built only with the fan-out: it adopts `section_researcher` as its fallback,
+# and an agent can only have one parent.
+parallel_section_researcher = (
+    ParallelSectionResearcher(
+        name="parallel_section_researcher",
+        goal_researcher=goal_researcher,
+        deliverable_synthesizer=deliverable_synthesizer,
+        fallback_researcher=section_researcher,
+        max_concurrency=config.research_max_concurrency,
+        requests_per_second=config.research_requests_per_second,
+        after_agent_callback=seed_findings_callback,
+    )
+    if config.research_fanout
+    else None
+)
+
+RESEARCH_EVALUATOR_INSTRUCTION = """
+    You are a meticulous quality assurance analyst evaluating research findings.
 
     **CRITICAL RULES:**
     1. Assume the given research topic is correct. Do not question or try to verify the subject itself.
@@ -313,13 +1333,66 @@ research_evaluator = LlmAgent(
     write a detailed comment about what's missing, and generate 5-7 specific follow-up queries to fill those gaps.
     If the research thoroughly covers the topic, grade "pass".
 
-    Current date: {datetime.datetime.now().strftime("%Y-%m-%d")}
+    ---
+    ### RESEARCH PLAN
+    {research_plan}
+
+    ### {findings_heading}
+    {findings}
+    {previous_evaluation}
+    ---
+    Current date: {date}
     Your response must be a single, raw JSON object validating against the 'Feedback' schema.
-    """,
+    """
+
+
+def research_evaluator_instruction(ctx: ReadonlyContext) -> str:
+    """Builds the evaluator prompt from the structured findings in state.
+
+    The first evaluation, and any evaluation after a large rewrite, reads the
+    complete findings. Later ones read the diff summary and the changed
+    sections only, together with the comment of the previous evaluation.
+    """
+    findings, complete = render_evaluator_view(
+        ctx.state.get("findings_sections", []),
+        ctx.state.get("findings_last_delta"),
+        config.findings_full_review_ratio,
+    )
+    previous = ctx.state.get("research_evaluation")
+    previous_evaluation = (
+        f"\n    ### YOUR PREVIOUS EVALUATION\n    {previous.get('comment', '')}\n"
+        if previous and not complete
+        else ""
+    )
+    return RESEARCH_EVALUATOR_INSTRUCTION.format(
+        research_plan=ctx.state.get("research_plan", ""),
+        findings_heading="RESEARCH FINDINGS" if complete else "FINDINGS UPDATE",
+        findings=findings,
+        previous_evaluation=previous_evaluation,
+        date=datetime.datetime.now().strftime("%Y-%m-%d"),
+    )
+
+
+research_evaluator = LlmAgent(
+    model=routed_model("evaluation", config.critic_model),
+    name="research_evaluator",
+    description="Critically evaluates research and generates follow-up queries.",
+    include_contents="none",
+    instruction=research_evaluator_instruction,
     output_schema=Feedback,
     disallow_transfer_to_parent=True,
     disallow_transfer_to_peers=True,
     output_key="research_evaluation",
+    before_agent_callback=[
+        advance_refinement_iteration_callback,
+        start_refinement_metrics_callback,
+    ],
+    before_model_callback=route_model_callback,
+    after_model_callback=[record_model_usage_callback, record_route_metrics_callback],
+    after_agent_callback=[
+        filter_follow_up_queries_callback,
+        finish_refinement_metrics_callback,
+    ],
 )
 
 enhanced_search_executor = LlmAgent(
@@ -333,17 +1406,31 @@ enhanced_search_executor = LlmAgent(
     You are a specialist researcher executing a refinement pass.
     You have been activated because the previous research was graded as 'fail'.
 
-    1.  Review the 'research_evaluation' state key to understand the feedback and required fixes.
+    1.  Review the evaluation to understand the feedback and required fixes: {research_evaluation}
     2.  Execute EVERY query listed in 'follow_up_queries' using the 'google_search' tool.
-    3.  Synthesize the new findings and COMBINE them with the existing information in 'section_research_findings'.
-    4.  Your output MUST be the new, complete, and improved set of research findings.
+    3.  The existing findings are organized in these sections:
+    {findings_index}
+    4.  Output ONLY the sections that are new or that change because of the new findings. Do NOT repeat unchanged sections.
+        - To improve an existing section, start it with `## [sec-N] <title>` using its ID from the list above, followed by the complete, improved text of that section.
+        - To add a new section, start it with `## [new] <title>`.
 
     ### [URL-RESTRICTION ADDED] ###
     **HARD URL RESTRICTION (MANDATORY):** Before executing any follow-up query, ensure it is restricted by prefixing `site:google.github.io/adk-docs/`. If a follow-up query already has a different `site:` scope, replace it with `site:google.github.io/adk-docs/`. Never search outside this URL.
     """,
-    tools=[google_search],
-    output_key="section_research_findings",
-    after_agent_callback=collect_research_sources_callback,
+    tools=research_search_tools,
+    output_key="findings_delta",
+    before_agent_callback=start_refinement_metrics_callback,
+    before_model_callback=compaction_callback,
+    before_tool_callback=dedup_search_callback,
+    after_model_callback=[
+        record_model_usage_callback,
+        record_grounded_queries_callback,
+    ],
+    after_agent_callback=[
+        collect_research_sources_callback,
+        apply_findings_delta_callback,
+        finish_refinement_metrics_callback,
+    ],
 )
 
 report_composer = LlmAgent(
@@ -358,7 +1445,7 @@ report_composer = LlmAgent(
     ### INPUT DATA
     *   Research Plan: `{research_plan}`
     *   Research Findings: `{section_research_findings}`
-    *   Citation Sources: `{sources}`
+    *   Citation Sources: `{sources_digest}`
     *   Report Structure: `{report_sections}`
 
     ---
@@ -374,33 +1461,297 @@ report_composer = LlmAgent(
     Do not include a "References" or "Sources" section; all citations must be in-line.
     """,
     output_key="final_cited_report",
+    after_model_callback=stream_citations_callback,
     after_agent_callback=citation_replacement_callback,
 )
 
-research_pipeline = SequentialAgent(
-    name="research_pipeline",
-    description="Executes a pre-approved research plan. It performs iterative research, evaluation, and composes a final, cited report.",
-    sub_agents=[
-        section_planner,
-        section_researcher,
-        LoopAgent(
+SECTION_WRITER_INSTRUCTION = """
+    You are writing ONE section of a polished, professional, and meticulously cited research report.
+    Other sections are written by other writers, so cover only this section and do not add an introduction or conclusion for the whole report.
+
+    ---
+    ### INPUT DATA
+    *   Research Plan: `{research_plan}`
+    *   Section Heading: `{heading}`
+    *   Section Outline: `{outline}`
+    *   Relevant Research Findings: `{findings}`
+    *   Citation Sources: `{sources_digest}`
+
+    ---
+    ### CRITICAL: Citation System
+    To cite a source, you MUST insert a special citation tag directly after the claim it supports.
+
+    **The only correct format is:** `<cite source="src-ID_NUMBER" />`
+    Only cite IDs listed in the Citation Sources above.
+
+    ---
+    ### Final Instructions
+    Write the body of this section only. Do NOT repeat the section heading; it is added for you. You may use lower-level subheadings.
+    Do not include a "References" or "Sources" section; all citations must be in-line.
+    """
+
+
+class SectionedReportComposer(BaseAgent):
+    """Composes the report section by section, concurrently.
+
+    The `report_sections` outline is split on its top-level headings, and each
+    section gets its own copy of `section_writer` with only the findings and
+    sources routed to it (see `app.report.route_section`). Sources are numbered
+    locally per section, and the tags are mapped back to the global `src-N` ids
+    before stitching, so `final_cited_report` stays valid for
+    `citation_replacement_callback`. Finished sections are streamed as partial
+    events in outline order, with their citations already rendered as links.
+    """
+
+    section_writer: LlmAgent
+    max_concurrency: int = 4
+    findings_per_section: int = 4
+    sources_per_section: int = 12
+
+    def __init__(
+        self,
+        name: str,
+        section_writer: LlmAgent,
+        max_concurrency: int = 4,
+        findings_per_section: int = 4,
+        sources_per_section: int = 12,
+        **kwargs: Any,
+    ):
+        # BaseAgent's signature does not list the fields of subclasses.
+        super().__init__(  # type: ignore[call-arg]
+            name=name,
+            section_writer=section_writer,
+            max_concurrency=max_concurrency,
+            findings_per_section=findings_per_section,
+            sources_per_section=sources_per_section,
+            sub_agents=[section_writer],
+            **kwargs,
+        )
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        state = ctx.session.state
+        sources = state.get("sources", {})
+        records = state.get("findings_sections") or sections_from_text(
+            state.get("section_research_findings", "")
+        )
+        sections = split_outline(state.get("report_sections", ""))
+        routes = [
+            route_section(
+                section,
+                records,
+                sources,
+                self.findings_per_section,
+                self.sources_per_section,
+            )
+            for section in sections
+        ]
+        logging.info(
+            f"[{self.name}] Composing {len(sections)} sections with "
+            f"{[len(route.sources) for route in routes]} sources each."
+        )
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def write(index: int) -> str:
+            section, route = sections[index], routes[index]
+            digest, _ = render_source_digest(
+                route.sources,
+                max_chars=config.source_digest_max_chars,
+                claims_per_source=config.source_digest_claims_per_source,
+            )
+            instruction = SECTION_WRITER_INSTRUCTION.format(
+                research_plan=state.get("research_plan", ""),
+                heading=section.heading,
+                outline=section.outline,
+                findings=route.findings,
+                sources_digest=digest,
+            )
+            writer = self.section_writer.model_copy(
+                update={
+                    "name": _copy_name(self.section_writer.name, index, len(sections)),
+                    "instruction": lambda _ctx: instruction,
+                }
+            )
+            branch = f"{self.name}.{writer.name}"
+            branch_ctx = ctx.model_copy(
+                update={"branch": f"{ctx.branch}.{branch}" if ctx.branch else branch}
+            )
+            async with semaphore:
+                events = [event async for event in writer.run_async(branch_ctx)]
+            body = remap_citations(_final_text(events), route.local_to_global)
+            return f"{section.heading}\n\n{body}".strip()
+
+        tasks = [asyncio.create_task(write(index)) for index in range(len(sections))]
+        rewriter = CitationRewriter(sources)
+        written = []
+        try:
+            for task in tasks:
+                written.append(await task)
+                text = rewriter.rewrite(written[-1]) + "\n\n"
+                yield Event(
+                    author=self.name,
+                    partial=True,
+                    content=genai_types.Content(
+                        role="model", parts=[genai_types.Part(text=text)]
+                    ),
+                )
+        finally:
+            for task in tasks:
+                task.cancel()
+        yield Event(
+            author=self.name,
+            actions=EventActions(
+                state_delta={"final_cited_report": "\n\n".join(written)}
+            ),
+        )
+
+
+sectioned_report_composer = SectionedReportComposer(
+    name="sectioned_report_composer",
+    section_writer=LlmAgent(
+        model=config.critic_model,
+        name="report_section_writer",
+        include_contents="none",
+        description="Writes one cited section of the final report.",
+    ),
+    max_concurrency=config.report_max_concurrency,
+    findings_per_section=config.report_findings_per_section,
+    sources_per_section=config.report_sources_per_section,
+    after_agent_callback=citation_replacement_callback,
+)
+
+research_pipeline_stages = [
+    PipelineStage(
+        agent=section_planner, reads=["research_plan"], writes=["report_sections"]
+    ),
+    PipelineStage(
+        agent=parallel_section_researcher or section_researcher,
+        reads=["research_plan"],
+        writes=["section_research_findings", "sources", "findings_sections"],
+    ),
+    PipelineStage(
+        agent=LoopAgent(
             name="iterative_refinement_loop",
             max_iterations=config.max_search_iterations,
             sub_agents=[
                 research_evaluator,
-                EscalationChecker(name="escalation_checker"),
+                EscalationChecker(
+                    name="escalation_checker",
+                    stall_iterations=config.refinement_stall_iterations,
+                    query_similarity=config.refinement_query_similarity,
+                    max_seconds=config.refinement_max_seconds,
+                    max_tokens=config.refinement_max_tokens,
+                    max_iterations=config.max_search_iterations,
+                ),
                 enhanced_search_executor,
+                *(
+                    [
+                        SessionCompactor(
+                            name="session_compactor", policy=compaction_policy
+                        )
+                    ]
+                    if config.session_compaction
+                    else []
+                ),
             ],
         ),
-        report_composer,
+        reads=[
+            "research_plan",
+            "section_research_findings",
+            "findings_sections",
+            "sources",
+        ],
+        writes=["section_research_findings", "findings_sections", "sources"],
+    ),
+    PipelineStage(
+        agent=SourceDigestBuilder(name="source_digest_builder"),
+        reads=["sources"],
+        writes=["sources_digest"],
+    ),
+    PipelineStage(
+        agent=sectioned_report_composer if config.report_fanout else report_composer,
+        reads=[
+            "research_plan",
+            "report_sections",
+            "section_research_findings",
+            "findings_sections",
+            "sources_digest",
+            "sources",
+        ],
+        writes=["final_cited_report", "final_report_with_citations"],
+    ),
+]
+
+report_cache = (
+    ReportCache(
+        config.report_cache_path,
+        ttl_seconds=config.report_cache_ttl_seconds,
+        max_entries=config.report_cache_max_entries,
+        max_entry_bytes=config.report_cache_max_entry_bytes,
+        fingerprint={
+            "worker_model": config.worker_model,
+            "critic_model": config.critic_model,
+            "search_model": config.search_model,
+            "search_backend": config.search_backend,
+            "research_search_backend": str(config.research_search_backend),
+            "model_tiers": ",".join(config.model_tiers) if config.model_routing else "",
+            "source_digest_max_chars": str(config.source_digest_max_chars),
+            "source_digest_claims_per_source": str(
+                config.source_digest_claims_per_source
+            ),
+            "report_fanout": (
+                f"{config.report_findings_per_section},"
+                f"{config.report_sources_per_section}"
+                if config.report_fanout
+                else ""
+            ),
+            "corpus_version": config.report_cache_corpus_version,
+        },
+        replay=citation_replacement_callback,
+    )
+    if config.report_cache
+    else None
+)
+
+# Authors whose request contents compaction keeps: the stages that write the
+# findings, i.e. the researchers and the refinement loop.
+compaction_kept_authors = frozenset(
+    agent.name
+    for stage in research_pipeline_stages
+    if "section_research_findings" in stage.writes
+    for agent in iter_agents(stage.agent)
+)
+
+research_pipeline_description = "Executes a pre-approved research plan. It performs iterative research, evaluation, and composes a final, cited report."
+research_pipeline_callbacks: dict[str, Any] = {
+    "before_agent_callback": report_cache.before_agent if report_cache else None,
+    "after_agent_callback": [
+        *([report_cache.after_agent] if report_cache else []),
+        *([compact_session_callback] if config.session_compaction else []),
     ],
+}
+research_pipeline = (
+    DependencyPipelineAgent(
+        name="research_pipeline",
+        description=research_pipeline_description,
+        stages=research_pipeline_stages,
+        **research_pipeline_callbacks,
+    )
+    if config.research_pipeline_dag
+    else SequentialAgent(
+        name="research_pipeline",
+        description=research_pipeline_description,
+        sub_agents=[stage.agent for stage in research_pipeline_stages],
+        **research_pipeline_callbacks,
+    )
 )
 
 interactive_planner_agent = LlmAgent(
     name="interactive_planner_agent",
     model=config.worker_model,
-    description="The primary research assistant. It collaborates with the user to create a research plan, and then executes it upon approval.",
-    instruction=f"""
+    description="The primary research assistant. It collaborates with the user to create and refine a research plan.",
+    instruction=dated_instruction("""
     You are a research planning assistant. Your primary function is to convert ANY user request into a research plan.
 
     **CRITICAL RULE: Never answer a question directly or refuse a request.** Your one and only first step is to use the `plan_generator` tool to propose a research plan for the user's topic.
@@ -408,24 +1759,240 @@ interactive_planner_agent = LlmAgent(
 
     Your workflow is:
     1.  **Plan:** Use `plan_generator` to create a draft plan and present it to the user.
-    2.  **Wait for Response:** After presenting the plan, STOP and wait for the user's response. Do NOT transfer to any agent yet.
-    3.  **Evaluate Response:** 
+    2.  **Wait for Response:** After presenting the plan, STOP and wait for the user's response.
+    3.  **Evaluate Response:**
         - If the user provides feedback or requests changes, use `plan_generator` again to refine the plan.
-        - If the user explicitly approves (e.g., "sim", "ok", "execute", "run", "go", "aprovado"), then and ONLY then delegate to `research_pipeline`.
-    4.  **Execute:** Only transfer to `research_pipeline` AFTER receiving explicit approval. Never transfer automatically.
-
-    **IMPORTANT CONFIRMATION WORDS TO LOOK FOR:**
-    - Portuguese: "sim", "ok", "execute", "executar", "vai", "pode", "faça", "prossiga", "aprovo", "confirmado"
-    - English: "yes", "okay", "run", "go", "approved", "confirmed", "start", "proceed"
-    
-    **DO NOT TRANSFER unless you see one of these confirmation words in the user's response.**
+        - If the reply is unclear, present the current plan again and ask the user to approve it with a short reply (e.g., "sim", "ok", "go") or to say what should change.
+    4.  **Execution:** You never start the research. A plain approval is handled before it reaches you, and the approved plan then runs automatically.
 
-    Current date: {datetime.datetime.now().strftime("%Y-%m-%d")}
-    Do not perform any research yourself. Your job is to Plan, Wait, Evaluate, and only then Delegate.
-    """,
-    sub_agents=[research_pipeline],
+    Current date: {current_date}
+    Do not perform any research yourself. Your job is to Plan, Wait, and Refine.
+    """),
     tools=[AgentTool(plan_generator)],
+    before_model_callback=compaction_callback,
+    # Only the confirmation gate starts research_pipeline.
+    disallow_transfer_to_parent=True,
+    disallow_transfer_to_peers=True,
     output_key="research_plan",
 )
 
-root_agent = interactive_planner_agent
+
+class ConfirmationGateAgent(BaseAgent):
+    """Routes each user turn, starting approved plans without a model call.
+
+    When a research plan is pending and the user's reply is a plain approval
+    (see `app.confirmation.classify_reply`), the agent named `pipeline_name`
+    runs directly. Feedback, ambiguous replies and turns without a pending
+    plan are delegated to the first sub-agent, the planner model. The
+    pipeline is a sub-agent of the gate, not of the planner, so the gate is
+    the only way to start it. The decision is recorded under
+    `confirmation_decision`, and the plan that was started under
+    `executed_research_plan`, so the same plan is never run twice.
+
+    With a `scheduler`, an approved plan waits for a run slot first. Its
+    queue position is streamed as partial events, and a full queue turns the
+    approval down, leaving the plan pending. A cancel reply (see
+    `app.confirmation.is_cancel_request`) while runs of the session are
+    queued or running cancels them through the scheduler; a running one
+    stops after its current event. `on_run_end` is called with the
+    invocation ID whenever a pipeline run ends, including runs that raised
+    or were cancelled before their after callbacks.
+    """
+
+    CONFIRMATION_WORDS: ClassVar[list[str]] = APPROVAL_TERMS
+
+    pipeline_name: str = "research_pipeline"
+    scheduler: RunScheduler | None = None
+    run_priority: Callable[[str], float] | None = None
+    on_run_end: Callable[[str], None] | None = None
+
+    def __init__(self, name: str = "confirmation_gate", **kwargs: Any):
+        super().__init__(name=name, **kwargs)
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        state = ctx.session.state
+        reply = "".join(
+            part.text or ""
+            for part in (ctx.user_content.parts if ctx.user_content else None) or []
+        )
+        if self.scheduler is not None and is_cancel_request(reply):
+            cancelled = self.scheduler.cancel_session(
+                ctx.session.user_id, ctx.session.id
+            )
+            if cancelled:
+                logging.info(
+                    f"[{self.name}] Cancelling {cancelled} run(s) of the session."
+                )
+                yield self._notice(
+                    "Cancelling your research run.", confirmation_decision="cancelled"
+                )
+                return
+        plan: str = state.get("research_plan") or ""
+        pending = bool(plan) and plan != state.get("executed_research_plan")
+        decision = classify_reply(reply) if pending else "no_pending_plan"
+        pipeline = self.find_agent(self.pipeline_name)
+
+        if decision == "approval" and pipeline is not None and self.scheduler is None:
+            logging.info(f"[{self.name}] Plan approved. Starting {pipeline.name}.")
+            yield Event(
+                author=self.name,
+                actions=EventActions(
+                    state_delta={
+                        "confirmation_decision": decision,
+                        "executed_research_plan": plan,
+                    }
+                ),
+            )
+            try:
+                async for event in pipeline.run_async(ctx):
+                    yield event
+            finally:
+                self._end_run(ctx)
+            return
+        if (
+            decision == "approval"
+            and pipeline is not None
+            and self.scheduler is not None
+        ):
+            async for event in self._run_scheduled(ctx, pipeline, plan, self.scheduler):
+                yield event
+            return
+
+        if not self.sub_agents:
+            logging.warning(f"[{self.name}] No planner sub-agent to delegate to.")
+            return
+        planner = self.sub_agents[0]
+        logging.info(
+            f"[{self.name}] Reply is {decision}. Delegating to {planner.name}."
+        )
+        yield Event(
+            author=self.name,
+            actions=EventActions(state_delta={"confirmation_decision": decision}),
+        )
+        async for event in planner.run_async(ctx):
+            yield event
+
+    def _notice(self, text: str, **state_delta: Any) -> Event:
+        return Event(
+            author=self.name,
+            partial=not state_delta,
+            content=genai_types.Content(
+                role="model", parts=[genai_types.Part(text=text)]
+            ),
+            actions=EventActions(state_delta=state_delta),
+        )
+
+    async def _run_scheduled(
+        self,
+        ctx: InvocationContext,
+        pipeline: BaseAgent,
+        plan: str,
+        scheduler: RunScheduler,
+    ) -> AsyncGenerator[Event, None]:
+        """Runs the approved plan once the scheduler admits it."""
+        # The priority may look up the report cache; keep SQLite off the loop.
+        priority = (
+            await asyncio.to_thread(self.run_priority, plan)
+            if self.run_priority
+            else 0.0
+        )
+        try:
+            ticket = scheduler.submit(ctx.session.user_id, ctx.session.id, priority)
+        except QueueFullError as error:
+            logging.warning(f"[{self.name}] Run rejected: {error}")
+            yield self._notice(
+                "The server is busy with other research runs. Please approve the "
+                "plan again in a few minutes.",
+                confirmation_decision="rejected",
+                run_queue={"status": "rejected"},
+            )
+            return
+        try:
+            async for position in scheduler.wait(ticket):
+                yield self._notice(
+                    f"Your research run is queued at position {position}; it starts "
+                    "as soon as a slot is free."
+                )
+            if ticket.cancelled:
+                yield self._notice(
+                    "The research run was cancelled.",
+                    confirmation_decision="cancelled",
+                    run_queue={
+                        "status": "cancelled",
+                        "waited_s": round(ticket.waited_s, 3),
+                    },
+                )
+                return
+            logging.info(
+                f"[{self.name}] Plan approved. Starting {pipeline.name} after "
+                f"{ticket.waited_s:.1f} s in queue."
+            )
+            yield Event(
+                author=self.name,
+                actions=EventActions(
+                    state_delta={
+                        "confirmation_decision": "approval",
+                        "executed_research_plan": plan,
+                        "run_queue": {
+                            "status": "running",
+                            "waited_s": round(ticket.waited_s, 3),
+                        },
+                    }
+                ),
+            )
+            async with contextlib.aclosing(pipeline.run_async(ctx)) as events:
+                async for event in events:
+                    yield event
+                    # Cancelled by another turn while this one was streaming.
+                    if ticket.status == "cancelled":
+                        logging.info(
+                            f"[{self.name}] Run cancelled; stopping {pipeline.name}."
+                        )
+                        yield self._notice(
+                            "The research run was cancelled.",
+                            run_queue={"status": "cancelled"},
+                        )
+                        return
+        finally:
+            scheduler.release(ticket)
+            self._end_run(ctx)
+
+    def _end_run(self, ctx: InvocationContext) -> None:
+        if self.on_run_end is not None:
+            self.on_run_end(ctx.invocation_id)
+
+
+def run_priority(plan: str) -> float:
+    """Orders queued runs: plans with a cached report first, then short plans."""
+    if report_cache is not None and report_cache.enabled and report_cache.get(plan):
+        return 0.0
+    return float(len(parse_research_plan(plan)) or 1)
+
+
+root_agent = ConfirmationGateAgent(
+    sub_agents=[interactive_planner_agent, research_pipeline],
+    before_agent_callback=ensure_environment_callback,
+    scheduler=(
+        RunScheduler(
+            max_concurrent=config.scheduler_max_concurrent_runs,
+            max_per_user=config.scheduler_max_runs_per_user,
+            max_per_session=config.scheduler_max_runs_per_session,
+            max_queued=config.scheduler_max_queued_runs,
+            aging_seconds=config.scheduler_aging_seconds,
+        )
+        if config.run_scheduler
+        else None
+    ),
+    run_priority=run_priority,
+    on_run_end=report_cache.discard if report_cache else None,
+)
+
+if resilient_caller is not None:
+    apply_resilience(root_agent, resilient_caller, call_policy)
+
+if config.trace_exporters:
+    Tracer(build_exporters(list(config.trace_exporters), config.trace_path)).instrument(
+        root_agent
+    )
@@ -0,0 +1,510 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Caches that answer an agent from stored results through its callbacks.
+
+A cache exposes a `before_agent` and an `after_agent` callback. On a hit,
+`before_agent` returns the stored answer as content, which skips the agent.
+Behind an `AgentTool`, that content becomes the tool result. On a miss,
+`after_agent` stores what the agent produced.
+
+`PlanCache` serves `plan_generator`. Users ask about the same ADK topics again
+and again, so first plans are keyed on the normalized topic. A topic without
+an exact entry falls back to the most similar stored topic by trigram cosine.
+
+`ReportCache` serves `research_pipeline`. The planner often produces the same
+standard bullets, and an approved plan that was already executed with the
+same models and corpus gets its stored report back.
+
+Usage:
+    python -m app.agent_cache count|clear plans|reports
+"""
+
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from google.adk.agents.callback_context import CallbackContext
+from google.genai import types as genai_types
+
+from .confirmation import fold_text
+from .corpus_index import tokenize, trigram_embedding
+from .plan import normalize_plan
+from .search import SqliteCache
+from .sources import SOURCES_CURSOR_KEY
+
+
+def normalize_topic(text: str) -> str:
+    """Returns the canonical form of a request, used as cache key.
+
+    Accents, case, stop words, word order and repeated words are ignored, so
+    "Research the ADK callbacks" and "ADK callbacks: research" share a key.
+    """
+    return " ".join(sorted(set(tokenize(fold_text(text)))))
+
+
+def _request_text(callback_context: CallbackContext) -> str:
+    content = callback_context.user_content
+    if not (content and content.parts):
+        return ""
+    return " ".join(
+        part.text for part in content.parts if part.text and not part.thought
+    )
+
+
+def _final_text(callback_context: CallbackContext) -> str:
+    """Returns the last answer of the current agent in this invocation."""
+    ctx = callback_context._invocation_context
+    for event in reversed(ctx.session.events):
+        if event.invocation_id != ctx.invocation_id or event.author != ctx.agent.name:
+            continue
+        if event.is_final_response() and event.content and event.content.parts:
+            return "".join(
+                part.text
+                for part in event.content.parts
+                if part.text and not part.thought
+            )
+    return ""
+
+
+def _model_name(callback_context: CallbackContext) -> str:
+    model = getattr(callback_context._invocation_context.agent, "model", None)
+    if isinstance(model, str):
+        return model
+    return model.model if model is not None else ""
+
+
+class AgentCache:
+    """Storage, counters and the on/off switch shared by agent caches.
+
+    `app.replay.substitute_backends` switches `enabled` off, so stubbed runs
+    neither read nor write the cache.
+
+    Args:
+        name (str): State key of the lookup outcomes, and store namespace.
+        path (str | Path): SQLite file; opened on first use.
+        ttl_seconds (float): Lifetime of an entry.
+        max_entries (int): LRU capacity.
+        max_entry_bytes (int): Larger entries are not stored.
+        clock (Callable[[], float]): Time source for the saved latency.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path: str | Path,
+        ttl_seconds: float,
+        max_entries: int,
+        max_entry_bytes: int,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.name = name
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+        self._clock = clock
+        self._pending: dict[str, tuple[Any, ...]] = {}
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.saved_seconds = 0.0
+
+    def stats(self) -> dict[str, Any]:
+        """Returns the counters of this process, with the hit rate."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "saved_s_total": round(self.saved_seconds, 3),
+        }
+
+    @functools.cached_property
+    def store(self) -> SqliteCache:
+        return SqliteCache(
+            self.path,
+            namespace=self.name,
+            ttl_seconds=self.ttl_seconds,
+            max_entries=self.max_entries,
+            max_entry_bytes=self.max_entry_bytes,
+        )
+
+    def discard(self, invocation_id: str) -> None:
+        """Forgets the pending lookup of an invocation that ended early.
+
+        The after callback never runs when the agent raises or is cancelled;
+        callers run this once the agent is done, however it ended.
+        """
+        self._pending.pop(invocation_id, None)
+
+    def _record(
+        self, callback_context: CallbackContext, result: str, **details: Any
+    ) -> None:
+        """Writes the outcome of a lookup and the totals to the session state."""
+        callback_context.state[self.name] = {
+            "result": result,
+            **details,
+            **self.stats(),
+        }
+
+
+class PlanCache(AgentCache):
+    """Serves first research plans of known topics without a model call.
+
+    Entries are keyed on the model name and the normalized topic, and hold the
+    plan with the seconds it took to generate, reported as saved on a hit.
+    Refinements, i.e. turns with a plan still awaiting approval, always reach
+    the model. The embeddings of the stored topics are indexed in memory, so a
+    miss compares against them without reading every key from SQLite.
+
+    Args:
+        path (str | Path): SQLite file; opened on first use.
+        ttl_seconds (float): Lifetime of a stored plan.
+        max_entries (int): LRU capacity.
+        min_similarity (float): Trigram cosine from which the most similar
+            stored topic is served; 1.0 only serves exact topic matches.
+        embed_fn (Callable[[str], list[float]]): L2-normalized text embedding.
+        clock (Callable[[], float]): Time source for the generation latency.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        ttl_seconds: float,
+        max_entries: int,
+        min_similarity: float,
+        embed_fn: Callable[[str], list[float]] = trigram_embedding,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        super().__init__(
+            "plan_cache",
+            path,
+            ttl_seconds=ttl_seconds,
+            max_entries=max_entries,
+            max_entry_bytes=64 * 1024,
+            clock=clock,
+        )
+        self.min_similarity = min_similarity
+        self._embed_fn = embed_fn
+        # Embeddings of the stored topics by key, loaded from the store once
+        # and kept in step with `put` and `invalidate`.
+        self._index: dict[str, list[float]] | None = None
+        self._index_lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, request: str) -> str:
+        return f"{model}|{normalize_topic(request)}"
+
+    def _indexed(self) -> list[tuple[str, list[float]]]:
+        """Returns the indexed keys and embeddings, loading them when stale."""
+        with self._index_lock:
+            # Entries expire and are evicted in the store behind the index's
+            # back, so it is reloaded once it outgrows the store's capacity.
+            if self._index is None or len(self._index) > self.max_entries:
+                self._index = {
+                    key: self._embed_fn(key.partition("|")[2])
+                    for key in self.store.keys()
+                }
+            return list(self._index.items())
+
+    def lookup(self, model: str, request: str) -> tuple[dict[str, Any], float] | None:
+        """Finds the stored plan for a request.
+
+        Args:
+            model (str): The model the plan must come from.
+            request (str): The user's request.
+
+        Returns:
+            tuple[dict[str, Any], float] | None: The entry and the similarity
+                of its topic (1.0 for an exact match), or None.
+        """
+        key = self.key(model, request)
+        if (value := self.store.get(key)) is not None:
+            return json.loads(value), 1.0
+        topic = key.partition("|")[2]
+        if not topic or self.min_similarity >= 1.0:
+            return None
+        query = self._embed_fn(topic)
+        best_key, best = None, self.min_similarity
+        for candidate, embedding in self._indexed():
+            if not candidate.startswith(f"{model}|"):
+                continue
+            similarity = sum(a * b for a, b in zip(query, embedding, strict=True))
+            if similarity >= best:
+                best_key, best = candidate, similarity
+        if best_key is None:
+            return None
+        if (value := self.store.get(best_key)) is None:
+            self._unindex(best_key)
+            return None
+        return json.loads(value), best
+
+    def _unindex(self, key: str | None = None) -> None:
+        with self._index_lock:
+            if key is None:
+                self._index = None
+            elif self._index is not None:
+                self._index.pop(key, None)
+
+    def put(self, model: str, request: str, plan: str, latency_s: float) -> bool:
+        """Stores a generated plan; returns False when it was not stored."""
+        if not plan.strip() or not normalize_topic(request):
+            return False
+        entry = {"request": request, "plan": plan, "latency_s": round(latency_s, 3)}
+        key = self.key(model, request)
+        if not self.store.put(key, json.dumps(entry)):
+            return False
+        with self._index_lock:
+            if self._index is not None:
+                self._index[key] = self._embed_fn(key.partition("|")[2])
+        return True
+
+    def invalidate(self, model: str | None = None, request: str | None = None) -> None:
+        """Removes the plan of one request, or every plan when omitted."""
+        if request is None:
+            self.store.clear()
+            self._unindex()
+        else:
+            key = self.key(model or "", request)
+            self.store.delete(key)
+            self._unindex(key)
+
+    # --- Callbacks of plan_generator ---
+    # SQLite and the similarity scan block, so they run off the event loop.
+
+    async def before_agent(
+        self, callback_context: CallbackContext
+    ) -> genai_types.Content | None:
+        if not self.enabled:
+            return None
+        state = callback_context.state
+        plan = state.get("research_plan")
+        if plan and plan != state.get("executed_research_plan"):
+            self.bypassed += 1
+            self._record(callback_context, "bypassed")
+            return None
+        request, model = _request_text(callback_context), _model_name(callback_context)
+        if (found := await asyncio.to_thread(self.lookup, model, request)) is None:
+            self.misses += 1
+            self._pending[callback_context.invocation_id] = (request, self._clock())
+            self._record(callback_context, "miss")
+            return None
+        entry, similarity = found
+        self.hits += 1
+        self.saved_seconds += entry["latency_s"]
+        self._record(
+            callback_context,
+            "hit",
+            similarity=round(similarity, 3),
+            cached_request=entry["request"],
+            saved_s=entry["latency_s"],
+        )
+        logging.info(
+            f"[{callback_context.agent_name}] Plan served from cache "
+            f"(similarity {similarity:.2f}, {entry['latency_s']:.1f} s saved)."
+        )
+        return genai_types.Content(
+            role="model", parts=[genai_types.Part(text=entry["plan"])]
+        )
+
+    async def after_agent(self, callback_context: CallbackContext) -> None:
+        pending = self._pending.pop(callback_context.invocation_id, None)
+        if pending is None or not self.enabled:
+            return None
+        request, started = pending
+        await asyncio.to_thread(
+            self.put,
+            _model_name(callback_context),
+            request,
+            _final_text(callback_context),
+            self._clock() - started,
+        )
+        return None
+
+
+REPORT_KEYS = ("final_cited_report", "sources", "final_report_with_citations")
+
+
+class ReportCache(AgentCache):
+    """Serves complete cited reports of plans that were already executed.
+
+    Entries are content-addressed: the key hashes the normalized plan (see
+    `app.plan.normalize_plan`) with a fingerprint of everything else the
+    report depends on, such as the model IDs and a corpus version tag. A hit
+    restores `final_cited_report` and `sources`, skips the pipeline and
+    renders the report again through `replay`.
+
+    Args:
+        path (str | Path): SQLite file; opened on first use.
+        ttl_seconds (float): Lifetime of a stored report.
+        max_entries (int): LRU capacity.
+        max_entry_bytes (int): Reports larger than this are not stored.
+        fingerprint (dict[str, str]): What besides the plan the report
+            depends on; a change of any value misses every stored report.
+        replay (Callable[[CallbackContext], genai_types.Content]): Renders the
+            restored report, e.g. `citation_replacement_callback`.
+        clock (Callable[[], float]): Time source for the pipeline latency.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        ttl_seconds: float,
+        max_entries: int,
+        max_entry_bytes: int,
+        fingerprint: dict[str, str],
+        replay: Callable[[CallbackContext], genai_types.Content],
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        super().__init__(
+            "report_cache",
+            path,
+            ttl_seconds=ttl_seconds,
+            max_entries=max_entries,
+            max_entry_bytes=max_entry_bytes,
+            clock=clock,
+        )
+        self.fingerprint = dict(fingerprint)
+        self.replay = replay
+
+    def key(self, plan: str) -> str:
+        payload = json.dumps(
+            {"plan": normalize_plan(plan), **self.fingerprint}, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, plan: str) -> dict[str, Any] | None:
+        """Returns the stored report values of a plan, with `latency_s`."""
+        return self._get(self.key(plan))
+
+    def _get(self, key: str) -> dict[str, Any] | None:
+        value = self.store.get(key)
+        return json.loads(value) if value is not None else None
+
+    def put(self, plan: str, values: dict[str, Any], latency_s: float) -> bool:
+        """Stores the `REPORT_KEYS` values of a plan's report.
+
+        Returns:
+            bool: False when the report is incomplete or too large.
+        """
+        return self._put(self.key(plan), values, latency_s)
+
+    def _put(self, key: str, values: dict[str, Any], latency_s: float) -> bool:
+        if not all(values.get(name) for name in REPORT_KEYS):
+            return False
+        entry = {
+            **{name: values[name] for name in REPORT_KEYS},
+            "latency_s": round(latency_s, 3),
+        }
+        return self.store.put(key, json.dumps(entry))
+
+    def invalidate(self, plan: str | None = None) -> None:
+        """Removes the report of one plan, or every report when omitted."""
+        if plan is None:
+            self.store.clear()
+        else:
+            self.store.delete(self.key(plan))
+
+    # --- Callbacks of research_pipeline ---
+    # SQLite and the JSON coding of whole reports block, so they run off the
+    # event loop.
+
+    async def before_agent(
+        self, callback_context: CallbackContext
+    ) -> genai_types.Content | None:
+        if not self.enabled:
+            return None
+        state = callback_context.state
+        if not (plan := state.get("research_plan")):
+            self.bypassed += 1
+            self._record(callback_context, "bypassed")
+            return None
+        key = self.key(plan)
+        if (entry := await asyncio.to_thread(self._get, key)) is None:
+            self.misses += 1
+            self._pending[callback_context.invocation_id] = (
+                key,
+                self._clock(),
+                state.get("final_cited_report"),
+            )
+            self._record(callback_context, "miss")
+            return None
+        self.hits += 1
+        self.saved_seconds += entry["latency_s"]
+        state["final_cited_report"] = entry["final_cited_report"]
+        state["sources"] = entry["sources"]
+        state["url_to_short_id"] = {
+            source["url"]: short_id for short_id, source in entry["sources"].items()
+        }
+        # The restored registry replaces whatever earlier events contributed.
+        state[SOURCES_CURSOR_KEY] = len(
+            callback_context._invocation_context.session.events
+        )
+        self._record(callback_context, "hit", saved_s=entry["latency_s"])
+        logging.info(
+            f"[{callback_context.agent_name}] Report served from cache "
+            f"({entry['latency_s']:.1f} s saved)."
+        )
+        return self.replay(callback_context)
+
+    async def after_agent(self, callback_context: CallbackContext) -> None:
+        pending = self._pending.pop(callback_context.invocation_id, None)
+        if pending is None or not self.enabled:
+            return None
+        key, started, previous_report = pending
+        state = callback_context.state
+        if state.get("final_cited_report") == previous_report:
+            # The pipeline stopped before composing a new report.
+            return None
+        if not await asyncio.to_thread(
+            self._put,
+            key,
+            {name: state.get(name) for name in REPORT_KEYS},
+            self._clock() - started,
+        ):
+            logging.info(f"[{callback_context.agent_name}] Report not cached.")
+        return None
+
+
+if __name__ == "__main__":
+    from .config import config
+
+    parser = argparse.ArgumentParser(
+        description="Inspect or invalidate the agent caches."
+    )
+    parser.add_argument("command", choices=["count", "clear"])
+    parser.add_argument("cache", choices=["plans", "reports"])
+    args = parser.parse_args()
+    path, namespace = {
+        "plans": (config.plan_cache_path, "plan_cache"),
+        "reports": (config.report_cache_path, "report_cache"),
+    }[args.cache]
+    # Limits only matter when writing.
+    store = SqliteCache(
+        path, namespace, ttl_seconds=0, max_entries=0, max_entry_bytes=0
+    )
+    if args.command == "clear":
+        store.clear()
+    print(f"{len(store)} {args.cache} cached in {path}")
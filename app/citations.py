@@ -0,0 +1,135 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+r"""Rewrites `<cite source="src-N"/>` tags into Markdown links.
+
+`CitationRewriter` compiles its patterns once and builds each source's link
+only once. Tags are replaced through a `split` of the report, so there is no
+Python callback per tag. Whitespace before punctuation is then removed in one
+regex substitution over the result; fusing both steps into a single pattern
+was measured slower, because a pattern that starts with `\s*` defeats the
+regex engine's prefix search. `feed` accepts a report in streamed
+chunks. It holds back only a trailing run of whitespace and complete tags,
+plus a partial `<cite` tag, until the next chunk shows how they end. The
+output always equals rewriting the whole report at once.
+"""
+
+import logging
+import re
+from typing import Any
+
+CITE_TAG = re.compile(r"""<cite\s+source\s*=\s*["']?\s*(src-\d+)\s*["']?\s*/>""")
+# Matched against the reversed text: a pattern that starts with the
+# punctuation class lets the regex engine skip ahead between punctuation marks
+# instead of trying every whitespace character, about twice as fast as
+# `\s+([.,;:])` on prose.
+_PUNCTUATION_AFTER_SPACE = re.compile(r"([.,;:])\s+")
+# A `<cite` tag whose closing `/>` has not been streamed yet.
+_PARTIAL_TAG = re.compile(r"<(?:c(?:i(?:t(?:e(?:\s[^<>]*)?)?)?)?)?")
+
+
+def pending_suffix_start(text: str) -> int:
+    """Returns where the part of `text` that may still change begins.
+
+    That part is a trailing run of whitespace and complete citation tags,
+    optionally ending in a partial tag. Whether its whitespace is kept, and
+    what it turns into, depends on the text that follows it.
+
+    Args:
+        text (str): The report streamed so far.
+
+    Returns:
+        int: The index of the held-back suffix; `len(text)` when there is none.
+    """
+    end = len(text)
+    opening = text.rfind("<")
+    if opening != -1 and _PARTIAL_TAG.fullmatch(text, opening):
+        end = opening
+    while True:
+        while end and text[end - 1].isspace():
+            end -= 1
+        if not text.endswith("/>", 0, end):
+            return end
+        opening = text.rfind("<cite", 0, end)
+        if opening == -1 or not CITE_TAG.fullmatch(text, opening, end):
+            return end
+        end = opening
+
+
+class CitationRewriter:
+    """Converts citation tags into Markdown links for a fixed source registry.
+
+    Args:
+        sources (dict[str, Any]): The `sources` registry, keyed by `src-N`.
+    """
+
+    def __init__(self, sources: dict[str, Any]):
+        self.sources = sources
+        self._links: dict[str, str] = {}
+        self._pending = ""
+
+    def _link(self, short_id: str) -> str:
+        if (link := self._links.get(short_id)) is None:
+            if source_info := self.sources.get(short_id):
+                display_text = source_info.get(
+                    "title", source_info.get("domain", short_id)
+                )
+                link = f" [{display_text}]({source_info['url']})"
+            else:
+                link = ""
+            self._links[short_id] = link
+        if not link:
+            logging.warning(
+                f'Invalid citation tag found and removed: <cite source="{short_id}"/>'
+            )
+        return link
+
+    def _rewrite(self, text: str) -> str:
+        if "<cite" in text:
+            parts = CITE_TAG.split(text)
+            parts[1::2] = [self._link(short_id) for short_id in parts[1::2]]
+            text = "".join(parts)
+        return _PUNCTUATION_AFTER_SPACE.sub(r"\1", text[::-1])[::-1]
+
+    def rewrite(self, report: str) -> str:
+        """Rewrites a complete report.
+
+        Args:
+            report (str): Text with `<cite source="src-N"/>` tags.
+
+        Returns:
+            str: The text with Markdown links, invalid tags removed and no
+            whitespace before `.,;:`.
+        """
+        return self._rewrite(report)
+
+    def feed(self, chunk: str) -> str:
+        """Rewrites the next streamed chunk of a report.
+
+        Args:
+            chunk (str): The text that follows everything fed so far.
+
+        Returns:
+            str: The rewritten text that is final; may be empty while a tag
+            or a whitespace run is still open.
+        """
+        text = self._pending + chunk
+        split = pending_suffix_start(text)
+        self._pending = text[split:]
+        return self._rewrite(text[:split])
+
+    def flush(self) -> str:
+        """Rewrites and returns whatever `feed` still holds back."""
+        text, self._pending = self._pending, ""
+        return self._rewrite(text)
@@ -0,0 +1,259 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compaction of long sessions: their stored events and model requests.
+
+ADK sends an agent every earlier event of its branch as request contents:
+thoughts, the grounding metadata copied into `SearchTool` results, and the
+replies of agents from earlier rounds. The session keeps all of them, so both
+the stored session and every request grow with each round.
+
+`compact_session_events` compacts the stored events in place, resuming from
+a cursor, so every event is visited about once. An event is only compacted
+after source collection has registered its grounding: its thoughts and
+grounding are stripped, state delta values a later event overwrote are
+dropped (the session state already holds the latest), and once older than
+the latest `max_events` events, the replies of agents that hold no findings
+lose their content. ADK then
+renders compacted events for other agents, so no rendered text has to be
+recognized. `compact_contents` strips the same parts from the request's own
+copy of events that were not compacted yet.
+
+The in-memory session service keeps the very event objects of the running
+session, so its stored sessions shrink too. Services that serialize events
+when they are appended keep the full copies; there only the requests and
+the live session shrink.
+"""
+
+from collections.abc import Callable, Mapping, Sequence
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from google.adk.events import Event
+from google.genai import types as genai_types
+
+from .findings import current_sections
+from .search import SEARCH_TOOL_NAME
+
+# State key of the compaction progress over the session events: the index of
+# the first event not yet stripped, of the first not yet checked against the
+# `max_events` cap, and of the last stripped event writing each state key.
+COMPACTION_CURSOR_KEY = "compaction_event_cursor"
+
+
+@dataclass(frozen=True)
+class CompactionPolicy:
+    """What compaction removes.
+
+    Attributes:
+        strip_thoughts (bool): Remove thought parts from the stored events
+            and request contents.
+        strip_grounding (bool): Remove the grounding metadata of the stored
+            events, and its copy inside `SearchTool` function responses, once
+            the sources are collected.
+        drop_superseded (bool): Remove superseded versions of
+            `findings_sections` from the session state.
+        max_events (int): Stored events older than the latest `max_events`
+            lose their content, so they are no longer sent. User messages,
+            function calls and responses, and events of kept authors are
+            never dropped. Zero disables the cap.
+    """
+
+    strip_thoughts: bool = True
+    strip_grounding: bool = True
+    drop_superseded: bool = True
+    max_events: int = 200
+
+
+@dataclass
+class CompactionStats:
+    """Counts of what compaction removed."""
+
+    thought_parts: int = 0
+    grounding: int = 0
+    state_values: int = 0
+    events_dropped: int = 0
+    events_kept: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+    def add(self, other: "CompactionStats") -> None:
+        """Adds the removals of `other`."""
+        self.thought_parts += other.thought_parts
+        self.grounding += other.grounding
+        self.state_values += other.state_values
+        self.events_dropped += other.events_dropped
+
+
+def _trimmed_response(response: genai_types.FunctionResponse) -> dict | None:
+    """A search result without its grounding, or None if there is none."""
+    if (
+        response.name == SEARCH_TOOL_NAME
+        and isinstance(response.response, dict)
+        and "grounding_metadata" in response.response
+    ):
+        return {k: v for k, v in response.response.items() if k != "grounding_metadata"}
+    return None
+
+
+def _compact_part(
+    part: genai_types.Part, policy: CompactionPolicy, stats: CompactionStats
+) -> genai_types.Part | None:
+    """The part to keep instead of `part`, or None to drop it."""
+    if policy.strip_thoughts and part.thought:
+        stats.thought_parts += 1
+        return None
+    response = part.function_response
+    if policy.strip_grounding and response is not None:
+        trimmed = _trimmed_response(response)
+        if trimmed is not None:
+            stats.grounding += 1
+            return part.model_copy(
+                update={
+                    "function_response": response.model_copy(
+                        update={"response": trimmed}
+                    )
+                }
+            )
+    return part
+
+
+def _compact_parts(
+    parts: list[genai_types.Part], policy: CompactionPolicy, stats: CompactionStats
+) -> list[genai_types.Part]:
+    return [
+        compacted
+        for part in parts
+        if (compacted := _compact_part(part, policy, stats)) is not None
+    ]
+
+
+def compact_event(event: Event, policy: CompactionPolicy) -> CompactionStats:
+    """Strips thoughts and grounding from a stored event, in place.
+
+    Only call this once the event's sources are collected. An event left
+    without parts loses its content, so ADK no longer sends it.
+    """
+    stats = CompactionStats()
+    if policy.strip_grounding and event.grounding_metadata is not None:
+        event.grounding_metadata = None
+        stats.grounding += 1
+    if event.content and event.content.parts:
+        removed = stats.grounding
+        parts = _compact_parts(event.content.parts, policy, stats)
+        if not parts:
+            event.content = None
+        elif stats.thought_parts or stats.grounding > removed:
+            event.content.parts = parts
+    return stats
+
+
+def _droppable(event: Event, keep_author: Callable[[str], bool]) -> bool:
+    if event.content is None or event.author == "user" or keep_author(event.author):
+        return False
+    return not (event.get_function_calls() or event.get_function_responses())
+
+
+def compact_session_events(
+    events: Sequence[Event],
+    policy: CompactionPolicy,
+    keep_author: Callable[[str], bool],
+    cursor: Mapping[str, Any],
+    collected: int,
+) -> tuple[dict[str, Any], CompactionStats]:
+    """Compacts the stored session events in place, resuming from `cursor`.
+
+    Events from the previous cursor up to `collected`, the source collection
+    cursor, are stripped with `compact_event`, and the state delta values of
+    earlier stripped events that they overwrite are dropped. Stripped events
+    older than the latest `policy.max_events` lose their content, unless they
+    are user messages, function calls or responses, or come from a kept
+    author.
+
+    Args:
+        events (Sequence[Event]): The session events.
+        policy (CompactionPolicy): What to remove.
+        keep_author (Callable[[str], bool]): Whether the events of an author
+            must stay, such as the researchers holding the findings.
+        cursor (Mapping[str, Any]): The `COMPACTION_CURSOR_KEY` state value,
+            or an empty mapping on the first call.
+        collected (int): Index of the first event whose sources are not
+            collected yet.
+
+    Returns:
+        tuple[dict[str, Any], CompactionStats]: The new cursor, and what was
+            removed.
+    """
+    stripped, checked = cursor.get("stripped", 0), cursor.get("checked", 0)
+    writers: dict[str, int] = dict(cursor.get("writers") or {})
+    if stripped > len(events) or checked > len(events):
+        # Events were removed since the last pass.
+        stripped = checked = 0
+        writers = {}
+    stats = CompactionStats()
+    end = max(stripped, min(collected, len(events)))
+    for index in range(stripped, end):
+        event = events[index]
+        stats.add(compact_event(event, policy))
+        for key in event.actions.state_delta:
+            if (writer := writers.get(key)) is not None:
+                events[writer].actions.state_delta.pop(key, None)
+                stats.state_values += 1
+            writers[key] = index
+    if policy.max_events:
+        cap = min(end, len(events) - policy.max_events)
+        for event in events[checked:cap]:
+            if _droppable(event, keep_author):
+                event.content = None
+                stats.events_dropped += 1
+        checked = max(checked, cap)
+    return {"stripped": end, "checked": checked, "writers": writers}, stats
+
+
+def compact_contents(
+    contents: Sequence[genai_types.Content], policy: CompactionPolicy
+) -> tuple[list[genai_types.Content], CompactionStats]:
+    """Strips thoughts and grounding from the contents of one model request.
+
+    The given contents are not modified; changed ones are copied. Contents
+    rendered for other agents from events that `compact_session_events` has
+    not reached yet are sent as they are.
+
+    Args:
+        contents (Sequence[genai_types.Content]): `llm_request.contents`.
+        policy (CompactionPolicy): What to remove.
+
+    Returns:
+        tuple[list[genai_types.Content], CompactionStats]: The contents to
+            send, and what was removed.
+    """
+    stats = CompactionStats()
+    compacted: list[genai_types.Content] = []
+    for content in contents:
+        parts = content.parts or []
+        removed = stats.thought_parts + stats.grounding
+        kept = _compact_parts(parts, policy, stats)
+        if not kept:
+            continue
+        if stats.thought_parts + stats.grounding > removed:
+            content = content.model_copy(update={"parts": kept})
+        compacted.append(content)
+    stats.events_kept = len(compacted)
+    return compacted, stats
+
+
+def current_findings_records(records: Sequence[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Drops superseded versions from the `findings_sections` records."""
+    return list(current_sections(list(records)).values())
@@ -12,11 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import os
 from dataclasses import dataclass
 from pathlib import Path
 
-import google.auth
 from dotenv import load_dotenv
 
 # To use AI Studio credentials:
@@ -24,40 +24,282 @@ from dotenv import load_dotenv
 #    GOOGLE_GENAI_USE_VERTEXAI=FALSE
 #    GOOGLE_API_KEY=PASTE_YOUR_ACTUAL_API_KEY_HERE
 # 2. This will override the default Vertex AI configuration
-
-# Load .env file if it exists
 env_path = Path(__file__).parent / '.env'
-if env_path.exists():
-    load_dotenv(env_path)
-    print(f"Loaded .env from {env_path}")
 
-# Only attempt to get default credentials if using Vertex AI
-if os.getenv("GOOGLE_GENAI_USE_VERTEXAI", "True").upper() == "TRUE":
-    try:
-        _, project_id = google.auth.default()
-        os.environ.setdefault("GOOGLE_CLOUD_PROJECT", project_id)
-        os.environ.setdefault("GOOGLE_CLOUD_LOCATION", "global")
-    except Exception as e:
-        print(f"Warning: Could not get default credentials: {e}")
-        print("Make sure to set GOOGLE_GENAI_USE_VERTEXAI=FALSE for AI Studio")
 
-# Set default to use Vertex AI if not specified
-os.environ.setdefault("GOOGLE_GENAI_USE_VERTEXAI", "True")
+@functools.cache
+def ensure_environment() -> str | None:
+    """Loads `.env` and resolves Google Cloud credentials, once per process.
+
+    Importing this module has no side effects. The root agent calls this
+    before its first model call, so `google.auth.default()`, which may block
+    on a metadata-server lookup, never runs at import time or at worker fork.
+
+    Returns:
+        str | None: The Google Cloud project, or None when it is not resolved.
+    """
+    # Load .env file if it exists
+    if env_path.exists():
+        load_dotenv(env_path)
+        print(f"Loaded .env from {env_path}")
+
+    # Only attempt to get default credentials if using Vertex AI
+    if os.getenv("GOOGLE_GENAI_USE_VERTEXAI", "True").upper() == "TRUE":
+        import google.auth
+
+        try:
+            _, project_id = google.auth.default()
+            os.environ.setdefault("GOOGLE_CLOUD_PROJECT", project_id)
+            os.environ.setdefault("GOOGLE_CLOUD_LOCATION", "global")
+        except Exception as e:
+            print(f"Warning: Could not get default credentials: {e}")
+            print("Make sure to set GOOGLE_GENAI_USE_VERTEXAI=FALSE for AI Studio")
+
+    # Set default to use Vertex AI if not specified
+    os.environ.setdefault("GOOGLE_GENAI_USE_VERTEXAI", "True")
+    return os.getenv("GOOGLE_CLOUD_PROJECT")
 
 
 @dataclass
 class ResearchConfiguration:
     """Configuration for research-related models and parameters.
 
+    Features that keep the results of a run and only change how fast or how
+    reliably it gets them are on by default: the goal fan-out
+    (`research_fanout`), the dependency-aware pipeline
+    (`research_pipeline_dag`), request compaction (`session_compaction`) and
+    retries with deadlines (`resilient_calls`). Features that change what a
+    run produces, which model answers, whether it runs right away, or that
+    persist data under `~/.cache/adk-docs-agent`, are opt-in: `search_dedup`,
+    `plan_cache`, `report_cache`, `model_routing`, `run_scheduler`,
+    `hedged_calls`, `report_fanout` and `trace_exporters`. The search result
+    cache is only written by the "gemini" search backend.
+
     Attributes:
         critic_model (str): Model for evaluation tasks.
         worker_model (str): Model for working/generation tasks.
         max_search_iterations (int): Maximum search iterations allowed.
+        source_digest_max_chars (int): Character budget for the source digest
+            passed to the report composer (roughly 4 characters per token).
+        source_digest_claims_per_source (int): Top-k claims listed per source
+            in the digest, ranked by confidence.
+        search_backend (str): "google_search" for the model built-in search tool,
+            "gemini" to run searches through the cached `SearchTool`, or
+            "local_index" to answer them from the offline corpus index.
+        research_search_backend (str | None): Overrides `search_backend` for
+            `section_researcher` and `enhanced_search_executor`.
+        search_model (str): Model used by the "gemini" search backend.
+        search_cache_path (str): SQLite file of the search result cache.
+        search_cache_ttl_seconds (int): Lifetime of a cached search result.
+        search_cache_max_entries (int): LRU capacity of the search cache.
+        search_cache_max_entry_bytes (int): Results larger than this are not cached.
+        local_index_path (str): Index directory built with `app.corpus_index`.
+        local_index_top_k (int): Chunks returned per local index query.
+        local_index_vectors (bool): Fuse BM25 with chunk vector search when the
+            index was built with vectors.
+        research_fanout (bool): Research the `[RESEARCH]` goals concurrently
+            instead of in a single `section_researcher` turn.
+        research_max_concurrency (int): Goals researched at the same time.
+        research_requests_per_second (float): Rate at which goal researchers
+            may start; zero disables the limit.
+        findings_full_review_ratio (float): Share of the findings a refinement
+            pass must rewrite before the evaluator re-reads the full text
+            instead of the diff.
+        refinement_stall_iterations (int): Stop refining after this many
+            iterations in a row added no new sources or claims.
+        refinement_query_similarity (float): Follow-up queries at least this
+            similar to an earlier query count as repeats; the loop stops when
+            every follow-up query of an evaluation is a repeat.
+        refinement_max_seconds (float): Wall-clock budget of the refinement
+            loop; zero disables it.
+        refinement_max_tokens (int): Model token budget of the refinement
+            loop (prompt, output and thoughts); zero disables it.
+        research_pipeline_dag (bool): Run `research_pipeline` stages as soon as
+            the state they read is ready, so `section_planner` overlaps the
+            research, instead of strictly in sequence.
+        report_fanout (bool): Compose the report one outline section at a
+            time, concurrently, instead of in a single `report_composer` call.
+        report_max_concurrency (int): Report sections written at the same time.
+        report_findings_per_section (int): Findings sections routed to each
+            report section writer.
+        report_sources_per_section (int): Sources routed to each report
+            section writer.
+        search_dedup (bool): Scope every `SearchTool` query to the ADK docs in
+            code, skip queries already executed in the session and drop
+            executed follow-up queries from the evaluation.
+        search_query_similarity (float): Queries at least this similar to an
+            executed one count as near-duplicates.
+        session_compaction (bool): Compact the stored session events once
+            their sources are collected, and the history sent with the model
+            requests of the planner, researcher and search executor (see
+            `app.compaction`).
+        compaction_strip_thoughts (bool): Remove thought parts from the
+            stored events and requests.
+        compaction_strip_grounding (bool): Remove grounding metadata from the
+            stored events and the search results in requests.
+        compaction_drop_superseded (bool): Remove superseded findings section
+            versions from the state after every refinement loop iteration.
+        compaction_max_events (int): Stored events older than this many lose
+            their content, but user messages, tool calls and the events of
+            the researchers and loop agents are kept. Zero disables the cap.
+        trace_exporters (tuple[str, ...]): Where pipeline traces go: "jsonl"
+            appends spans to `trace_path`, "otel" sends them to the configured
+            OpenTelemetry tracer provider; empty disables tracing. Summarize a
+            JSONL trace with `python -m app.tracing summary <path>`.
+        trace_path (str): JSONL file of the "jsonl" trace exporter.
+        plan_cache (bool): Serve first plans of known topics from a cache in
+            front of `plan_generator` (see `app.agent_cache.PlanCache`).
+        plan_cache_path (str): SQLite file of the plan cache.
+        plan_cache_ttl_seconds (int): Lifetime of a cached plan.
+        plan_cache_max_entries (int): LRU capacity of the plan cache.
+        plan_cache_similarity (float): Trigram cosine from which a topic
+            without an exact entry is served the most similar topic's plan;
+            1.0 only serves exact matches of the normalized topic.
+        report_cache (bool): Serve the cited report of an already executed
+            plan from a cache in front of `research_pipeline` (see
+            `app.agent_cache.ReportCache`). Clear it with
+            `python -m app.agent_cache clear reports`.
+        report_cache_path (str): SQLite file of the report cache.
+        report_cache_ttl_seconds (int): Lifetime of a cached report.
+        report_cache_max_entries (int): LRU capacity of the report cache.
+        report_cache_max_entry_bytes (int): Reports larger than this, with
+            their sources, are not cached.
+        report_cache_corpus_version (str): Part of every report cache key with
+            the plan and the model IDs; change it when the docs corpus
+            changes to miss every cached report.
+        model_routing (bool): Route the calls of `plan_generator`,
+            `section_planner` and `research_evaluator` across `model_tiers`
+            instead of `worker_model`/`critic_model` (see `app.routing`).
+            Per-route metrics are published under the `model_routing` state key.
+        model_tiers (tuple[str, ...]): Routed models, weakest first. Invalid
+            or empty answers escalate to the next tier.
+        routing_max_prompt_tokens (int): Outline and evaluation prompts above
+            this estimate go one tier up.
+        routing_escalate_from_iteration (int): Refinement loop iteration from
+            which the evaluator goes one tier up.
+        routing_min_pass_rate (float): When the recent pass rate of the
+            evaluator on a tier is lower, it goes one tier up.
+        routing_window (int): Recent calls that make a route's pass rate.
+        model_prices (tuple[tuple[str, float, float], ...]): Model name and
+            USD per million prompt and output tokens, for the cost metric.
+        run_scheduler (bool): Admit approved plans through a
+            `app.scheduling.RunScheduler` instead of starting every
+            `research_pipeline` right away.
+        scheduler_max_concurrent_runs (int): Pipelines running at once in
+            this server process.
+        scheduler_max_runs_per_user (int): Pipelines running at once per user.
+        scheduler_max_runs_per_session (int): Pipelines running at once per
+            session.
+        scheduler_max_queued_runs (int): Approved plans waiting for a slot;
+            further approvals are turned down until the queue drains.
+        scheduler_aging_seconds (float): Waiting this long moves a queued run
+            ahead of plans with one goal less. Zero disables aging.
+        resilient_calls (bool): Send every model call, and the searches of
+            the "gemini" backend, through `app.resilience.ResilientCaller`
+            with the deadlines, retries and hedging below.
+        call_deadline_seconds (float): Time for one model call, retries
+            included. Zero disables the deadline.
+        call_attempt_timeout_seconds (float): Time for one attempt of a call
+            before it is retried. Zero leaves it the rest of the deadline.
+        call_deadlines (tuple[tuple[str, float, float], ...]): Agent name, or
+            "search", with its own call deadline and attempt timeout.
+        call_max_attempts (int): Attempts of a call that fails with a
+            transient error (429, 5xx, timeout) before it gives up.
+        call_backoff_base_seconds (float): Backoff cap after the first
+            failed attempt, doubling per attempt; the wait is drawn below
+            it. A server's retry-after hint is always honored.
+        call_backoff_max_seconds (float): Largest backoff cap.
+        hedged_calls (tuple[str, ...]): Agents, or "search", whose slow
+            calls get a duplicate request, e.g. ("research_evaluator",
+            "search"). Only idempotent calls belong here.
+        hedge_quantile (float): A call is hedged once it is slower than this
+            quantile of its recent latencies.
+        hedge_min_samples (int): Latencies of a route before it is hedged.
+        model_rate_limits (tuple[tuple[str, float, int], ...]): Model name,
+            requests per second and burst of a token bucket shared by every
+            call to that model. Unlisted models are not limited.
     """
 
     critic_model: str = "gemini-2.5-pro"
     worker_model: str = "gemini-2.5-pro"
     max_search_iterations: int = 30
+    source_digest_max_chars: int = 12000
+    source_digest_claims_per_source: int = 3
+    search_backend: str = "google_search"
+    research_search_backend: str | None = None
+    search_model: str = "gemini-2.5-flash"
+    search_cache_path: str = str(Path.home() / ".cache" / "adk-docs-agent" / "search.sqlite3")
+    search_cache_ttl_seconds: int = 7 * 24 * 3600
+    search_cache_max_entries: int = 5000
+    search_cache_max_entry_bytes: int = 256 * 1024
+    local_index_path: str = str(Path.home() / ".cache" / "adk-docs-agent" / "index")
+    local_index_top_k: int = 5
+    local_index_vectors: bool = False
+    research_fanout: bool = True
+    research_max_concurrency: int = 4
+    research_requests_per_second: float = 2.0
+    findings_full_review_ratio: float = 0.5
+    refinement_stall_iterations: int = 2
+    refinement_query_similarity: float = 0.8
+    refinement_max_seconds: float = 600.0
+    refinement_max_tokens: int = 2_000_000
+    research_pipeline_dag: bool = True
+    report_fanout: bool = False
+    report_max_concurrency: int = 4
+    report_findings_per_section: int = 4
+    report_sources_per_section: int = 12
+    search_dedup: bool = False
+    search_query_similarity: float = 0.8
+    session_compaction: bool = True
+    compaction_strip_thoughts: bool = True
+    compaction_strip_grounding: bool = True
+    compaction_drop_superseded: bool = True
+    compaction_max_events: int = 200
+    trace_exporters: tuple[str, ...] = ()
+    trace_path: str = str(Path.home() / ".cache" / "adk-docs-agent" / "traces.jsonl")
+    plan_cache: bool = False
+    plan_cache_path: str = str(Path.home() / ".cache" / "adk-docs-agent" / "plans.sqlite3")
+    plan_cache_ttl_seconds: int = 30 * 24 * 3600
+    plan_cache_max_entries: int = 500
+    plan_cache_similarity: float = 0.9
+    report_cache: bool = False
+    report_cache_path: str = str(Path.home() / ".cache" / "adk-docs-agent" / "reports.sqlite3")
+    report_cache_ttl_seconds: int = 7 * 24 * 3600
+    report_cache_max_entries: int = 200
+    report_cache_max_entry_bytes: int = 4 * 1024 * 1024
+    report_cache_corpus_version: str = "adk-docs"
+    model_routing: bool = False
+    model_tiers: tuple[str, ...] = ("gemini-2.5-flash", "gemini-2.5-pro")
+    routing_max_prompt_tokens: int = 32_000
+    routing_escalate_from_iteration: int = 3
+    routing_min_pass_rate: float = 0.8
+    routing_window: int = 20
+    model_prices: tuple[tuple[str, float, float], ...] = (
+        ("gemini-2.5-flash", 0.30, 2.50),
+        ("gemini-2.5-pro", 1.25, 10.00),
+    )
+    run_scheduler: bool = False
+    scheduler_max_concurrent_runs: int = 4
+    scheduler_max_runs_per_user: int = 1
+    scheduler_max_runs_per_session: int = 1
+    scheduler_max_queued_runs: int = 32
+    scheduler_aging_seconds: float = 60.0
+    resilient_calls: bool = True
+    call_deadline_seconds: float = 600.0
+    call_attempt_timeout_seconds: float = 240.0
+    call_deadlines: tuple[tuple[str, float, float], ...] = (
+        ("plan_generator", 240.0, 120.0),
+        ("section_planner", 240.0, 120.0),
+        ("research_evaluator", 240.0, 90.0),
+        ("search", 90.0, 30.0),
+    )
+    call_max_attempts: int = 4
+    call_backoff_base_seconds: float = 1.0
+    call_backoff_max_seconds: float = 32.0
+    hedged_calls: tuple[str, ...] = ()
+    hedge_quantile: float = 0.95
+    hedge_min_samples: int = 20
+    model_rate_limits: tuple[tuple[str, float, int], ...] = ()
 
 
 config = ResearchConfiguration()
@@ -0,0 +1,203 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local classification of the user's reply to a proposed research plan.
+
+Replies are lowercased and stripped of accents, then matched on word
+boundaries against small Portuguese/English lexicons. A reply is an approval
+only when it contains an approval term, no negation, no question mark, and
+no word outside the approval and filler lexicons, so "sim, mas inclua X" and
+"pode incluir X?" are still answered by the planner model.
+"""
+
+import re
+import unicodedata
+from typing import Literal
+
+ReplyKind = Literal["approval", "feedback", "ambiguous"]
+
+# Single words and short phrases, written without accents.
+APPROVAL_TERMS = [
+    "sim",
+    "ok",
+    "okay",
+    "execute",
+    "executar",
+    "executa",
+    "pode executar",
+    "pode seguir",
+    "pode prosseguir",
+    "pode comecar",
+    "vai em frente",
+    "prossiga",
+    "aprovo",
+    "aprovado",
+    "confirmado",
+    "confirmo",
+    "manda ver",
+    "yes",
+    "yep",
+    "run it",
+    "go ahead",
+    "approved",
+    "approve",
+    "confirmed",
+    "proceed",
+    "lgtm",
+]
+
+# Words that negate the verb next to them, as in "nao pare" or "don't stop".
+NEGATORS = [
+    "nao",
+    "nem",
+    "nunca",
+    "no",
+    "not",
+    "don't",
+    "dont",
+    "never",
+]
+
+NEGATION_TERMS = [
+    *NEGATORS,
+    "cancelar",
+    "cancela",
+    "cancele",
+    "pare",
+    "parar",
+    "espere",
+    "espera",
+    "aguarde",
+    "cancel",
+    "stop",
+    "wait",
+    "hold on",
+]
+
+# Replies that stop the user's queued or running research.
+CANCEL_TERMS = [
+    "cancelar",
+    "cancela",
+    "cancele",
+    "pare",
+    "parar",
+    "abortar",
+    "cancel",
+    "stop",
+    "abort",
+]
+
+FILLER_TERMS = [
+    "a",
+    "o",
+    "e",
+    "la",
+    "pra",
+    "por",
+    "favor",
+    "vamos",
+    "entao",
+    "plano",
+    "pesquisa",
+    "isso",
+    "esse",
+    "este",
+    "bom",
+    "otimo",
+    "perfeito",
+    "beleza",
+    "certo",
+    "the",
+    "it",
+    "plan",
+    "please",
+    "sure",
+    "great",
+    "perfect",
+    "fine",
+    "good",
+    "looks",
+    "sounds",
+    "let's",
+    "lets",
+    "thanks",
+    "obrigado",
+    "obrigada",
+]
+
+# Words outside the lexicons a cancel request may still contain.
+MAX_OTHER_WORDS = 2
+
+
+def _terms_pattern(terms: list[str]) -> re.Pattern[str]:
+    alternatives = sorted((re.escape(term) for term in terms), key=len, reverse=True)
+    return re.compile(rf"(?<![\w'])(?:{'|'.join(alternatives)})(?![\w'])")
+
+
+_APPROVAL = _terms_pattern(APPROVAL_TERMS)
+_NEGATION = _terms_pattern(NEGATION_TERMS)
+_NEGATOR = _terms_pattern(NEGATORS)
+_CANCEL = _terms_pattern(CANCEL_TERMS)
+_FILLER = _terms_pattern(FILLER_TERMS)
+_WORD = re.compile(r"[\w']+")
+_CLAUSE_BREAK = re.compile(r"[,.;:!?]")
+
+
+def fold_text(text: str) -> str:
+    """Lowercases `text` and strips accents ("Não" becomes "nao")."""
+    # U+2019, the typographic apostrophe phone keyboards type in "don't".
+    decomposed = unicodedata.normalize("NFKD", text.lower().replace("\u2019", "'"))
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def classify_reply(text: str) -> ReplyKind:
+    """Classifies a reply to a proposed plan without a model call.
+
+    Args:
+        text (str): The user's message.
+
+    Returns:
+        ReplyKind: "approval" for a plain go-ahead, "feedback" when the reply
+        negates or adds content to an approval, and "ambiguous" when it is a
+        question or matches no lexicon term.
+    """
+    folded = fold_text(text)
+    if _NEGATION.search(folded):
+        return "feedback"
+    if folded.rstrip().endswith("?") or not _APPROVAL.search(folded):
+        return "ambiguous"
+    remainder = _FILLER.sub(" ", _APPROVAL.sub(" ", folded))
+    if _WORD.search(remainder):
+        return "feedback"
+    return "approval"
+
+
+def is_cancel_request(text: str) -> bool:
+    """Whether a reply asks to stop the research, e.g. "cancela" or "stop it".
+
+    Like an approval, the reply may hold at most a couple of other words, so
+    a message that merely mentions cancelling is left to the planner. A
+    negator in the same clause as the cancel verb ("nao pare", "cancela isso
+    nao") turns the reply into the opposite request; "nao, cancela" still
+    cancels.
+    """
+    folded = fold_text(text)
+    if not _CANCEL.search(folded):
+        return False
+    for clause in _CLAUSE_BREAK.split(folded):
+        if _CANCEL.search(clause) and _NEGATOR.search(clause):
+            return False
+    remainder = _FILLER.sub(" ", _CANCEL.sub(" ", folded))
+    remainder = _NEGATOR.sub(" ", remainder)
+    return len(_WORD.findall(remainder)) <= MAX_OTHER_WORDS
@@ -0,0 +1,481 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Offline retrieval over a local snapshot of the ADK documentation.
+
+`build_index` ingests a directory of Markdown/HTML pages into an on-disk BM25
+inverted index, optionally with chunk-level vectors. `CorpusIndex` serves
+queries from memory-mapped postings, and `LocalIndexSearchBackend` exposes it
+as a `SearchBackend`, so results flow through `SearchTool` as grounding chunks
+with the public docs URLs.
+
+Usage:
+    python -m app.corpus_index build DOCS_DIR INDEX_DIR [--vectors]
+    python -m app.corpus_index query INDEX_DIR "how do callbacks work"
+"""
+
+import argparse
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import re
+from array import array
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Any, Literal
+
+from google.genai import types as genai_types
+
+from .search import ADK_DOCS_SITE, SearchResult, strip_site_operators
+
+DEFAULT_BASE_URL = f"https://{ADK_DOCS_SITE}"
+INDEX_FORMAT_VERSION = 1
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or that the this to "
+    "what when where which with you your".split()
+)
+
+EmbedFn = Callable[[str], list[float]]
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercases and splits text into index terms."""
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def trigram_embedding(text: str, dim: int = 256) -> list[float]:
+    """Hashes character trigrams into a fixed-size, L2-normalized vector.
+
+    A dependency-free embedding that tolerates morphology and typos that exact
+    BM25 terms miss. Any callable with the same signature can replace it.
+    """
+    vector = [0.0] * dim
+    for token in tokenize(text):
+        padded = f" {token} "
+        for i in range(len(padded) - 2):
+            digest = hashlib.blake2b(padded[i : i + 3].encode(), digest_size=4)
+            vector[int.from_bytes(digest.digest(), "little") % dim] += 1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+@dataclass
+class Chunk:
+    """A retrievable passage of a documentation page."""
+
+    url: str
+    title: str
+    text: str
+
+
+@dataclass
+class Hit:
+    """A scored retrieval result."""
+
+    chunk: Chunk
+    score: float
+
+
+class _HTMLText(HTMLParser):
+    """Extracts the title and visible text of an HTML page."""
+
+    _SKIP = frozenset({"script", "style", "nav", "header", "footer"})
+    _BLOCK = frozenset(
+        {"p", "li", "pre", "h1", "h2", "h3", "h4", "tr", "div", "section"}
+    )
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.title = ""
+        self.parts: list[str] = []
+        self._skip_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        if tag in self._SKIP:
+            self._skip_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag in self._BLOCK:
+            self.parts.append("\n\n")
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in self._SKIP and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data: str) -> None:
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth:
+            self.parts.append(data)
+
+
+def _page_url(relative: Path, base_url: str) -> str:
+    parts = list(relative.with_suffix("").parts)
+    if parts and parts[-1] in ("index", "README"):
+        parts = parts[:-1]
+    path = "/".join(parts)
+    return base_url.rstrip("/") + "/" + (f"{path}/" if path else "")
+
+
+def _read_page(path: Path) -> tuple[str, str]:
+    raw = path.read_text(encoding="utf-8", errors="replace")
+    if path.suffix.lower() in (".html", ".htm"):
+        parser = _HTMLText()
+        parser.feed(raw)
+        return parser.title.strip(), "".join(parser.parts)
+    heading = re.search(r"^#\s+(.+)$", raw, re.MULTILINE)
+    return (heading.group(1).strip() if heading else path.stem), raw
+
+
+def iter_chunks(
+    docs_dir: str | Path, base_url: str = DEFAULT_BASE_URL, chunk_chars: int = 1200
+) -> Iterator[Chunk]:
+    """Splits every Markdown/HTML page under `docs_dir` into chunks.
+
+    Paragraphs are packed into chunks of at most `chunk_chars` characters.
+
+    Args:
+        docs_dir (str | Path): Root of the documentation snapshot.
+        base_url (str): Public URL the snapshot root is served from.
+        chunk_chars (int): Soft size limit of a chunk.
+
+    Yields:
+        Chunk: Passages in file order.
+    """
+    root = Path(docs_dir)
+    for path in sorted(root.rglob("*")):
+        if path.suffix.lower() not in (".md", ".markdown", ".html", ".htm"):
+            continue
+        title, text = _read_page(path)
+        url = _page_url(path.relative_to(root), base_url)
+        buffer: list[str] = []
+        size = 0
+        for paragraph in re.split(r"\n\s*\n", text):
+            paragraph = " ".join(paragraph.split())
+            if not paragraph:
+                continue
+            if buffer and size + len(paragraph) > chunk_chars:
+                yield Chunk(url=url, title=title, text=" ".join(buffer))
+                buffer, size = [], 0
+            buffer.append(paragraph)
+            size += len(paragraph) + 1
+        if buffer:
+            yield Chunk(url=url, title=title, text=" ".join(buffer))
+
+
+def build_index(
+    docs_dir: str | Path,
+    index_dir: str | Path,
+    base_url: str = DEFAULT_BASE_URL,
+    chunk_chars: int = 1200,
+    embed_fn: EmbedFn | None = None,
+) -> int:
+    """Builds the on-disk index for a documentation snapshot.
+
+    Files written to `index_dir`:
+        meta.json: corpus statistics and the term dictionary.
+        postings.bin: (chunk id, term frequency) uint32 pairs grouped by term.
+        doclens.bin: uint32 length of every chunk in terms.
+        chunks.jsonl / chunk_offsets.bin: chunk metadata and its byte offsets.
+        vectors.bin: float32 chunk embeddings, only when `embed_fn` is given.
+
+    Arrays use the machine's native byte order.
+
+    Args:
+        docs_dir (str | Path): Root of the documentation snapshot.
+        index_dir (str | Path): Output directory.
+        base_url (str): Public URL the snapshot root is served from.
+        chunk_chars (int): Soft size limit of a chunk.
+        embed_fn (EmbedFn | None): Optional chunk embedding function.
+
+    Returns:
+        int: The number of indexed chunks.
+    """
+    out = Path(index_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    postings: defaultdict[str, list[tuple[int, int]]] = defaultdict(list)
+    doclens = array("I")
+    offsets = array("Q")
+    vectors = array("f")
+    dim = 0
+    with open(out / "chunks.jsonl", "wb") as chunks_file:
+        for chunk_id, chunk in enumerate(iter_chunks(docs_dir, base_url, chunk_chars)):
+            terms = tokenize(f"{chunk.title} {chunk.text}")
+            for term, tf in Counter(terms).items():
+                postings[term].append((chunk_id, tf))
+            doclens.append(len(terms))
+            offsets.append(chunks_file.tell())
+            chunks_file.write(
+                json.dumps(
+                    {"url": chunk.url, "title": chunk.title, "text": chunk.text},
+                    ensure_ascii=False,
+                ).encode("utf-8")
+                + b"\n"
+            )
+            if embed_fn is not None:
+                vector = embed_fn(f"{chunk.title}\n{chunk.text}")
+                dim = len(vector)
+                vectors.extend(vector)
+
+    vocabulary: dict[str, list[int]] = {}
+    flat = array("I")
+    for term in sorted(postings):
+        vocabulary[term] = [len(flat) // 2, len(postings[term])]
+        for chunk_id, tf in postings[term]:
+            flat.extend((chunk_id, tf))
+    for name, data in (
+        ("postings.bin", flat),
+        ("doclens.bin", doclens),
+        ("chunk_offsets.bin", offsets),
+    ):
+        with open(out / name, "wb") as f:
+            data.tofile(f)
+    vectors_path = out / "vectors.bin"
+    if embed_fn is not None:
+        with open(vectors_path, "wb") as f:
+            vectors.tofile(f)
+    elif vectors_path.exists():
+        vectors_path.unlink()
+
+    meta = {
+        "version": INDEX_FORMAT_VERSION,
+        "chunk_count": len(doclens),
+        "avg_doclen": (sum(doclens) / len(doclens)) if doclens else 0.0,
+        "vector_dim": dim,
+        "vocabulary": vocabulary,
+    }
+    (out / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    return len(doclens)
+
+
+def _map(path: Path) -> mmap.mmap | None:
+    if not path.exists() or path.stat().st_size == 0:
+        return None
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class CorpusIndex:
+    """Read-only view of an index written by `build_index`.
+
+    Postings, document lengths, chunk offsets and vectors are memory-mapped,
+    so opening an index costs only the term dictionary and resident memory
+    stays proportional to the postings actually touched by queries.
+
+    Args:
+        index_dir (str | Path): Directory written by `build_index`.
+        embed_fn (EmbedFn | None): Query embedding function; enables vector
+            search when the index has vectors.
+        k1 (float): BM25 term-frequency saturation.
+        b (float): BM25 length normalization.
+    """
+
+    def __init__(
+        self,
+        index_dir: str | Path,
+        embed_fn: EmbedFn | None = None,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        root = Path(index_dir)
+        meta = json.loads((root / "meta.json").read_text(encoding="utf-8"))
+        if meta["version"] != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported index version in {root}: {meta['version']}")
+        self.chunk_count: int = meta["chunk_count"]
+        self.avg_doclen: float = meta["avg_doclen"] or 1.0
+        self.vector_dim: int = meta["vector_dim"]
+        self._vocabulary: dict[str, list[int]] = meta["vocabulary"]
+        self.embed_fn = embed_fn if self.vector_dim else None
+        self.k1 = k1
+        self.b = b
+        self._maps: list[mmap.mmap] = []
+        self._views: list[memoryview[Any]] = []
+        self._postings = self._view(root / "postings.bin", "I")
+        self._doclens = self._view(root / "doclens.bin", "I")
+        self._offsets = self._view(root / "chunk_offsets.bin", "Q")
+        self._vectors = self._view(root / "vectors.bin", "f")
+        self._chunks = _map(root / "chunks.jsonl") or b""
+        if isinstance(self._chunks, mmap.mmap):
+            self._maps.append(self._chunks)
+
+    def _view(self, path: Path, typecode: Literal["I", "Q", "f"]) -> "memoryview[Any]":
+        mapped = _map(path)
+        if mapped is None:
+            return memoryview(array(typecode))
+        self._maps.append(mapped)
+        view = memoryview(mapped).cast(typecode)
+        self._views.append(view)
+        return view
+
+    def close(self) -> None:
+        """Releases the memory maps."""
+        for view in self._views:
+            view.release()
+        for mapped in self._maps:
+            mapped.close()
+
+    def chunk(self, chunk_id: int) -> Chunk:
+        """Loads a chunk's metadata from the chunk file."""
+        start = self._offsets[chunk_id]
+        end = self._chunks.find(b"\n", start)
+        return Chunk(**json.loads(self._chunks[start:end]))
+
+    def bm25(self, query: str, top_k: int) -> list[tuple[int, float]]:
+        """Scores chunks against `query` with BM25.
+
+        Returns:
+            list[tuple[int, float]]: (chunk id, score), best first.
+        """
+        scores: defaultdict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            entry = self._vocabulary.get(term)
+            if entry is None:
+                continue
+            start, count = entry
+            idf = math.log(1 + (self.chunk_count - count + 0.5) / (count + 0.5))
+            for i in range(start, start + count):
+                chunk_id = self._postings[2 * i]
+                tf = self._postings[2 * i + 1]
+                norm = 1 - self.b + self.b * self._doclens[chunk_id] / self.avg_doclen
+                scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def vector_search(self, query: str, top_k: int) -> list[tuple[int, float]]:
+        """Ranks chunks by cosine similarity to the query embedding."""
+        if self.embed_fn is None:
+            return []
+        query_vector = self.embed_fn(query)
+        dim = self.vector_dim
+        scored = (
+            (
+                chunk_id,
+                sum(
+                    a * b
+                    for a, b in zip(
+                        query_vector,
+                        self._vectors[chunk_id * dim : (chunk_id + 1) * dim],
+                        strict=True,
+                    )
+                ),
+            )
+            for chunk_id in range(self.chunk_count)
+        )
+        return heapq.nlargest(top_k, scored, key=lambda item: item[1])
+
+    def search(self, query: str, top_k: int = 5) -> list[Hit]:
+        """Returns the best chunks for `query`.
+
+        BM25 alone is used unless vector search is enabled, in which case
+        both rankings are merged with reciprocal rank fusion.
+        """
+        query = strip_site_operators(query)
+        lexical = self.bm25(query, top_k * 4)
+        if self.embed_fn is None:
+            ranked = lexical[:top_k]
+        else:
+            fused: defaultdict[int, float] = defaultdict(float)
+            for ranking in (lexical, self.vector_search(query, top_k * 4)):
+                for rank, (chunk_id, _) in enumerate(ranking):
+                    fused[chunk_id] += 1.0 / (60 + rank)
+            ranked = heapq.nlargest(top_k, fused.items(), key=lambda item: item[1])
+        return [
+            Hit(chunk=self.chunk(chunk_id), score=score) for chunk_id, score in ranked
+        ]
+
+
+class LocalIndexSearchBackend:
+    """`SearchBackend` answering queries from a local `CorpusIndex`."""
+
+    def __init__(self, index: CorpusIndex, top_k: int = 5, snippet_chars: int = 400):
+        self.index = index
+        self.top_k = top_k
+        self.snippet_chars = snippet_chars
+
+    async def search(self, query: str) -> SearchResult:
+        hits = self.index.search(query, self.top_k)
+        best = hits[0].score if hits else 1.0
+        chunks, supports, lines = [], [], []
+        for i, hit in enumerate(hits):
+            snippet = hit.chunk.text[: self.snippet_chars]
+            chunks.append(
+                genai_types.GroundingChunk(
+                    web=genai_types.GroundingChunkWeb(
+                        uri=hit.chunk.url,
+                        title=hit.chunk.title,
+                        domain=ADK_DOCS_SITE.split("/")[0],
+                    )
+                )
+            )
+            supports.append(
+                genai_types.GroundingSupport(
+                    segment=genai_types.Segment(text=snippet),
+                    grounding_chunk_indices=[i],
+                    confidence_scores=[round(hit.score / best, 3) if best else 0.0],
+                )
+            )
+            lines.append(f"[{i + 1}] {hit.chunk.title} ({hit.chunk.url})\n{snippet}")
+        return SearchResult(
+            query=query,
+            text="\n\n".join(lines),
+            grounding_metadata=genai_types.GroundingMetadata(
+                grounding_chunks=chunks, grounding_supports=supports
+            ),
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ADK docs corpus index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Index a documentation snapshot.")
+    build.add_argument("docs_dir")
+    build.add_argument("index_dir")
+    build.add_argument("--base-url", default=DEFAULT_BASE_URL)
+    build.add_argument("--chunk-chars", type=int, default=1200)
+    build.add_argument(
+        "--vectors", action="store_true", help="Also store trigram chunk vectors."
+    )
+    query = commands.add_parser("query", help="Query an index.")
+    query.add_argument("index_dir")
+    query.add_argument("text")
+    query.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_index(
+            args.docs_dir,
+            args.index_dir,
+            base_url=args.base_url,
+            chunk_chars=args.chunk_chars,
+            embed_fn=trigram_embedding if args.vectors else None,
+        )
+        print(f"Indexed {count} chunks into {args.index_dir}")
+    else:
+        index = CorpusIndex(args.index_dir, embed_fn=trigram_embedding)
+        for hit in index.search(args.text, args.top_k):
+            print(f"{hit.score:8.3f}  {hit.chunk.title}  {hit.chunk.url}")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Structured, append-only research findings for the refinement loop.
+
+Findings are kept in state as a list of section records
+`{"id", "title", "text", "iteration"}`. A refinement pass appends new versions
+of the sections it changed instead of rewriting the whole findings text; the
+current view of a section is its latest record.
+"""
+
+import re
+from typing import Any
+
+_HEADING = re.compile(r"^#{1,3}\s+(?:\[(sec-\d+|new)\]\s*)?(.+?)\s*$", re.MULTILINE)
+
+
+def _normalize_title(title: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", title.lower()).split())
+
+
+def split_sections(text: str) -> list[tuple[str | None, str, str]]:
+    """Splits Markdown into (tag, title, body) sections on `#`-`###` headings.
+
+    Text before the first heading becomes an untitled section.
+    """
+    matches = list(_HEADING.finditer(text))
+    sections: list[tuple[str | None, str, str]] = []
+    preamble = text[: matches[0].start()] if matches else text
+    if preamble.strip():
+        sections.append((None, "Research findings", preamble.strip()))
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+        sections.append(
+            (match.group(1), match.group(2), text[match.end() : end].strip())
+        )
+    return sections
+
+
+def current_sections(records: list[dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    """Returns the latest record of every section, in first-appearance order."""
+    latest: dict[str, dict[str, Any]] = {}
+    for record in records:
+        latest[record["id"]] = record
+    return latest
+
+
+def sections_from_text(text: str, iteration: int = 0) -> list[dict[str, Any]]:
+    """Builds the initial section records from a full findings text."""
+    return [
+        {"id": f"sec-{i}", "title": title, "text": body, "iteration": iteration}
+        for i, (_, title, body) in enumerate(split_sections(text), start=1)
+    ]
+
+
+def render_findings(records: list[dict[str, Any]]) -> str:
+    """Renders the current version of every section as Markdown."""
+    return "\n\n".join(
+        f"## {record['title']}\n\n{record['text']}"
+        for record in current_sections(records).values()
+    )
+
+
+def render_index(records: list[dict[str, Any]]) -> str:
+    """Renders one `[sec-N] title (chars)` line per current section."""
+    return "\n".join(
+        f"- [{record['id']}] {record['title']} ({len(record['text'])} chars)"
+        for record in current_sections(records).values()
+    )
+
+
+def merge_findings_delta(
+    records: list[dict[str, Any]], delta: str, iteration: int
+) -> tuple[list[dict[str, Any]], dict[str, Any]]:
+    """Appends the sections of a refinement delta to the records.
+
+    Sections headed `[sec-N]` replace that section; other sections replace the
+    section with the same normalized title or are added as new sections.
+    Sections whose text did not change are ignored.
+
+    Args:
+        records (list[dict]): The current section records.
+        delta (str): Markdown emitted by the refinement pass.
+        iteration (int): The refinement iteration that produced `delta`.
+
+    Returns:
+        tuple[list[dict], dict]: The extended records and a change summary with
+            `changed_ids`, `added_ids`, `changed_chars`, `total_chars` and a
+            human-readable `summary`.
+    """
+    records = list(records)
+    latest = current_sections(records)
+    by_title = {_normalize_title(r["title"]): r["id"] for r in latest.values()}
+    next_id = (
+        max((int(record["id"].split("-")[1]) for record in records), default=0) + 1
+    )
+    changed, added, changed_chars = [], [], 0
+    for tag, title, body in split_sections(delta):
+        if not body:
+            continue
+        section_id = tag if tag in latest else by_title.get(_normalize_title(title))
+        if section_id is None:
+            section_id = f"sec-{next_id}"
+            next_id += 1
+            added.append(section_id)
+        elif latest[section_id]["text"] == body:
+            continue
+        else:
+            title = latest[section_id]["title"]
+            changed.append(section_id)
+        record = {
+            "id": section_id,
+            "title": title,
+            "text": body,
+            "iteration": iteration,
+        }
+        records.append(record)
+        latest[section_id] = record
+        by_title[_normalize_title(title)] = section_id
+        changed_chars += len(body)
+
+    parts = []
+    for label, ids in (("updated", changed), ("added", added)):
+        if ids:
+            described = ", ".join(
+                f"{i} '{latest[i]['title']}' ({len(latest[i]['text'])} chars)"
+                for i in ids
+            )
+            parts.append(f"{label} {described}")
+    summary = f"Iteration {iteration}: " + ("; ".join(parts) or "no sections changed")
+    return records, {
+        "iteration": iteration,
+        "changed_ids": changed,
+        "added_ids": added,
+        "changed_chars": changed_chars,
+        "total_chars": sum(len(r["text"]) for r in latest.values()),
+        "summary": summary,
+    }
+
+
+def render_evaluator_view(
+    records: list[dict[str, Any]],
+    last_delta: dict[str, Any] | None,
+    full_review_ratio: float,
+) -> tuple[str, bool]:
+    """Chooses what the evaluator reads: the full findings or the last delta.
+
+    The full text is shown for the first evaluation and whenever the last
+    delta touched at least `full_review_ratio` of the findings. Otherwise the
+    evaluator gets the diff summary, the changed sections and the index of the
+    unchanged ones.
+
+    Returns:
+        tuple[str, bool]: The rendered findings and whether they are complete.
+    """
+    if not last_delta or (
+        last_delta["changed_chars"]
+        >= full_review_ratio * max(last_delta["total_chars"], 1)
+    ):
+        return render_findings(records), True
+    latest = current_sections(records)
+    touched = [*last_delta["changed_ids"], *last_delta["added_ids"]]
+    lines = [
+        "### Changes since your last evaluation",
+        last_delta["summary"],
+        "",
+        "### Changed sections",
+    ]
+    lines += [
+        f"## [{i}] {latest[i]['title']}\n\n{latest[i]['text']}" for i in touched
+    ] or ["(none)"]
+    unchanged = [record for i, record in latest.items() if i not in touched]
+    if unchanged:
+        lines += ["", "### Unchanged sections (already evaluated)"]
+        lines += [
+            f"- [{r['id']}] {r['title']} ({len(r['text'])} chars)" for r in unchanged
+        ]
+    return "\n".join(lines), False
@@ -0,0 +1,207 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A pipeline agent that runs stages as soon as their inputs are ready.
+
+Each `PipelineStage` declares the session state keys it reads and writes.
+Stage order in the list is the sequential order the results must match, so a
+stage waits for every earlier stage it conflicts with. Two stages conflict when
+one writes a key that the other reads or writes. Stages that do not conflict
+run concurrently, and the final state matches running them in list order.
+"""
+
+import asyncio
+import logging
+import time
+from collections.abc import AsyncGenerator
+from typing import Any
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from pydantic import BaseModel, ConfigDict, Field
+
+PIPELINE_TIMELINE_KEY = "pipeline_timeline"
+
+
+class PipelineStage(BaseModel):
+    """An agent plus the session state keys it reads and writes."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    agent: BaseAgent
+    reads: list[str] = Field(default_factory=list)
+    writes: list[str] = Field(default_factory=list)
+
+
+def stage_dependencies(stages: list[PipelineStage]) -> list[list[int]]:
+    """Returns, per stage, the indices of the earlier stages it must wait for.
+
+    Args:
+        stages (list[PipelineStage]): Stages in their sequential order.
+
+    Returns:
+        list[list[int]]: Read-after-write, write-after-read and
+        write-after-write dependencies on earlier stages.
+    """
+    dependencies = []
+    for index, stage in enumerate(stages):
+        reads, writes = set(stage.reads), set(stage.writes)
+        dependencies.append(
+            [
+                earlier
+                for earlier, previous in enumerate(stages[:index])
+                if set(previous.writes) & (reads | writes)
+                or set(previous.reads) & writes
+            ]
+        )
+    return dependencies
+
+
+def _ordered_pairs(dependencies: list[list[int]]) -> set[tuple[int, int]]:
+    """Transitive closure of the dependencies, as (earlier, later) pairs."""
+    ancestors: list[set[int]] = []
+    for deps in dependencies:
+        reachable = set(deps)
+        for dep in deps:
+            reachable |= ancestors[dep]
+        ancestors.append(reachable)
+    return {(a, b) for b, reachable in enumerate(ancestors) for a in reachable}
+
+
+def _main_chain(count: int, ordered: set[tuple[int, int]]) -> set[int]:
+    """The longest run of mutually ordered stages, preferring earlier ones."""
+    chains: list[list[int]] = []
+    for index in range(count):
+        earlier_chains = [
+            chains[earlier] for earlier in range(index) if (earlier, index) in ordered
+        ]
+        longest = max(earlier_chains, key=len) if earlier_chains else []
+        chains.append([*longest, index])
+    main_chain = max(chains, key=len) if chains else []
+    return set(main_chain)
+
+
+class DependencyPipelineAgent(BaseAgent):
+    """Runs `stages` concurrently wherever their state dependencies allow.
+
+    The longest chain of stages that never overlap each other runs on the
+    pipeline's branch, so later stages of the chain see the events of earlier
+    ones, as in a `SequentialAgent`. Every other stage runs on its own branch
+    below it, so concurrent off-chain stages do not see each other's events.
+    The chain is kept from their events only when the pipeline itself runs on
+    a branch: ADK shows an agent without one, as in a top-level pipeline, the
+    events of every branch. Stages therefore exchange results through state,
+    whose writes are ordered by the declared dependencies. Like
+    `ParallelAgent`, a stage
+    does not resume until its previous event was processed upstream, so its
+    state writes are visible before its next step. The start and end of every
+    stage are recorded under `pipeline_timeline`, together with the elapsed
+    time and the time a sequential run of the same stages would have taken.
+    """
+
+    stages: list[PipelineStage]
+
+    def __init__(self, name: str, stages: list[PipelineStage], **kwargs: Any):
+        # BaseAgent's signature does not list the fields of subclasses.
+        super().__init__(  # type: ignore[call-arg]
+            name=name,
+            stages=stages,
+            sub_agents=[stage.agent for stage in stages],
+            **kwargs,
+        )
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        dependencies = stage_dependencies(self.stages)
+        ordered = _ordered_pairs(dependencies)
+        count = len(self.stages)
+        chain = _main_chain(count, ordered)
+        isolated = [index not in chain for index in range(count)]
+        queue: asyncio.Queue[tuple[int, Event | None, asyncio.Event | None]] = (
+            asyncio.Queue()
+        )
+        started_at = time.perf_counter()
+        timeline: list[dict] = [{} for _ in self.stages]
+
+        async def run_stage(index: int) -> None:
+            stage_ctx = ctx
+            if isolated[index]:
+                branch = f"{self.name}.{self.stages[index].agent.name}"
+                if ctx.branch:
+                    branch = f"{ctx.branch}.{branch}"
+                stage_ctx = ctx.model_copy(update={"branch": branch})
+            timeline[index]["start_s"] = round(time.perf_counter() - started_at, 3)
+            try:
+                async for event in self.stages[index].agent.run_async(stage_ctx):
+                    processed = asyncio.Event()
+                    await queue.put((index, event, processed))
+                    await processed.wait()
+            finally:
+                timeline[index]["end_s"] = round(time.perf_counter() - started_at, 3)
+                await queue.put((index, None, None))
+
+        tasks: dict[int, asyncio.Task] = {}
+        done: set[int] = set()
+
+        def start_ready_stages() -> None:
+            for index in range(count):
+                if index not in tasks and all(d in done for d in dependencies[index]):
+                    logging.info(
+                        f"[{self.name}] Starting {self.stages[index].agent.name}."
+                    )
+                    tasks[index] = asyncio.create_task(run_stage(index))
+
+        try:
+            start_ready_stages()
+            while len(done) < count:
+                index, event, processed = await queue.get()
+                if event is None or processed is None:
+                    await tasks[index]
+                    done.add(index)
+                    start_ready_stages()
+                    continue
+                yield event
+                processed.set()
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+        elapsed_s = round(time.perf_counter() - started_at, 3)
+        stages = [
+            {
+                "stage": stage.agent.name,
+                "after": [self.stages[d].agent.name for d in dependencies[index]],
+                **timeline[index],
+            }
+            for index, stage in enumerate(self.stages)
+        ]
+        sequential_s = round(sum(s["end_s"] - s["start_s"] for s in stages), 3)
+        logging.info(
+            f"[{self.name}] Finished in {elapsed_s}s; "
+            f"sequential stages would take {sequential_s}s."
+        )
+        yield Event(
+            author=self.name,
+            actions=EventActions(
+                state_delta={
+                    PIPELINE_TIMELINE_KEY: {
+                        "stages": stages,
+                        "elapsed_s": elapsed_s,
+                        "sequential_s": sequential_s,
+                    }
+                }
+            ),
+        )
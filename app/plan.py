@@ -0,0 +1,93 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Parsing of the `[RESEARCH]`/`[DELIVERABLE]` research plan bullets."""
+
+import re
+from dataclasses import dataclass
+from typing import Literal, cast
+
+GoalKind = Literal["RESEARCH", "DELIVERABLE"]
+
+_GOAL_LINE = re.compile(
+    r"^\s*(?:[-*•+]|\d+[.)])?\s*(?:\*\*|__)?\s*"
+    r"\[(RESEARCH|DELIVERABLE)\]((?:\s*\[[A-Z]+\])*)\s*(?:\*\*|__)?\s*:?\s*(.*)$"
+)
+
+
+@dataclass(frozen=True)
+class PlanGoal:
+    """A single goal of the research plan.
+
+    Attributes:
+        kind (str): "RESEARCH" or "DELIVERABLE".
+        text (str): The goal without its task type and status tags.
+        tags (tuple[str, ...]): Status tags such as "MODIFIED", "NEW" or "IMPLIED".
+    """
+
+    kind: GoalKind
+    text: str
+    tags: tuple[str, ...] = ()
+
+
+def parse_research_plan(plan: str) -> list[PlanGoal]:
+    """Extracts the classified goals of a research plan in plan order.
+
+    Lines without a `[RESEARCH]` or `[DELIVERABLE]` prefix are ignored.
+
+    Args:
+        plan (str): The `research_plan` text written by `plan_generator`.
+
+    Returns:
+        list[PlanGoal]: The goals in the order they appear.
+    """
+    goals = []
+    for line in plan.splitlines():
+        match = _GOAL_LINE.match(line)
+        if not match:
+            continue
+        kind, tags, text = match.groups()
+        text = text.replace("**", "").strip()
+        if text:
+            goals.append(
+                PlanGoal(
+                    # The pattern only matches the two kinds.
+                    kind=cast(GoalKind, kind),
+                    text=text,
+                    tags=tuple(re.findall(r"[A-Z]+", tags)),
+                )
+            )
+    return goals
+
+
+def normalize_plan(plan: str) -> str:
+    """Returns the canonical form of a research plan, used as cache key.
+
+    Only the classified goals count: their task type and text, lowercased and
+    with collapsed whitespace. Status tags, Markdown emphasis and the text
+    around the bullets are ignored. A plan without classified goals is
+    normalized as a whole.
+
+    Args:
+        plan (str): The `research_plan` text.
+
+    Returns:
+        str: One `KIND: text` line per goal.
+    """
+    goals = parse_research_plan(plan)
+    if not goals:
+        return " ".join(plan.casefold().split())
+    return "\n".join(
+        f"{goal.kind}: {' '.join(goal.text.casefold().split())}" for goal in goals
+    )
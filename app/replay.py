@@ -0,0 +1,306 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Record/replay of model and search traffic.
+
+`RecordingLlm` and `RecordingSearchBackend` forward to the real model and
+search backend. They append every model response, with its grounding
+metadata, and every search result to a JSONL fixture. `ReplayLlm` and
+`ReplaySearchBackend` answer from that fixture, so a recorded session runs
+again offline. Model calls are matched per agent, in call order. The agent
+is read from the identity line ADK adds to every system instruction.
+
+`substitute_backends` swaps these, or the stubs of `benchmarks.stubs`, into
+an agent tree for the duration of a `with` block.
+
+Usage:
+    python -m app.replay record fixture.jsonl "Research ADK callbacks" "sim"
+    python -m app.replay replay fixture.jsonl "Research ADK callbacks" "sim"
+"""
+
+import argparse
+import asyncio
+import contextlib
+import inspect
+import json
+import re
+from collections import defaultdict
+from collections.abc import AsyncGenerator, Callable, Iterator
+from pathlib import Path
+from typing import Any
+
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.genai import types as genai_types
+from pydantic import PrivateAttr
+
+from .agent_cache import AgentCache
+from .search import (
+    SearchBackend,
+    SearchResult,
+    SearchTool,
+    normalize_query,
+)
+from .tracing import iter_agents
+
+_AGENT_NAME = re.compile(r'Your internal name is "([^"]+)"')
+
+
+def request_agent(llm_request: LlmRequest) -> str:
+    """Returns the name of the agent that issued `llm_request`."""
+    config = llm_request.config
+    instruction = config.system_instruction if config else None
+    match = _AGENT_NAME.search(str(instruction or ""))
+    return match.group(1) if match else ""
+
+
+class FixtureRecorder:
+    """Appends recorded model calls and search results to a JSONL file."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text("", encoding="utf-8")
+
+    def _append(self, record: dict[str, Any]) -> None:
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def record_model_call(self, agent: str, responses: list[LlmResponse]) -> None:
+        self._append(
+            {
+                "kind": "model",
+                "agent": agent,
+                "responses": [
+                    r.model_dump(mode="json", exclude_none=True) for r in responses
+                ],
+            }
+        )
+
+    def record_search(self, result: SearchResult) -> None:
+        self._append(
+            {
+                "kind": "search",
+                "result": result.model_dump(mode="json", exclude_none=True),
+            }
+        )
+
+
+class Fixture:
+    """The model calls and search results of a recorded session.
+
+    Args:
+        path (str | Path): A file written by `FixtureRecorder`.
+    """
+
+    def __init__(self, path: str | Path):
+        self.model_calls: dict[str, list[list[LlmResponse]]] = defaultdict(list)
+        self.searches: dict[str, SearchResult] = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record["kind"] == "model":
+                    self.model_calls[record["agent"]].append(
+                        [LlmResponse.model_validate(r) for r in record["responses"]]
+                    )
+                else:
+                    result = SearchResult.model_validate(record["result"])
+                    self.searches[normalize_query(result.query)] = result
+
+
+class RecordingLlm(BaseLlm):
+    """Forwards to `inner` and records its final (non-partial) responses."""
+
+    inner: BaseLlm
+    recorder: FixtureRecorder
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        responses = []
+        async for response in self.inner.generate_content_async(llm_request, stream):
+            if not response.partial:
+                responses.append(response)
+            yield response
+        self.recorder.record_model_call(request_agent(llm_request), responses)
+
+
+class ReplayLlm(BaseLlm):
+    """Answers each agent with its recorded responses, in call order."""
+
+    fixture: Fixture
+    _served: dict[str, int] = PrivateAttr(default_factory=lambda: defaultdict(int))
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        agent = request_agent(llm_request)
+        index = self._served[agent]
+        calls = self.fixture.model_calls.get(agent, [])
+        if index >= len(calls):
+            raise LookupError(
+                f"The fixture has {len(calls)} recorded calls for {agent!r}; "
+                f"call #{index + 1} was not recorded."
+            )
+        self._served[agent] += 1
+        for response in calls[index]:
+            yield response.model_copy(deep=True)
+
+
+class RecordingSearchBackend:
+    """Forwards to `backend` and records every result."""
+
+    def __init__(self, backend: SearchBackend, recorder: FixtureRecorder):
+        self.backend = backend
+        self.recorder = recorder
+
+    async def search(self, query: str) -> SearchResult:
+        result = await self.backend.search(query)
+        self.recorder.record_search(result)
+        return result
+
+
+class ReplaySearchBackend:
+    """Answers searches with the recorded result of the same normalized query."""
+
+    def __init__(self, fixture: Fixture):
+        self.fixture = fixture
+
+    async def search(self, query: str) -> SearchResult:
+        if (result := self.fixture.searches.get(normalize_query(query))) is None:
+            raise LookupError(f"The fixture has no recorded result for {query!r}.")
+        return result
+
+
+def _agent_caches(agent: BaseAgent) -> list[AgentCache]:
+    """Returns the caches whose callbacks are attached to `agent`."""
+    caches = []
+    for slot in ("before_agent_callback", "after_agent_callback"):
+        callbacks = getattr(agent, slot)
+        for callback in callbacks if isinstance(callbacks, list) else [callbacks]:
+            owner = (
+                getattr(inspect.unwrap(callback), "__self__", None)
+                if callback
+                else None
+            )
+            if isinstance(owner, AgentCache):
+                caches.append(owner)
+    return caches
+
+
+@contextlib.contextmanager
+def substitute_backends(
+    root: BaseAgent,
+    model: Callable[[LlmAgent], BaseLlm],
+    search_backend: Callable[[SearchTool], SearchBackend] | None = None,
+) -> Iterator[None]:
+    """Swaps the models and search backends of an agent tree temporarily.
+
+    The search cache and agent caches such as the plan cache are disabled
+    inside the block, so every search and agent reaches the substituted
+    backends and none of their results are cached on disk.
+
+    Args:
+        root (BaseAgent): The agent tree, e.g. `app.agent.root_agent`.
+        model (Callable[[LlmAgent], BaseLlm]): Builds the model of an agent.
+        search_backend (Callable[[SearchTool], SearchBackend] | None): Builds
+            the backend of a `SearchTool`; None keeps the backends.
+    """
+    saved_models: list[tuple[LlmAgent, Any]] = []
+    saved_tools: dict[int, tuple[SearchTool, SearchBackend, Any]] = {}
+    saved_caches: dict[int, tuple[AgentCache, bool]] = {}
+    try:
+        for agent in iter_agents(root):
+            for agent_cache in _agent_caches(agent):
+                saved_caches.setdefault(
+                    id(agent_cache), (agent_cache, agent_cache.enabled)
+                )
+                agent_cache.enabled = False
+            if not isinstance(agent, LlmAgent):
+                continue
+            saved_models.append((agent, agent.model))
+            agent.model = model(agent)
+            for tool in agent.tools:
+                if isinstance(tool, SearchTool) and id(tool) not in saved_tools:
+                    saved_tools[id(tool)] = (tool, tool.backend, tool.cache)
+                    if search_backend is not None:
+                        tool.backend = search_backend(tool)
+                    tool.cache = None
+        yield
+    finally:
+        for agent, saved in saved_models:
+            agent.model = saved
+        for tool, backend, cache in saved_tools.values():
+            tool.backend, tool.cache = backend, cache
+        for agent_cache, enabled in saved_caches.values():
+            agent_cache.enabled = enabled
+
+
+async def run_conversation(
+    root: BaseAgent, messages: list[str], state: dict[str, Any] | None = None
+) -> dict[str, Any]:
+    """Sends `messages` to `root` in one session and returns the final state."""
+    runner = InMemoryRunner(agent=root, app_name="replay")
+    session = await runner.session_service.create_session(
+        app_name="replay", user_id="replay", state=state or {}
+    )
+    for message in messages:
+        async for _ in runner.run_async(
+            user_id="replay",
+            session_id=session.id,
+            new_message=genai_types.Content(
+                role="user", parts=[genai_types.Part(text=message)]
+            ),
+        ):
+            pass
+    finished = await runner.session_service.get_session(
+        app_name="replay", user_id="replay", session_id=session.id
+    )
+    return finished.state if finished else {}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record or replay a session.")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("fixture", help="JSONL fixture file.")
+    parser.add_argument("messages", nargs="+", help="User turns, in order.")
+    args = parser.parse_args()
+
+    from .agent import root_agent
+
+    if args.mode == "record":
+        recorder = FixtureRecorder(args.fixture)
+        substitution = substitute_backends(
+            root_agent,
+            lambda agent: RecordingLlm(
+                model=agent.canonical_model.model,
+                inner=agent.canonical_model,
+                recorder=recorder,
+            ),
+            lambda tool: RecordingSearchBackend(tool.backend, recorder),
+        )
+    else:
+        fixture = Fixture(args.fixture)
+        replay_llm = ReplayLlm(model="gemini-2-replay", fixture=fixture)
+        substitution = substitute_backends(
+            root_agent,
+            lambda agent: replay_llm,
+            lambda tool: ReplaySearchBackend(fixture),
+        )
+    with substitution:
+        final_state = asyncio.run(run_conversation(root_agent, args.messages))
+    print(final_state.get("final_report_with_citations", "(no report)"))
@@ -0,0 +1,172 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers for composing the report one outline section at a time.
+
+The `report_sections` outline is split on its top-level headings. Each section
+gets the findings sections and sources whose terms overlap it most. Sources are
+renumbered `src-1..src-k` locally, so a section writer never sees, and cannot
+cite, ids outside its own digest. `remap_citations` maps the local tags back
+to the global `src-N` ids.
+"""
+
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any
+
+from .citations import CITE_TAG
+from .corpus_index import tokenize
+from .findings import current_sections
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$", re.MULTILINE)
+
+
+@dataclass(frozen=True)
+class OutlineSection:
+    """A top-level section of the report outline."""
+
+    level: int
+    title: str
+    outline: str
+
+    @property
+    def heading(self) -> str:
+        return f"{'#' * self.level} {self.title}"
+
+
+@dataclass(frozen=True)
+class SectionRoute:
+    """The material routed to one section writer."""
+
+    findings: str
+    sources: dict[str, dict[str, Any]]
+    local_to_global: dict[str, str]
+
+
+def split_outline(outline: str) -> list[OutlineSection]:
+    """Splits a Markdown outline on its shallowest heading level.
+
+    Deeper headings and bullets stay in the `outline` text of their section.
+    An outline without headings becomes a single "Report" section.
+
+    Args:
+        outline (str): The `report_sections` text.
+
+    Returns:
+        list[OutlineSection]: The sections in outline order.
+    """
+    headings = list(_HEADING.finditer(outline))
+    if not headings:
+        return [OutlineSection(level=1, title="Report", outline=outline.strip())]
+    level = min(len(match.group(1)) for match in headings)
+    top = [match for match in headings if len(match.group(1)) == level]
+    sections = []
+    for match, following in zip(top, [*top[1:], None], strict=True):
+        end = following.start() if following else len(outline)
+        sections.append(
+            OutlineSection(
+                level=level,
+                title=match.group(2),
+                outline=outline[match.end() : end].strip(),
+            )
+        )
+    return sections
+
+
+def _overlap(query_terms: set[str], text: str) -> float:
+    terms = set(tokenize(text))
+    if not terms:
+        return 0.0
+    return len(query_terms & terms) / len(terms) ** 0.5
+
+
+def route_section(
+    section: OutlineSection,
+    findings_records: list[dict[str, Any]],
+    sources: dict[str, dict[str, Any]],
+    max_findings: int,
+    max_sources: int,
+) -> SectionRoute:
+    """Selects the findings and sources a section writer needs.
+
+    Findings sections are ranked by term overlap with the section outline, and
+    sources by overlap of their title and claims with the section and its
+    routed findings. Sources keep their global order under local ids.
+
+    Args:
+        section (OutlineSection): The section to write.
+        findings_records (list[dict[str, Any]]): The `findings_sections` records.
+        sources (dict[str, dict[str, Any]]): The `sources` registry.
+        max_findings (int): Findings sections routed per section.
+        max_sources (int): Sources routed per section.
+
+    Returns:
+        SectionRoute: The routed findings text and locally numbered sources.
+    """
+    section_terms = set(tokenize(f"{section.title}\n{section.outline}"))
+    findings = sorted(
+        current_sections(findings_records).values(),
+        key=lambda r: -_overlap(section_terms, f"{r['title']}\n{r['text']}"),
+    )[:max_findings]
+    findings_text = "\n\n".join(
+        f"## {record['title']}\n\n{record['text']}" for record in findings
+    )
+
+    routed_terms = section_terms | set(tokenize(findings_text))
+    scores = {
+        short_id: _overlap(
+            routed_terms,
+            " ".join(
+                [source.get("title") or ""]
+                + [claim["text_segment"] for claim in source["supported_claims"]]
+            ),
+        )
+        for short_id, source in sources.items()
+    }
+    chosen = sorted(
+        (short_id for short_id, score in scores.items() if score > 0),
+        key=lambda short_id: -scores[short_id],
+    )[:max_sources]
+    position = {short_id: index for index, short_id in enumerate(sources)}
+    chosen.sort(key=position.__getitem__)
+
+    local_sources, local_to_global = {}, {}
+    for number, global_id in enumerate(chosen, start=1):
+        local_id = f"src-{number}"
+        local_sources[local_id] = {**sources[global_id], "short_id": local_id}
+        local_to_global[local_id] = global_id
+    return SectionRoute(findings_text, local_sources, local_to_global)
+
+
+def remap_citations(text: str, local_to_global: dict[str, str]) -> str:
+    """Rewrites local citation tags to the global `src-N` ids.
+
+    Tags citing an id that was not routed to the section are removed.
+
+    Args:
+        text (str): A section written with local ids.
+        local_to_global (dict[str, str]): The mapping from `route_section`.
+
+    Returns:
+        str: The section with `<cite source="src-N"/>` tags using global ids.
+    """
+
+    def replace(match: re.Match) -> str:
+        if global_id := local_to_global.get(match.group(1)):
+            return f'<cite source="{global_id}"/>'
+        logging.warning(f"Citation to an unrouted source removed: {match.group(0)}")
+        return ""
+
+    return CITE_TAG.sub(replace, text)
@@ -0,0 +1,538 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Deadlines, retries and hedging for model and search calls.
+
+Every call goes through a `ResilientCaller` shared by the whole agent tree.
+A call has a deadline, and each attempt a timeout. Attempts that time out
+or fail with a transient error (429, 5xx, connection errors) are retried
+after a jittered exponential backoff. When the error carries a retry-after
+hint, the retry waits at least that long, and so does every other call to
+the same model. A token bucket per model spaces out attempts against the
+model's quota.
+
+Idempotent calls, such as evaluations and searches, can be hedged: when an
+attempt is slower than the recent p95 latency of its route, a duplicate is
+sent and the first answer wins.
+
+`ResilientLlm` applies this to a model and `ResilientSearchBackend` to a
+search backend. `apply_resilience` wraps the models of an agent tree.
+"""
+
+import asyncio
+import datetime
+import email.utils
+import itertools
+import logging
+import random
+import time
+from collections import defaultdict, deque
+from collections.abc import AsyncGenerator, AsyncIterator, Awaitable, Callable
+from dataclasses import asdict, dataclass
+from typing import Any, TypeVar
+
+import httpx
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.models.registry import LLMRegistry
+from google.genai import errors as genai_errors
+from pydantic import PrivateAttr
+
+from .routing import RoutedLlm
+from .search import SearchBackend, SearchResult
+from .throttling import AsyncRateLimiter
+from .tracing import iter_agents
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when a call runs out of time, including its retries."""
+
+
+@dataclass(frozen=True)
+class CallPolicy:
+    """How one route calls its model or backend.
+
+    Attributes:
+        deadline_s (float): Time for the whole call, retries included. Zero
+            disables the deadline.
+        attempt_timeout_s (float): Time for one attempt before it is
+            retried. Zero leaves each attempt the rest of the deadline.
+        max_attempts (int): Attempts before the last error is raised.
+        backoff_base_s (float): Backoff cap after the first failed attempt;
+            it doubles with every further attempt.
+        backoff_max_s (float): Largest backoff cap.
+        hedge (bool): Send a duplicate of slow attempts. Only for
+            idempotent calls.
+        hedge_quantile (float): Attempts slower than this quantile of the
+            route's recent latencies are hedged.
+        hedge_min_samples (int): Latencies of a route before it is hedged.
+    """
+
+    deadline_s: float = 0.0
+    attempt_timeout_s: float = 0.0
+    max_attempts: int = 4
+    backoff_base_s: float = 1.0
+    backoff_max_s: float = 30.0
+    hedge: bool = False
+    hedge_quantile: float = 0.95
+    hedge_min_samples: int = 20
+
+
+@dataclass
+class CallMetrics:
+    """Totals of the calls of one route and model."""
+
+    calls: int = 0
+    attempts: int = 0
+    retries: int = 0
+    throttled: int = 0
+    timeouts: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    failures: int = 0
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether an attempt that raised `error` may be retried."""
+    if isinstance(error, genai_errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES
+    return isinstance(
+        error,
+        (asyncio.TimeoutError, TimeoutError, ConnectionError, httpx.TransportError),
+    ) and not isinstance(error, DeadlineExceededError)
+
+
+def retry_after_seconds(error: BaseException) -> float | None:
+    """Returns the server's retry hint of an error, or None without one.
+
+    The hint is read from a `Retry-After` header, in seconds or as an HTTP
+    date, or from the `RetryInfo` detail of a Google API error.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                when = email.utils.parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                when = None
+            if when is not None:
+                now = datetime.datetime.now(when.tzinfo or datetime.timezone.utc)
+                return max(0.0, (when - now).total_seconds())
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        body = details.get("error", details)
+        infos = body.get("details") if isinstance(body, dict) else None
+        for detail in infos or []:
+            if isinstance(detail, dict) and str(detail.get("@type", "")).endswith(
+                "RetryInfo"
+            ):
+                try:
+                    return max(
+                        0.0, float(str(detail.get("retryDelay", "")).rstrip("s"))
+                    )
+                except ValueError:
+                    return None
+    return None
+
+
+def backoff_delay(
+    attempt: int,
+    policy: CallPolicy,
+    retry_after: float | None = None,
+    rng: random.Random | None = None,
+) -> float:
+    """Returns the wait before retrying after the `attempt`-th failure.
+
+    Without a hint, the wait is drawn uniformly below a cap that doubles
+    with every attempt ("full jitter"). With a hint, it is the hint plus up
+    to `backoff_base_s`, so throttled callers do not retry in lockstep.
+    """
+    uniform = rng.uniform if rng is not None else random.uniform
+    if retry_after is not None:
+        return retry_after + uniform(0, policy.backoff_base_s)
+    cap = min(policy.backoff_max_s, policy.backoff_base_s * 2 ** (attempt - 1))
+    return uniform(0, cap)
+
+
+class ResilientCaller:
+    """Runs calls with deadlines, retries, hedging and per-model rate limits.
+
+    Args:
+        rate_limits (dict[str, tuple[float, int]] | None): Requests per
+            second and burst of each model; other models are not limited.
+        window (int): Recent latencies per route for its hedging delay.
+        clock (Callable[[], float]): Monotonic time source.
+        rng (random.Random | None): Source of backoff jitter.
+    """
+
+    def __init__(
+        self,
+        rate_limits: dict[str, tuple[float, int]] | None = None,
+        window: int = 200,
+        clock: Callable[[], float] = time.monotonic,
+        rng: random.Random | None = None,
+    ):
+        self.rate_limits = dict(rate_limits or {})
+        self._clock = clock
+        self._rng = rng or random.Random()
+        self._limiters: dict[str, AsyncRateLimiter] = {}
+        self._resume_at: dict[str, float] = {}
+        self._latencies: dict[tuple[str, str], deque[float]] = defaultdict(
+            lambda: deque(maxlen=window)
+        )
+        self._metrics: dict[tuple[str, str], CallMetrics] = defaultdict(CallMetrics)
+
+    def limiter(self, model: str) -> AsyncRateLimiter:
+        """Returns the token bucket shared by every call to `model`."""
+        if model not in self._limiters:
+            rate, burst = self.rate_limits.get(model, (0.0, 1))
+            self._limiters[model] = AsyncRateLimiter(rate, burst, clock=self._clock)
+        return self._limiters[model]
+
+    def hedge_delay(self, route: str, model: str, policy: CallPolicy) -> float | None:
+        """Returns how long an attempt runs before it is hedged, or None."""
+        samples = self._latencies.get((route, model))
+        if not policy.hedge or not samples or len(samples) < policy.hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(policy.hedge_quantile * len(ordered)))]
+
+    async def call(
+        self,
+        route: str,
+        model: str,
+        policy: CallPolicy,
+        attempt: Callable[[], Awaitable[T]],
+    ) -> T:
+        """Runs `attempt` until it succeeds, fails for good or runs out of time.
+
+        Args:
+            route (str): What makes the call, e.g. an agent name.
+            model (str): The model or backend called, for rate limits.
+            policy (CallPolicy): Deadline, retries and hedging of the call.
+            attempt (Callable[[], Awaitable[T]]): Starts one attempt; it is
+                called once per attempt and hedge.
+
+        Returns:
+            T: The result of the first successful attempt.
+
+        Raises:
+            DeadlineExceededError: When the deadline passes first.
+        """
+        metrics = self._metrics[(route, model)]
+        metrics.calls += 1
+        deadline = self._clock() + policy.deadline_s if policy.deadline_s else None
+        number = 0
+        while True:
+            number += 1
+            timeout = policy.attempt_timeout_s or None
+            if deadline is not None:
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    metrics.failures += 1
+                    raise DeadlineExceededError(
+                        f"{route} gave up on {model} after {policy.deadline_s}s."
+                    )
+                timeout = min(timeout or remaining, remaining)
+            started = self._clock()
+            try:
+                result = await self._attempt(route, model, policy, attempt, timeout)
+            except Exception as error:
+                delay = self._retry_delay(route, model, policy, error, number, deadline)
+                if delay is None:
+                    metrics.failures += 1
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._latencies[(route, model)].append(self._clock() - started)
+            return result
+
+    async def stream(
+        self,
+        route: str,
+        model: str,
+        policy: CallPolicy,
+        attempt: Callable[[], AsyncIterator[T]],
+    ) -> AsyncGenerator[T, None]:
+        """Streams the items of `attempt`, retrying it until the first item.
+
+        Streams are neither hedged nor bound by deadlines, since their items
+        are passed on as they arrive.
+        """
+        metrics = self._metrics[(route, model)]
+        metrics.calls += 1
+        for number in itertools.count(1):
+            started = False
+            try:
+                await self._admit(model)
+                metrics.attempts += 1
+                async for item in attempt():
+                    started = True
+                    yield item
+                return
+            except Exception as error:
+                delay = (
+                    None
+                    if started
+                    else self._retry_delay(route, model, policy, error, number, None)
+                )
+                if delay is None:
+                    metrics.failures += 1
+                    raise
+                await asyncio.sleep(delay)
+
+    def metrics(self) -> dict[str, dict[str, Any]]:
+        """Returns the metrics of every route, keyed "route/model"."""
+        result = {}
+        for (route, model), metrics in sorted(self._metrics.items()):
+            entry: dict[str, Any] = asdict(metrics)
+            latencies = sorted(self._latencies.get((route, model)) or ())
+            if latencies:
+                entry["p50_s"] = round(latencies[len(latencies) // 2], 3)
+                entry["p95_s"] = round(latencies[int(0.95 * (len(latencies) - 1))], 3)
+            result[f"{route}/{model}"] = entry
+        return result
+
+    async def _admit(self, model: str) -> None:
+        """Waits out a retry-after pause of `model`, then for a token."""
+        pause = self._resume_at.get(model, 0.0) - self._clock()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        await self.limiter(model).acquire()
+
+    async def _attempt(
+        self,
+        route: str,
+        model: str,
+        policy: CallPolicy,
+        attempt: Callable[[], Awaitable[T]],
+        timeout: float | None,
+    ) -> T:
+        """Runs one attempt, with a hedge when it gets slow."""
+        metrics = self._metrics[(route, model)]
+
+        async def admitted() -> T:
+            await self._admit(model)
+            metrics.attempts += 1
+            return await attempt()
+
+        loop = asyncio.get_running_loop()
+        ends_at = loop.time() + timeout if timeout is not None else None
+        primary = asyncio.ensure_future(admitted())
+        pending = {primary}
+        hedge_delay = self.hedge_delay(route, model, policy)
+        error: BaseException | None = None
+        try:
+            if hedge_delay is not None and (timeout is None or hedge_delay < timeout):
+                await asyncio.wait(pending, timeout=hedge_delay)
+                if not primary.done():
+                    metrics.hedges += 1
+                    pending.add(asyncio.ensure_future(admitted()))
+            while pending:
+                remaining = ends_at - loop.time() if ends_at is not None else None
+                if remaining is not None and remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        metrics.hedge_wins += task is not primary
+                        return task.result()
+                    error = task.exception()
+            if error is not None and not pending:
+                raise error
+            metrics.timeouts += 1
+            raise asyncio.TimeoutError(
+                f"{route} attempt on {model} took over {timeout}s."
+            )
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _retry_delay(
+        self,
+        route: str,
+        model: str,
+        policy: CallPolicy,
+        error: BaseException,
+        attempt: int,
+        deadline: float | None,
+    ) -> float | None:
+        """Returns the backoff before the next attempt, or None to give up.
+
+        Raises:
+            DeadlineExceededError: When the retry would start after `deadline`.
+        """
+        if not is_retryable(error) or attempt >= policy.max_attempts:
+            return None
+        metrics = self._metrics[(route, model)]
+        retry_after = retry_after_seconds(error)
+        if isinstance(error, genai_errors.APIError) and error.code == 429:
+            metrics.throttled += 1
+        now = self._clock()
+        if retry_after is not None:
+            self._resume_at[model] = max(
+                self._resume_at.get(model, 0.0), now + retry_after
+            )
+        delay = backoff_delay(attempt, policy, retry_after, self._rng)
+        if deadline is not None and now + delay >= deadline:
+            metrics.failures += 1
+            raise DeadlineExceededError(
+                f"{route} gave up on {model} after {policy.deadline_s}s."
+            ) from error
+        metrics.retries += 1
+        logging.warning(
+            f"[{route}] Attempt {attempt} on {model} failed ({error}); "
+            f"retrying in {delay:.2f}s."
+        )
+        return delay
+
+
+class ResilientLlm(BaseLlm):
+    """Calls a model through a `ResilientCaller`.
+
+    Each attempt and hedge gets its own copy of the request, since models
+    may modify the request they are given.
+
+    Attributes:
+        route (str): The route of the calls, e.g. the agent name.
+        policy (CallPolicy): Deadline, retries and hedging of the calls.
+        caller (ResilientCaller): Shared retry state and rate limits.
+        llm (BaseLlm | None): The wrapped model; None resolves `model` from
+            the ADK model registry.
+    """
+
+    route: str
+    policy: CallPolicy
+    caller: ResilientCaller
+    llm: BaseLlm | None = None
+    _resolved: BaseLlm | None = PrivateAttr(default=None)
+
+    def _inner(self) -> BaseLlm:
+        if self.llm is not None:
+            return self.llm
+        if self._resolved is None:
+            self._resolved = LLMRegistry.new_llm(self.model)
+        return self._resolved
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        llm = self._inner()
+        model = llm_request.model or self.model
+
+        def request() -> LlmRequest:
+            return llm_request.model_copy(
+                update={"contents": list(llm_request.contents)}
+            )
+
+        if stream:
+            async for response in self.caller.stream(
+                self.route,
+                model,
+                self.policy,
+                lambda: llm.generate_content_async(request(), stream=True),
+            ):
+                yield response
+            return
+
+        async def attempt() -> list[LlmResponse]:
+            return [
+                response
+                async for response in llm.generate_content_async(
+                    request(), stream=False
+                )
+            ]
+
+        for response in await self.caller.call(self.route, model, self.policy, attempt):
+            yield response
+
+
+class ResilientSearchBackend:
+    """A search backend whose searches go through a `ResilientCaller`.
+
+    Args:
+        backend (SearchBackend): The wrapped backend.
+        caller (ResilientCaller): Shared retry state and rate limits.
+        policy (CallPolicy): Deadline, retries and hedging of searches.
+        model (str): The model the backend calls, for its rate limit.
+        route (str): The route of the searches.
+    """
+
+    def __init__(
+        self,
+        backend: SearchBackend,
+        caller: ResilientCaller,
+        policy: CallPolicy,
+        model: str,
+        route: str = "search",
+    ):
+        self.backend = backend
+        self.caller = caller
+        self.policy = policy
+        self.model = model
+        self.route = route
+
+    async def search(self, query: str) -> SearchResult:
+        return await self.caller.call(
+            self.route, self.model, self.policy, lambda: self.backend.search(query)
+        )
+
+
+def apply_resilience(
+    root: BaseAgent, caller: ResilientCaller, policy: Callable[[str], CallPolicy]
+) -> None:
+    """Routes the model calls of every agent below `root` through `caller`.
+
+    Routed models keep their routing; each of their tiers is wrapped
+    instead. Agents that inherit their model, or are wrapped already, are
+    left alone.
+
+    Args:
+        root (BaseAgent): The agent tree, e.g. `app.agent.root_agent`.
+        caller (ResilientCaller): Shared by every wrapped model.
+        policy (Callable[[str], CallPolicy]): Returns the policy of an agent
+            by name.
+    """
+    for agent in iter_agents(root):
+        if not isinstance(agent, LlmAgent) or not agent.model:
+            continue
+        model = agent.model
+        if isinstance(model, RoutedLlm):
+            for tier in model.router.tiers:
+                if not isinstance(model.models.get(tier), ResilientLlm):
+                    model.models[tier] = ResilientLlm(
+                        model=tier,
+                        route=agent.name,
+                        policy=policy(agent.name),
+                        caller=caller,
+                        llm=model.models.get(tier),
+                    )
+        elif not isinstance(model, ResilientLlm):
+            agent.model = ResilientLlm(
+                model=model if isinstance(model, str) else model.model,
+                route=agent.name,
+                policy=policy(agent.name),
+                caller=caller,
+                llm=None if isinstance(model, str) else model,
+            )
@@ -0,0 +1,331 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Routing of model calls across tiers of weaker and stronger models.
+
+A routed agent gets a `RoutedLlm` with its task class as model. Before each
+call, `ModelRouter.choose` picks a tier for the class from the prompt size,
+the refinement iteration, whether the call revises an earlier answer, and
+the recent pass rate of the class on that tier. The choice is written to
+`llm_request.model`. `RoutedLlm` then runs the call on that tier and
+escalates to the next stronger one when the answer is unusable: an error
+response or a raised API error such as a 429 or 5xx, no content, or
+structured output that does not validate against the request's response
+schema.
+
+Every attempt is recorded per route, i.e. task class and model: calls,
+failures, escalations, latency, tokens and cost.
+"""
+
+import logging
+import time
+from collections import defaultdict, deque
+from collections.abc import AsyncGenerator, Sequence
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.models.registry import LLMRegistry
+from pydantic import BaseModel, Field, PrivateAttr, ValidationError
+
+
+@dataclass(frozen=True)
+class RouteRule:
+    """How a task class picks its tier; indices count from the weakest tier.
+
+    Attributes:
+        tier (int): The tier of a plain call.
+        revision_tier (int | None): The tier of calls that revise an earlier
+            answer, such as plan refinements; None uses `tier`.
+        max_prompt_tokens (int): Larger estimated prompts go one tier up.
+            Zero disables the limit.
+        escalate_from_iteration (int): From this refinement loop iteration
+            on, calls go one tier up. Zero disables it.
+        min_pass_rate (float): When the class's recent pass rate on the
+            chosen tier is lower, calls go one tier up.
+        min_samples (int): Calls on a tier before its pass rate counts.
+    """
+
+    tier: int = 0
+    revision_tier: int | None = None
+    max_prompt_tokens: int = 0
+    escalate_from_iteration: int = 0
+    min_pass_rate: float = 0.0
+    min_samples: int = 5
+
+
+@dataclass
+class RouteMetrics:
+    """Totals of the attempts of one route."""
+
+    calls: int = 0
+    failures: int = 0
+    escalated_in: int = 0
+    latency_s: float = 0.0
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    cost_usd: float = 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        metrics = asdict(self)
+        metrics["latency_s"] = round(self.latency_s, 3)
+        metrics["mean_latency_s"] = (
+            round(self.latency_s / self.calls, 3) if self.calls else 0.0
+        )
+        metrics["pass_rate"] = (
+            round(1 - self.failures / self.calls, 3) if self.calls else 0.0
+        )
+        metrics["cost_usd"] = round(self.cost_usd, 6)
+        return metrics
+
+
+def estimate_prompt_tokens(llm_request: LlmRequest) -> int:
+    """Estimates the prompt size at one token per 4 characters."""
+    chars = (
+        len(str(llm_request.config.system_instruction or ""))
+        if llm_request.config
+        else 0
+    )
+    for content in llm_request.contents:
+        chars += sum(len(part.text or "") for part in content.parts or [])
+    return chars // 4
+
+
+class ModelRouter:
+    """Picks tiers per task class and keeps per-route metrics.
+
+    Args:
+        tiers (Sequence[str]): Model names, weakest first.
+        rules (dict[str, RouteRule]): Rule of each task class; unknown
+            classes use the strongest tier.
+        prices (dict[str, tuple[float, float]] | None): USD per million
+            prompt and output tokens of each model, for the cost metric.
+        window (int): Recent calls of a route that make its pass rate.
+    """
+
+    def __init__(
+        self,
+        tiers: Sequence[str],
+        rules: dict[str, RouteRule],
+        prices: dict[str, tuple[float, float]] | None = None,
+        window: int = 20,
+    ):
+        if not tiers:
+            raise ValueError("ModelRouter needs at least one model tier.")
+        self.tiers = list(tiers)
+        self.rules = dict(rules)
+        self.prices = dict(prices or {})
+        self._outcomes: dict[tuple[str, str], deque[bool]] = defaultdict(
+            lambda: deque(maxlen=window)
+        )
+        self._metrics: dict[tuple[str, str], RouteMetrics] = defaultdict(RouteMetrics)
+
+    def llm(self, task_class: str) -> "RoutedLlm":
+        """Returns the model of an agent of `task_class`."""
+        return RoutedLlm(model=self.tiers[-1], task_class=task_class, router=self)
+
+    def pass_rate(self, task_class: str, model: str) -> float | None:
+        """Returns the recent pass rate of a route, or None without samples."""
+        outcomes = self._outcomes.get((task_class, model))
+        return sum(outcomes) / len(outcomes) if outcomes else None
+
+    def choose(
+        self,
+        task_class: str,
+        prompt_tokens: int = 0,
+        iteration: int = 0,
+        revision: bool = False,
+    ) -> str:
+        """Picks the model of a call.
+
+        Args:
+            task_class (str): The calling agent's task class.
+            prompt_tokens (int): Estimated size of the prompt.
+            iteration (int): The refinement loop iteration, 0 outside it.
+            revision (bool): Whether the call revises an earlier answer.
+
+        Returns:
+            str: One of `tiers`.
+        """
+        rule = self.rules.get(task_class)
+        if rule is None:
+            return self.tiers[-1]
+        tier = (
+            rule.revision_tier
+            if revision and rule.revision_tier is not None
+            else rule.tier
+        )
+        if rule.max_prompt_tokens and prompt_tokens > rule.max_prompt_tokens:
+            tier += 1
+        if rule.escalate_from_iteration and iteration >= rule.escalate_from_iteration:
+            tier += 1
+        tier = min(max(tier, 0), len(self.tiers) - 1)
+        samples = len(self._outcomes.get((task_class, self.tiers[tier])) or ())
+        pass_rate = self.pass_rate(task_class, self.tiers[tier])
+        if (
+            pass_rate is not None
+            and samples >= rule.min_samples
+            and pass_rate < rule.min_pass_rate
+        ):
+            tier = min(tier + 1, len(self.tiers) - 1)
+        return self.tiers[tier]
+
+    def record(
+        self,
+        task_class: str,
+        model: str,
+        passed: bool,
+        latency_s: float,
+        response: LlmResponse | None,
+        escalated: bool = False,
+    ) -> None:
+        """Adds one attempt to the metrics of its route."""
+        self._outcomes[(task_class, model)].append(passed)
+        metrics = self._metrics[(task_class, model)]
+        metrics.calls += 1
+        metrics.failures += not passed
+        metrics.escalated_in += escalated
+        metrics.latency_s += latency_s
+        usage = response.usage_metadata if response else None
+        if usage:
+            prompt = usage.prompt_token_count or 0
+            output = (usage.candidates_token_count or 0) + (
+                usage.thoughts_token_count or 0
+            )
+            metrics.prompt_tokens += prompt
+            metrics.output_tokens += output
+            prompt_price, output_price = self.prices.get(model, (0.0, 0.0))
+            metrics.cost_usd += (prompt * prompt_price + output * output_price) / 1e6
+
+    def metrics(self) -> dict[str, dict[str, Any]]:
+        """Returns the metrics of every route, keyed "task_class/model"."""
+        return {
+            f"{task_class}/{model}": metrics.as_dict()
+            for (task_class, model), metrics in sorted(self._metrics.items())
+        }
+
+
+def _acceptable(llm_request: LlmRequest, response: LlmResponse | None) -> bool:
+    """Whether a final response can be used, or the call should escalate."""
+    if (
+        response is None
+        or response.error_code
+        or not (response.content and response.content.parts)
+    ):
+        return False
+    parts = response.content.parts
+    if any(part.function_call for part in parts):
+        return True
+    text = "".join(part.text or "" for part in parts if not part.thought)
+    if not text.strip():
+        return False
+    schema = llm_request.config.response_schema if llm_request.config else None
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        try:
+            schema.model_validate_json(text)
+        except (ValidationError, ValueError):
+            return False
+    return True
+
+
+class RoutedLlm(BaseLlm):
+    """Runs each call on the tier in `llm_request.model`, escalating on failure.
+
+    When `llm_request.model` is not a tier, e.g. without the routing
+    callback, the router chooses from the prompt size alone. Streamed calls
+    without a response schema are passed through as they arrive, so they can
+    not escalate once text was sent; other calls are buffered until their
+    final response was checked. An exception of the last tier, or of a call
+    that already streamed text, is raised to the caller.
+
+    Attributes:
+        task_class (str): The task class of the agent.
+        router (ModelRouter): Chooses tiers and keeps the metrics.
+        models (dict[str, BaseLlm]): Models of tiers, by name; other tiers
+            come from the ADK model registry.
+    """
+
+    task_class: str
+    router: ModelRouter
+    models: dict[str, BaseLlm] = Field(default_factory=dict)
+    _resolved: dict[str, BaseLlm] = PrivateAttr(default_factory=dict)
+
+    def _tier_llm(self, name: str) -> BaseLlm:
+        if name in self.models:
+            return self.models[name]
+        if name not in self._resolved:
+            self._resolved[name] = LLMRegistry.new_llm(name)
+        return self._resolved[name]
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        tiers = self.router.tiers
+        if llm_request.model not in tiers:
+            llm_request.model = self.router.choose(
+                self.task_class, estimate_prompt_tokens(llm_request)
+            )
+        start = tiers.index(llm_request.model)
+        structured = bool(llm_request.config and llm_request.config.response_schema)
+        escalated_from: list[str] = []
+        for tier in range(start, len(tiers)):
+            name = tiers[tier]
+            llm_request.model = name
+            passthrough = stream and not structured
+            responses: list[LlmResponse] = []
+            streamed = False
+            started = time.perf_counter()
+            error: Exception | None = None
+            try:
+                async for response in self._tier_llm(name).generate_content_async(
+                    llm_request, stream=stream
+                ):
+                    if passthrough and response.partial:
+                        streamed = True
+                        yield response
+                    else:
+                        responses.append(response)
+            except Exception as caught:
+                error = caught
+            final = next((r for r in reversed(responses) if not r.partial), None)
+            last_tier = tier == len(tiers) - 1
+            passed = error is None and _acceptable(llm_request, final)
+            self.router.record(
+                self.task_class,
+                name,
+                passed,
+                time.perf_counter() - started,
+                final,
+                escalated=bool(escalated_from),
+            )
+            if error is not None:
+                if last_tier or streamed:
+                    raise error
+                logging.warning(
+                    f"[{self.task_class}] {name} failed with {error!r}; escalating."
+                )
+            elif passed or last_tier or streamed:
+                if final is not None:
+                    final.custom_metadata = {
+                        **(final.custom_metadata or {}),
+                        "route": {
+                            "task_class": self.task_class,
+                            "model": name,
+                            "escalated_from": escalated_from,
+                        },
+                    }
+                for response in responses:
+                    yield response
+                return
+            escalated_from.append(name)
@@ -0,0 +1,218 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Admission control and fair scheduling of concurrent research runs.
+
+One server process runs the pipelines of every user. `RunScheduler` bounds
+how many run at once, overall and per user and session. Runs beyond the
+limits wait in a priority queue and see their position while they wait.
+Runs beyond the queue capacity are rejected. The queue is served by
+priority, lower first, and waiting lowers a run's priority over time, so
+long plans are not starved.
+"""
+
+import asyncio
+import itertools
+import time
+from collections.abc import AsyncGenerator, Callable
+from dataclasses import dataclass, field
+from typing import Literal
+
+
+class QueueFullError(Exception):
+    """Raised by `RunScheduler.submit` when no run can be queued."""
+
+
+@dataclass(eq=False)
+class RunTicket:
+    """A run's place in the scheduler, from submission to release.
+
+    Attributes:
+        user_id (str): The user the run belongs to.
+        session_id (str): The session the run belongs to.
+        priority (float): Lower runs first.
+        sequence (int): Submission order, breaking priority ties.
+        status (str): "queued", "running", "cancelled" or "done".
+        position (int): 1-based queue position while queued, else 0.
+        submitted_at (float): Clock time of the submission.
+        admitted_at (float | None): Clock time the run started.
+    """
+
+    user_id: str
+    session_id: str
+    priority: float
+    sequence: int
+    submitted_at: float
+    status: Literal["queued", "running", "cancelled", "done"] = "queued"
+    position: int = 0
+    admitted_at: float | None = None
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def cancelled(self) -> bool:
+        return self.status == "cancelled"
+
+    @property
+    def waited_s(self) -> float:
+        return (self.admitted_at or self.submitted_at) - self.submitted_at
+
+
+class RunScheduler:
+    """Bounds concurrent runs globally and per user and session.
+
+    Args:
+        max_concurrent (int): Runs at once on this server.
+        max_per_user (int): Runs at once of one user.
+        max_per_session (int): Runs at once of one session.
+        max_queued (int): Waiting runs; more are rejected.
+        aging_seconds (float): Every this many seconds of waiting lower a
+            run's priority by one. Zero disables aging.
+        clock (Callable[[], float]): Monotonic time source.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_per_user: int,
+        max_per_session: int,
+        max_queued: int,
+        aging_seconds: float = 0.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_per_user = max(1, max_per_user)
+        self.max_per_session = max(1, max_per_session)
+        self.max_queued = max_queued
+        self.aging_seconds = aging_seconds
+        self._clock = clock
+        self._sequence = itertools.count()
+        self.queued: list[RunTicket] = []
+        self.running: list[RunTicket] = []
+
+    def submit(self, user_id: str, session_id: str, priority: float = 0.0) -> RunTicket:
+        """Queues a run and starts it when the limits allow.
+
+        Raises:
+            QueueFullError: When `max_queued` runs are waiting already and
+                this one cannot start right away.
+        """
+        ticket = RunTicket(
+            user_id=user_id,
+            session_id=session_id,
+            priority=priority,
+            sequence=next(self._sequence),
+            submitted_at=self._clock(),
+        )
+        self.queued.append(ticket)
+        self._dispatch()
+        if ticket.status == "queued" and len(self.queued) > self.max_queued:
+            self.queued.remove(ticket)
+            self._update_positions()
+            raise QueueFullError(
+                f"{len(self.running)} runs in progress and {self.max_queued} waiting."
+            )
+        return ticket
+
+    async def wait(self, ticket: RunTicket) -> AsyncGenerator[int, None]:
+        """Yields the queue position of a ticket whenever it changes.
+
+        Returns once the run may start, or was cancelled.
+        """
+        reported = None
+        while ticket.status == "queued":
+            if ticket.position != reported:
+                reported = ticket.position
+                yield ticket.position
+            ticket._changed.clear()
+            await ticket._changed.wait()
+
+    def cancel(self, ticket: RunTicket) -> None:
+        """Cancels a queued or running run; a running one stops at its next step.
+
+        A queued run leaves the queue at once. A running run keeps its slot
+        until its owner calls `release`, so the next run only starts once
+        the cancelled one has actually stopped.
+        """
+        if ticket.status == "queued":
+            self._remove(ticket)
+            ticket.status = "cancelled"
+            ticket._changed.set()
+            self._dispatch()
+        elif ticket.status == "running":
+            ticket.status = "cancelled"
+            ticket._changed.set()
+
+    def cancel_session(self, user_id: str, session_id: str) -> int:
+        """Cancels every queued or running run of a session; returns how many."""
+        tickets = [
+            ticket
+            for ticket in [*self.queued, *self.running]
+            if (ticket.user_id, ticket.session_id) == (user_id, session_id)
+            and not ticket.cancelled
+        ]
+        for ticket in tickets:
+            self.cancel(ticket)
+        return len(tickets)
+
+    def release(self, ticket: RunTicket) -> None:
+        """Frees the slot of a finished or cancelled run, or withdraws a waiting one."""
+        if ticket in self.queued or ticket in self.running:
+            self._remove(ticket)
+            if not ticket.cancelled:
+                ticket.status = "done"
+            ticket._changed.set()
+            self._dispatch()
+
+    def _remove(self, ticket: RunTicket) -> None:
+        if ticket in self.queued:
+            self.queued.remove(ticket)
+        if ticket in self.running:
+            self.running.remove(ticket)
+
+    def _effective_priority(self, ticket: RunTicket, now: float) -> tuple[float, int]:
+        aging = (
+            (now - ticket.submitted_at) / self.aging_seconds
+            if self.aging_seconds
+            else 0.0
+        )
+        return ticket.priority - aging, ticket.sequence
+
+    def _eligible(self, ticket: RunTicket) -> bool:
+        user_runs = sum(run.user_id == ticket.user_id for run in self.running)
+        session_runs = sum(
+            (run.user_id, run.session_id) == (ticket.user_id, ticket.session_id)
+            for run in self.running
+        )
+        return user_runs < self.max_per_user and session_runs < self.max_per_session
+
+    def _dispatch(self) -> None:
+        now = self._clock()
+        self.queued.sort(key=lambda ticket: self._effective_priority(ticket, now))
+        for ticket in list(self.queued):
+            if len(self.running) >= self.max_concurrent:
+                break
+            if self._eligible(ticket):
+                self.queued.remove(ticket)
+                self.running.append(ticket)
+                ticket.status = "running"
+                ticket.admitted_at = now
+                ticket.position = 0
+                ticket._changed.set()
+        self._update_positions()
+
+    def _update_positions(self) -> None:
+        for position, ticket in enumerate(self.queued, start=1):
+            if ticket.position != position:
+                ticket.position = position
+                ticket._changed.set()
@@ -0,0 +1,395 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Search layer: pluggable backends behind a persistent result cache.
+
+The built-in `google_search` tool runs inside the Gemini request, so nothing
+on our side can observe or cache it. `SearchTool` is a function tool with the
+same name that delegates to a `SearchBackend` and caches results on disk. Its
+responses carry grounding metadata in the same shape as model grounding, so
+`collect_research_sources_callback` registers them as sources.
+"""
+
+import asyncio
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any, Protocol
+
+from google.adk.tools import BaseTool, ToolContext
+from google.genai import types as genai_types
+from pydantic import BaseModel, Field
+
+ADK_DOCS_SITE = "google.github.io/adk-docs/"
+SEARCH_TOOL_NAME = "google_search"
+
+_SITE_OPERATOR = re.compile(r"(?i)(?<!\S)-?site:\S*")
+
+
+def strip_site_operators(query: str) -> str:
+    """Removes `site:` operators and collapses whitespace."""
+    return " ".join(_SITE_OPERATOR.sub(" ", query).split())
+
+
+def scope_query(query: str, site: str = ADK_DOCS_SITE) -> str:
+    """Forces a query onto `site`, replacing any existing `site:` operator.
+
+    Args:
+        query (str): The raw query issued by the model.
+        site (str): The site every search is restricted to.
+
+    Returns:
+        str: The query prefixed with `site:<site>`.
+    """
+    return f"site:{site} {strip_site_operators(query)}".strip()
+
+
+def normalize_query(query: str, site: str = ADK_DOCS_SITE) -> str:
+    """Returns the canonical form of a query, used as cache key.
+
+    Args:
+        query (str): The raw query.
+        site (str): The site every search is restricted to.
+
+    Returns:
+        str: The scoped query, lowercased and with collapsed whitespace.
+    """
+    return scope_query(query, site).lower()
+
+
+_QUERY_TERM = re.compile(r"[\w.]+")
+
+
+def query_similarity(first: str, second: str) -> float:
+    """Jaccard similarity of the terms of two queries, ignoring `site:`.
+
+    Args:
+        first (str): A raw or normalized query.
+        second (str): Another raw or normalized query.
+
+    Returns:
+        float: 1.0 for queries with the same terms, 0.0 for disjoint ones.
+    """
+    first_terms = set(_QUERY_TERM.findall(strip_site_operators(first).lower()))
+    second_terms = set(_QUERY_TERM.findall(strip_site_operators(second).lower()))
+    if not first_terms or not second_terms:
+        return float(first_terms == second_terms)
+    return len(first_terms & second_terms) / len(first_terms | second_terms)
+
+
+def find_executed(query: str, ledger: list[str], similarity: float) -> str | None:
+    """Returns the ledger query that makes `query` redundant, if any.
+
+    Args:
+        query (str): A raw query.
+        ledger (list[str]): Normalized queries already executed.
+        similarity (float): `query_similarity` from which a query counts as a
+            near-duplicate; 1.0 only matches queries with the same terms.
+
+    Returns:
+        str | None: The exact or near-duplicate executed query, or None.
+    """
+    normalized = normalize_query(query)
+    if normalized in ledger:
+        return normalized
+    for executed in ledger:
+        if query_similarity(normalized, executed) >= similarity:
+            return executed
+    return None
+
+
+def dedup_queries(
+    queries: list[str], ledger: list[str], similarity: float
+) -> tuple[list[str], list[str]]:
+    """Scopes a batch of queries and drops the ones already run or repeated.
+
+    Args:
+        queries (list[str]): Raw queries, e.g. `Feedback.follow_up_queries`.
+        ledger (list[str]): Normalized queries already executed.
+        similarity (float): See `find_executed`.
+
+    Returns:
+        tuple[list[str], list[str]]: The scoped queries to run, and the
+            dropped ones.
+    """
+    kept, dropped, batch = [], [], list(ledger)
+    for query in queries:
+        if find_executed(query, batch, similarity) is None:
+            kept.append(scope_query(query))
+            batch.append(normalize_query(query))
+        else:
+            dropped.append(query)
+    return kept, dropped
+
+
+class SearchResult(BaseModel):
+    """A search response in the shape produced by grounded model calls."""
+
+    query: str
+    text: str = Field(default="", description="Summary or snippets of the results.")
+    grounding_metadata: genai_types.GroundingMetadata = Field(
+        default_factory=genai_types.GroundingMetadata
+    )
+
+
+class SearchBackend(Protocol):
+    """Anything that can answer a single search query."""
+
+    async def search(self, query: str) -> SearchResult: ...
+
+
+class GeminiSearchBackend:
+    """Runs a query as a single Google Search grounded Gemini call."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self._client: Any = None
+
+    async def search(self, query: str) -> SearchResult:
+        from google import genai
+
+        if self._client is None:
+            self._client = genai.Client()
+        response = await self._client.aio.models.generate_content(
+            model=self.model,
+            contents=f"Search the web and summarize what the results say about: {query}",
+            config=genai_types.GenerateContentConfig(
+                tools=[genai_types.Tool(google_search=genai_types.GoogleSearch())]
+            ),
+        )
+        candidate = response.candidates[0] if response.candidates else None
+        return SearchResult(
+            query=query,
+            text=response.text or "",
+            grounding_metadata=(
+                candidate.grounding_metadata
+                if candidate and candidate.grounding_metadata
+                else genai_types.GroundingMetadata()
+            ),
+        )
+
+
+class SqliteCache:
+    """A small on-disk key/value cache with TTL and LRU eviction.
+
+    Values are text (usually JSON). Entries larger than `max_entry_bytes` are
+    never stored, expired entries are dropped on read, and the least recently
+    used entries are evicted once a namespace holds more than `max_entries`.
+
+    Args:
+        path (str | Path): SQLite database file; `":memory:"` for tests.
+        namespace (str): Logical table partition, so caches can share a file.
+        ttl_seconds (float): Lifetime of an entry after it was written.
+        max_entries (int): Maximum number of entries kept in the namespace.
+        max_entry_bytes (int): Maximum size of a single stored value.
+        clock (Callable[[], float]): Time source, injectable for tests.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        namespace: str,
+        ttl_seconds: float,
+        max_entries: int,
+        max_entry_bytes: int,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        if str(path) != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS cache_entries_lru"
+            " ON cache_entries (namespace, accessed_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> str | None:
+        """Returns the cached value, or None when missing or expired."""
+        now = self._clock()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache_entries"
+                " WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                    (self.namespace, key),
+                )
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE cache_entries SET accessed_at = ?"
+                " WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+            self._conn.commit()
+            return value
+
+    def put(self, key: str, value: str) -> bool:
+        """Stores a value; returns False when it exceeds `max_entry_bytes`."""
+        size = len(value.encode("utf-8"))
+        if size > self.max_entry_bytes:
+            return False
+        now = self._clock()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries"
+                " (namespace, key, value, size, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, value, size, now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                " SELECT key FROM cache_entries WHERE namespace = ?"
+                " ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.namespace, self.namespace, self.max_entries),
+            )
+            self._conn.commit()
+        return True
+
+    def keys(self) -> list[str]:
+        """Returns the keys of the live entries, most recently used first."""
+        oldest = self._clock() - self.ttl_seconds
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key FROM cache_entries WHERE namespace = ? AND created_at >= ?"
+                " ORDER BY accessed_at DESC",
+                (self.namespace, oldest),
+            ).fetchall()
+        return [key for (key,) in rows]
+
+    def delete(self, key: str) -> None:
+        """Removes a single entry."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """Removes every entry of the namespace."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,)
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?",
+                (self.namespace,),
+            ).fetchone()
+        return count
+
+
+class SearchTool(BaseTool):
+    """Function tool that answers searches from the cache or a backend.
+
+    Queries are scoped to the ADK docs site and normalized before lookup, so a
+    cache hit never reaches the backend. The response includes the grounding
+    metadata of the result for source collection.
+    """
+
+    def __init__(self, backend: SearchBackend, cache: SqliteCache | None = None):
+        super().__init__(
+            name=SEARCH_TOOL_NAME,
+            description=(
+                "Searches the official Google ADK documentation "
+                f"(site:{ADK_DOCS_SITE}) and returns a summary of the results "
+                "with their source URLs."
+            ),
+        )
+        self.backend = backend
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def _get_declaration(self) -> genai_types.FunctionDeclaration:
+        return genai_types.FunctionDeclaration(
+            name=self.name,
+            description=self.description,
+            parameters=genai_types.Schema(
+                type=genai_types.Type.OBJECT,
+                properties={
+                    "query": genai_types.Schema(
+                        type=genai_types.Type.STRING,
+                        description="The search query.",
+                    )
+                },
+                required=["query"],
+            ),
+        )
+
+    async def search(self, query: str) -> SearchResult:
+        """Returns the result for `query`, consulting the cache first."""
+        query = scope_query(query)
+        key = normalize_query(query)
+        # SQLite calls block, so they run off the event loop.
+        if (
+            self.cache is not None
+            and (cached := await asyncio.to_thread(self.cache.get, key)) is not None
+        ):
+            self.hits += 1
+            return SearchResult.model_validate_json(cached)
+        self.misses += 1
+        result = await self.backend.search(query)
+        if self.cache is not None and not await asyncio.to_thread(
+            self.cache.put, key, result.model_dump_json(exclude_none=True)
+        ):
+            logging.info(f"[{self.name}] Result for '{key}' too large to cache.")
+        return result
+
+    async def run_async(
+        self, *, args: dict[str, Any], tool_context: ToolContext
+    ) -> Any:
+        result = await self.search(args["query"])
+        return search_response(result)
+
+
+def search_response(result: SearchResult) -> dict[str, Any]:
+    """Builds the function response returned to the model for a result."""
+    metadata = result.grounding_metadata
+    return {
+        "query": result.query,
+        "summary": result.text,
+        "results": [
+            {"title": chunk.web.title, "url": chunk.web.uri}
+            for chunk in metadata.grounding_chunks or []
+            if chunk.web
+        ],
+        "grounding_metadata": metadata.model_dump(mode="json", exclude_none=True),
+    }
@@ -0,0 +1,285 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Source registry helpers shared by the research callbacks."""
+
+from collections import OrderedDict
+from collections.abc import Iterator, Sequence
+from typing import Any
+
+from google.adk.events import Event
+from google.genai import types as genai_types
+
+from .search import SEARCH_TOOL_NAME
+
+# State key holding the index of the first session event not yet scanned.
+SOURCES_CURSOR_KEY = "sources_event_cursor"
+
+
+def iter_grounding_metadata(event: Event) -> Iterator[genai_types.GroundingMetadata]:
+    """Yields the grounding metadata carried by an event, if any.
+
+    Grounding comes either from the model response itself (built-in
+    `google_search`) or from the responses of the local `SearchTool`.
+
+    Args:
+        event (Event): A session event.
+
+    Yields:
+        genai_types.GroundingMetadata: Metadata with at least one grounding chunk.
+    """
+    if event.grounding_metadata and event.grounding_metadata.grounding_chunks:
+        yield event.grounding_metadata
+    for function_response in event.get_function_responses():
+        response = function_response.response or {}
+        if function_response.name != SEARCH_TOOL_NAME or not isinstance(
+            response.get("grounding_metadata"), dict
+        ):
+            continue
+        metadata = genai_types.GroundingMetadata.model_validate(
+            response["grounding_metadata"]
+        )
+        if metadata.grounding_chunks:
+            yield metadata
+
+
+def _count_claims(sources: dict[str, Any]) -> int:
+    return sum(len(source["supported_claims"]) for source in sources.values())
+
+
+def build_claim_index(sources: dict[str, Any]) -> set[tuple[str, str]]:
+    """Builds the (url, text segment) dedup index from an existing registry.
+
+    Args:
+        sources (dict): The `sources` registry keyed by short ID.
+
+    Returns:
+        set[tuple[str, str]]: The claims already stored in the registry.
+    """
+    return {
+        (source["url"], claim["text_segment"])
+        for source in sources.values()
+        for claim in source["supported_claims"]
+    }
+
+
+def collect_sources(
+    events: Sequence[Event],
+    sources: dict[str, Any],
+    url_to_short_id: dict[str, str],
+    cursor: int = 0,
+    claim_index: set[tuple[str, str]] | None = None,
+) -> int:
+    """Adds the grounding data of `events[cursor:]` to the source registry.
+
+    `sources` and `url_to_short_id` are updated in place. Claims whose
+    (url, text segment) pair is already present in `claim_index` are skipped,
+    so replaying an event never duplicates `supported_claims`.
+
+    Args:
+        events (Sequence[Event]): The session events.
+        sources (dict): The `sources` registry keyed by short ID.
+        url_to_short_id (dict): Mapping of source URLs to short IDs.
+        cursor (int): Index of the first event that has not been processed yet.
+        claim_index (set | None): Dedup index of known claims. Built from
+            `sources` when omitted; updated in place otherwise.
+
+    Returns:
+        int: The new cursor, i.e. `len(events)`.
+    """
+    if claim_index is None:
+        claim_index = build_claim_index(sources)
+    id_counter = len(url_to_short_id) + 1
+    for event in events[cursor:]:
+        for metadata in iter_grounding_metadata(event):
+            chunks_info = {}
+            for idx, chunk in enumerate(metadata.grounding_chunks or []):
+                if not chunk.web:
+                    continue
+                url = chunk.web.uri or ""
+                title = (
+                    chunk.web.title
+                    if chunk.web.title != chunk.web.domain
+                    else chunk.web.domain
+                )
+                if url not in url_to_short_id:
+                    short_id = f"src-{id_counter}"
+                    url_to_short_id[url] = short_id
+                    sources[short_id] = {
+                        "short_id": short_id,
+                        "title": title,
+                        "url": url,
+                        "domain": chunk.web.domain,
+                        "supported_claims": [],
+                    }
+                    id_counter += 1
+                chunks_info[idx] = (url_to_short_id[url], url)
+            for support in metadata.grounding_supports or []:
+                confidence_scores = support.confidence_scores or []
+                chunk_indices = support.grounding_chunk_indices or []
+                text_segment = (support.segment.text or "") if support.segment else ""
+                for i, chunk_idx in enumerate(chunk_indices):
+                    if chunk_idx not in chunks_info:
+                        continue
+                    short_id, url = chunks_info[chunk_idx]
+                    if (url, text_segment) in claim_index:
+                        continue
+                    claim_index.add((url, text_segment))
+                    confidence = (
+                        confidence_scores[i] if i < len(confidence_scores) else 0.5
+                    )
+                    sources[short_id]["supported_claims"].append(
+                        {
+                            "text_segment": text_segment,
+                            "confidence": confidence,
+                        }
+                    )
+    return len(events)
+
+
+class ClaimIndexCache:
+    """Per-session cache of claim dedup indexes.
+
+    The index can always be rebuilt from the `sources` registry, so entries are
+    validated against the registry's claim count and evicted in LRU order once
+    `max_sessions` is exceeded.
+    """
+
+    def __init__(self, max_sessions: int = 256):
+        self.max_sessions = max_sessions
+        self._entries: OrderedDict[str, tuple[int, set[tuple[str, str]]]] = (
+            OrderedDict()
+        )
+
+    def get(self, session_id: str, sources: dict[str, Any]) -> set[tuple[str, str]]:
+        """Returns the dedup index for a session, rebuilding it if stale."""
+        entry = self._entries.get(session_id)
+        if entry is not None and entry[0] == _count_claims(sources):
+            self._entries.move_to_end(session_id)
+            return entry[1]
+        index = build_claim_index(sources)
+        self._store(session_id, sources, index)
+        return index
+
+    def update(
+        self,
+        session_id: str,
+        sources: dict[str, Any],
+        index: set[tuple[str, str]],
+    ) -> None:
+        """Records the index after `sources` has been updated."""
+        self._store(session_id, sources, index)
+
+    def _store(
+        self,
+        session_id: str,
+        sources: dict[str, Any],
+        index: set[tuple[str, str]],
+    ) -> None:
+        self._entries[session_id] = (_count_claims(sources), index)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+
+
+def _source_rank_key(source: dict[str, Any]) -> tuple[float, int]:
+    best = max((c["confidence"] for c in source["supported_claims"]), default=0.0)
+    return (-best, _short_id_number(source["short_id"]))
+
+
+def _short_id_number(short_id: str) -> int:
+    _, _, number = short_id.partition("-")
+    return int(number) if number.isdigit() else 0
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[: limit - 1].rstrip() + "…"
+
+
+def render_source_digest(
+    sources: dict[str, Any],
+    max_chars: int,
+    claims_per_source: int,
+    max_claim_chars: int = 240,
+) -> tuple[str, dict[str, int]]:
+    """Renders a compact, budgeted view of the source registry for prompts.
+
+    The digest is a table of short IDs, titles and domains followed by the
+    top-k claims per source ranked by confidence. Table rows take priority
+    over claims; when the budget cannot hold every row, the sources with the
+    most confident claims are kept. Claims are then added round-robin across
+    sources, best first, until `max_chars` is reached.
+
+    Args:
+        sources (dict): The `sources` registry keyed by short ID.
+        max_chars (int): Character budget for the rendered digest.
+        claims_per_source (int): Maximum number of claims listed per source.
+        max_claim_chars (int): Claims longer than this are clipped.
+
+    Returns:
+        tuple[str, dict[str, int]]: The digest and counters describing it.
+    """
+    header = ["| ID | Title | Domain |", "|---|---|---|"]
+    used = sum(len(line) + 1 for line in header)
+    ranked = sorted(sources.values(), key=_source_rank_key)
+
+    rows: dict[str, str] = {}
+    for source in ranked:
+        title = _clip(source["title"] or source["domain"] or "", 120).replace("|", "/")
+        row = f"| {source['short_id']} | {title} | {source['domain']} |"
+        if used + len(row) + 1 > max_chars:
+            break
+        rows[source["short_id"]] = row
+        used += len(row) + 1
+
+    claims: dict[str, list[str]] = {short_id: [] for short_id in rows}
+    used += len("\nTop claims:\n")
+    ranked_claims = {
+        source["short_id"]: sorted(
+            source["supported_claims"], key=lambda c: -c["confidence"]
+        )[:claims_per_source]
+        for source in ranked
+        if source["short_id"] in rows
+    }
+    budget_left = True
+    for rank in range(claims_per_source):
+        if not budget_left:
+            break
+        for short_id, candidates in ranked_claims.items():
+            if rank >= len(candidates):
+                continue
+            claim = candidates[rank]
+            line = (
+                f"- {short_id} ({claim['confidence']:.2f}): "
+                f"{_clip(claim['text_segment'], max_claim_chars)}"
+            )
+            if used + len(line) + 1 > max_chars:
+                budget_left = False
+                break
+            claims[short_id].append(line)
+            used += len(line) + 1
+
+    ordered_ids = sorted(rows, key=_short_id_number)
+    lines = header + [rows[short_id] for short_id in ordered_ids]
+    claim_lines = [line for short_id in ordered_ids for line in claims[short_id]]
+    if claim_lines:
+        lines += ["", "Top claims:", *claim_lines]
+    digest = "\n".join(lines)
+    stats = {
+        "sources_total": len(sources),
+        "sources_included": len(rows),
+        "claims_included": len(claim_lines),
+    }
+    return digest, stats
@@ -0,0 +1,60 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Async rate limiting primitives shared by concurrent agents and tools."""
+
+import asyncio
+import time
+from collections.abc import Callable
+
+
+class AsyncRateLimiter:
+    """Token bucket limiting how often an operation may start.
+
+    Args:
+        rate_per_second (float): Sustained number of acquisitions per second;
+            zero or less disables limiting.
+        burst (int): Number of acquisitions allowed back to back.
+        clock (Callable[[], float]): Monotonic time source.
+    """
+
+    def __init__(
+        self,
+        rate_per_second: float,
+        burst: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate_per_second = rate_per_second
+        self.burst = max(1, burst)
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Waits until a token is available and takes it."""
+        if self.rate_per_second <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = self._clock()
+                self._tokens = min(
+                    self.burst,
+                    self._tokens + (now - self._updated) * self.rate_per_second,
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate_per_second)
@@ -0,0 +1,528 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-agent tracing of pipeline runs through ADK callbacks.
+
+`Tracer.instrument` walks an agent tree, including agents wrapped in an
+`AgentTool`. It adds callbacks that open a span per agent run, model call and
+tool call, and it wraps every existing callback in a span of its own.
+
+Agent spans carry:
+
+- wall time;
+- model calls and prompt, output and thought tokens;
+- search and tool calls;
+- the session state size before and after the run, in JSON bytes;
+- the refinement loop iteration, when there is one.
+
+Finished spans go to exporters, such as a local JSONL file or
+OpenTelemetry.
+
+Usage:
+    python -m app.tracing summary traces.jsonl [--top 15]
+"""
+
+import argparse
+import functools
+import inspect
+import itertools
+import json
+import time
+from collections import defaultdict
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import Any, Protocol
+
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.tools import BaseTool, ToolContext
+from google.adk.tools.agent_tool import AgentTool
+
+from .search import SEARCH_TOOL_NAME
+
+_CALLBACK_SLOTS = (
+    "before_agent_callback",
+    "after_agent_callback",
+    "before_model_callback",
+    "after_model_callback",
+    "before_tool_callback",
+    "after_tool_callback",
+)
+
+
+class SpanExporter(Protocol):
+    """Receives spans as they start and finish."""
+
+    def on_start(self, span: dict[str, Any]) -> None: ...
+
+    def on_end(self, span: dict[str, Any]) -> None: ...
+
+
+class JsonlSpanExporter:
+    """Appends every finished span as one JSON line to `path`."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def on_start(self, span: dict[str, Any]) -> None:
+        pass
+
+    def on_end(self, span: dict[str, Any]) -> None:
+        record = {k: v for k, v in span.items() if not k.startswith("_")}
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+
+class OpenTelemetrySpanExporter:
+    """Mirrors spans to the OpenTelemetry tracer provider configured globally.
+
+    Parent spans are linked, so the usual OTLP or Cloud Trace exporters show
+    the agent tree.
+    """
+
+    def __init__(self, instrumentation_name: str = "adk-docs-agent"):
+        from opentelemetry import trace
+
+        self._trace = trace
+        self._tracer = trace.get_tracer(instrumentation_name)
+        self._spans: dict[str, Any] = {}
+
+    def on_start(self, span: dict[str, Any]) -> None:
+        parent = self._spans.get(span["parent_id"])
+        self._spans[span["span_id"]] = self._tracer.start_span(
+            f"{span['kind']} {span['name']}",
+            context=self._trace.set_span_in_context(parent) if parent else None,
+            start_time=int(span["start"] * 1e9),
+        )
+
+    def on_end(self, span: dict[str, Any]) -> None:
+        if (otel_span := self._spans.pop(span["span_id"], None)) is None:
+            return
+        otel_span.set_attributes(
+            {
+                f"adk_docs.{key}": value
+                for key, value in {
+                    "agent": span["agent"],
+                    "invocation_id": span["trace_id"],
+                    **span["attributes"],
+                }.items()
+                if isinstance(value, str | bool | int | float)
+            }
+        )
+        otel_span.end(end_time=int(span["end"] * 1e9))
+
+
+def _state_bytes(callback_context: CallbackContext) -> int:
+    return len(json.dumps(callback_context.state.to_dict(), default=str))
+
+
+def _context_of(args: tuple, kwargs: dict) -> CallbackContext | None:
+    for value in itertools.chain(args, kwargs.values()):
+        if isinstance(value, CallbackContext):
+            return value
+    return None
+
+
+class Tracer:
+    """Collects spans for agent runs, model calls, tool calls and callbacks.
+
+    Args:
+        exporters (list[SpanExporter]): Destinations of the spans.
+        clock (Callable[[], float]): Wall-clock time source, in seconds.
+    """
+
+    def __init__(
+        self,
+        exporters: list[SpanExporter],
+        clock: Callable[[], float] = time.time,
+    ):
+        self.exporters = exporters
+        self._clock = clock
+        self._ids = itertools.count(1)
+        self._open: dict[tuple, dict[str, Any]] = {}
+
+    # --- Span bookkeeping ---
+
+    def _start(
+        self,
+        key: tuple,
+        kind: str,
+        name: str,
+        trace_id: str,
+        agent: str,
+        parent_key: tuple | None,
+        **attributes: Any,
+    ) -> dict[str, Any]:
+        parent = self._open.get(parent_key) if parent_key else None
+        span = {
+            "trace_id": trace_id,
+            "span_id": f"{next(self._ids):x}",
+            "parent_id": parent["span_id"] if parent else None,
+            "kind": kind,
+            "name": name,
+            "agent": agent,
+            "start": self._clock(),
+            "attributes": attributes,
+        }
+        self._open[key] = span
+        for exporter in self.exporters:
+            exporter.on_start(span)
+        return span
+
+    def _end(self, key: tuple, **attributes: Any) -> None:
+        if (span := self._open.pop(key, None)) is None:
+            return
+        span["end"] = self._clock()
+        span["duration_s"] = round(span["end"] - span["start"], 6)
+        span["attributes"].update(attributes)
+        for exporter in self.exporters:
+            exporter.on_end(span)
+
+    @staticmethod
+    def _agent_key(callback_context: CallbackContext) -> tuple:
+        return ("agent", callback_context.invocation_id, callback_context.agent_name)
+
+    def _parent_agent_key(self, callback_context: CallbackContext) -> tuple | None:
+        parent = callback_context._invocation_context.agent.parent_agent
+        if parent is None:
+            return None
+        return ("agent", callback_context.invocation_id, parent.name)
+
+    # --- Callbacks added to every agent ---
+
+    def before_agent(self, callback_context: CallbackContext) -> None:
+        self._start(
+            self._agent_key(callback_context),
+            kind="agent",
+            name=callback_context.agent_name,
+            trace_id=callback_context.invocation_id,
+            agent=callback_context.agent_name,
+            parent_key=self._parent_agent_key(callback_context),
+            model_calls=0,
+            prompt_tokens=0,
+            output_tokens=0,
+            thought_tokens=0,
+            tool_calls=0,
+            search_calls=0,
+            state_bytes_before=_state_bytes(callback_context),
+        )
+
+    def after_agent(self, callback_context: CallbackContext) -> None:
+        span = self._open.get(self._agent_key(callback_context))
+        if span is None:
+            return
+        state_bytes = _state_bytes(callback_context)
+        # Read at the end: `research_evaluator` advances the iteration in its
+        # own before_agent_callback.
+        self._end(
+            self._agent_key(callback_context),
+            iteration=callback_context.state.get("refinement_iteration"),
+            state_bytes_after=state_bytes,
+            state_bytes_delta=state_bytes - span["attributes"]["state_bytes_before"],
+        )
+
+    def before_model(
+        self, callback_context: CallbackContext, llm_request: LlmRequest
+    ) -> None:
+        self._start(
+            ("model", *self._agent_key(callback_context)[1:]),
+            kind="model",
+            name=llm_request.model or "model",
+            trace_id=callback_context.invocation_id,
+            agent=callback_context.agent_name,
+            parent_key=self._agent_key(callback_context),
+        )
+
+    def after_model(
+        self, callback_context: CallbackContext, llm_response: LlmResponse
+    ) -> None:
+        if llm_response.partial:
+            return
+        usage = llm_response.usage_metadata
+        grounding = llm_response.grounding_metadata
+        counters = {
+            "model_calls": 1,
+            "prompt_tokens": (usage.prompt_token_count or 0) if usage else 0,
+            "output_tokens": (usage.candidates_token_count or 0) if usage else 0,
+            "thought_tokens": (usage.thoughts_token_count or 0) if usage else 0,
+            # Built-in Google Search runs inside the model call.
+            "search_calls": len(grounding.web_search_queries or []) if grounding else 0,
+        }
+        if agent_span := self._open.get(self._agent_key(callback_context)):
+            for name, value in counters.items():
+                agent_span["attributes"][name] += value
+        counters.pop("model_calls")
+        # Set by `app.routing.RoutedLlm`.
+        if route := (llm_response.custom_metadata or {}).get("route"):
+            counters["routed_model"] = route["model"]
+            counters["escalated_from"] = route["escalated_from"]
+        self._end(("model", *self._agent_key(callback_context)[1:]), **counters)
+
+    def before_tool(
+        self, tool: BaseTool, args: dict[str, Any], tool_context: ToolContext
+    ) -> None:
+        if agent_span := self._open.get(self._agent_key(tool_context)):
+            agent_span["attributes"]["tool_calls"] += 1
+            if tool.name == SEARCH_TOOL_NAME:
+                agent_span["attributes"]["search_calls"] += 1
+        self._start(
+            ("tool", tool_context.invocation_id, tool_context.function_call_id),
+            kind="tool",
+            name=tool.name,
+            trace_id=tool_context.invocation_id,
+            agent=tool_context.agent_name,
+            parent_key=self._agent_key(tool_context),
+        )
+
+    def after_tool(
+        self,
+        tool: BaseTool,
+        args: dict[str, Any],
+        tool_context: ToolContext,
+        tool_response: Any,
+    ) -> None:
+        self._end(("tool", tool_context.invocation_id, tool_context.function_call_id))
+
+    # --- Instrumentation ---
+
+    def wrap_callback(self, callback: Callable, slot: str) -> Callable:
+        """Wraps an existing callback in a span of kind "callback".
+
+        A `before_agent_callback` or `before_model_callback` that returns a
+        value skips the agent or model call, so the span that was opened for
+        it is closed here as short-circuited. An after-callback that returns a
+        value skips the tracer's own after-callback, so the span is closed
+        here instead.
+        """
+        if getattr(callback, "__traced__", False):
+            return callback
+
+        @functools.wraps(callback)
+        def traced(*args: Any, **kwargs: Any) -> Any:
+            callback_context = _context_of(args, kwargs)
+            key = ("callback", next(self._ids))
+            if callback_context is not None:
+                self._start(
+                    key,
+                    kind="callback",
+                    name=callback.__name__,
+                    trace_id=callback_context.invocation_id,
+                    agent=callback_context.agent_name,
+                    parent_key=self._agent_key(callback_context),
+                    slot=slot,
+                )
+
+            def finish(result: Any) -> Any:
+                self._end(key)
+                if result is not None and callback_context is not None:
+                    if slot == "before_agent_callback":
+                        self._end(
+                            self._agent_key(callback_context), short_circuited=True
+                        )
+                    elif slot == "before_model_callback":
+                        self._end(
+                            ("model", *self._agent_key(callback_context)[1:]),
+                            short_circuited=True,
+                        )
+                    # The tracer's own after-callbacks run last, so they are
+                    # skipped when this one ends the chain.
+                    elif slot == "after_agent_callback":
+                        self.after_agent(callback_context)
+                    elif slot == "after_model_callback":
+                        self.after_model(callback_context, result)
+                    elif slot == "after_tool_callback" and isinstance(
+                        callback_context, ToolContext
+                    ):
+                        self._end(
+                            (
+                                "tool",
+                                callback_context.invocation_id,
+                                callback_context.function_call_id,
+                            )
+                        )
+                return result
+
+            result = callback(*args, **kwargs)
+            if inspect.isawaitable(result):
+
+                async def awaited() -> Any:
+                    return finish(await result)
+
+                return awaited()
+            return finish(result)
+
+        traced.__traced__ = True  # type: ignore[attr-defined]
+        return traced
+
+    def instrument(self, root: BaseAgent) -> None:
+        """Adds tracing to `root`, its sub-agents and agents used as tools."""
+        for agent in iter_agents(root):
+            self._instrument_agent(agent)
+
+    def _instrument_agent(self, agent: BaseAgent) -> None:
+        own: dict[str, Callable[..., Any]] = {
+            "before_agent_callback": self.before_agent,
+            "after_agent_callback": self.after_agent,
+        }
+        if isinstance(agent, LlmAgent):
+            own |= {
+                "before_model_callback": self.before_model,
+                "after_model_callback": self.after_model,
+                "before_tool_callback": self.before_tool,
+                "after_tool_callback": self.after_tool,
+            }
+        for slot in _CALLBACK_SLOTS:
+            if not hasattr(agent, slot):
+                continue
+            existing = getattr(agent, slot)
+            if existing is None:
+                existing = []
+            elif not isinstance(existing, list):
+                existing = [existing]
+            if any(getattr(cb, "__self__", None) is self for cb in existing):
+                continue
+            wrapped = [self.wrap_callback(cb, slot) for cb in existing]
+            # Spans open before the other callbacks and close after them, so
+            # callback spans have a parent and state sizes include their
+            # writes. ADK stops at the first callback that returns a value;
+            # `wrap_callback` closes the span then.
+            if slot in own and slot.startswith("before_"):
+                wrapped.insert(0, own[slot])
+            elif slot in own:
+                wrapped.append(own[slot])
+            setattr(agent, slot, wrapped or None)
+
+
+def iter_agents(root: BaseAgent) -> Iterator[BaseAgent]:
+    """Yields `root` and every agent below it, once each.
+
+    Besides `sub_agents`, this follows agent-typed fields of custom agents and
+    the agents wrapped in an `AgentTool`.
+    """
+    seen: set[int] = set()
+    pending = [root]
+    while pending:
+        agent = pending.pop()
+        if id(agent) in seen:
+            continue
+        seen.add(id(agent))
+        yield agent
+        children = list(agent.sub_agents)
+        for field in type(agent).model_fields:
+            value = getattr(agent, field, None)
+            if field != "parent_agent" and isinstance(value, BaseAgent):
+                children.append(value)
+        if isinstance(agent, LlmAgent):
+            children += [t.agent for t in agent.tools if isinstance(t, AgentTool)]
+        pending.extend(reversed(children))
+
+
+def build_exporters(names: list[str], path: str | Path) -> list[SpanExporter]:
+    """Builds exporters from names: "jsonl" writes to `path`, "otel" to OpenTelemetry."""
+    exporters: list[SpanExporter] = []
+    for name in names:
+        if name == "jsonl":
+            exporters.append(JsonlSpanExporter(path))
+        elif name == "otel":
+            exporters.append(OpenTelemetrySpanExporter())
+        else:
+            raise ValueError(f"Unknown trace exporter: {name!r}")
+    return exporters
+
+
+# --- Summary CLI ---
+
+
+def load_spans(path: str | Path) -> list[dict[str, Any]]:
+    """Reads the spans written by `JsonlSpanExporter`."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(spans: list[dict[str, Any]], top: int = 15) -> str:
+    """Renders the slowest agents, loop iterations and single spans.
+
+    Args:
+        spans (list[dict[str, Any]]): Spans loaded from a trace file.
+        top (int): Rows per table.
+
+    Returns:
+        str: A plain-text report.
+    """
+    agents: dict[str, dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    iterations: dict[tuple[str, int], float] = defaultdict(float)
+    for span in spans:
+        if span["kind"] != "agent":
+            continue
+        row = agents[span["name"]]
+        row["runs"] += 1
+        row["seconds"] += span["duration_s"]
+        row["max_s"] = max(row["max_s"], span["duration_s"])
+        # Runs skipped by a before_agent_callback, e.g. plan cache hits.
+        row["cached"] += bool(span["attributes"].get("short_circuited"))
+        for counter in (
+            "model_calls",
+            "prompt_tokens",
+            "output_tokens",
+            "thought_tokens",
+            "search_calls",
+            "state_bytes_delta",
+        ):
+            row[counter] += span["attributes"].get(counter) or 0
+        if (iteration := span["attributes"].get("iteration")) and span["name"] in (
+            "research_evaluator",
+            "enhanced_search_executor",
+        ):
+            iterations[(span["trace_id"], iteration)] += span["duration_s"]
+
+    lines = [
+        f"{len(spans)} spans, {len({s['trace_id'] for s in spans})} invocations",
+        "",
+        f"{'agent':32} {'runs':>5} {'cached':>6} {'total s':>9} {'max s':>8} {'model':>6} "
+        f"{'prompt tok':>11} {'output tok':>11} {'thought tok':>11} "
+        f"{'search':>7} {'state +B':>9}",
+    ]
+    for name, row in sorted(agents.items(), key=lambda item: -item[1]["seconds"])[:top]:
+        lines.append(
+            f"{name[:32]:32} {row['runs']:5.0f} {row['cached']:6.0f} {row['seconds']:9.2f} "
+            f"{row['max_s']:8.2f} {row['model_calls']:6.0f} "
+            f"{row['prompt_tokens']:11.0f} {row['output_tokens']:11.0f} "
+            f"{row['thought_tokens']:11.0f} {row['search_calls']:7.0f} "
+            f"{row['state_bytes_delta']:9.0f}"
+        )
+    if iterations:
+        lines += ["", "refinement loop iterations (evaluator + executor):"]
+        for (trace_id, iteration), seconds in sorted(iterations.items()):
+            lines.append(
+                f"  {trace_id[:12]:12} iteration {iteration:3d} {seconds:9.2f} s"
+            )
+    lines += ["", "slowest spans:"]
+    for span in sorted(spans, key=lambda s: -s["duration_s"])[:top]:
+        lines.append(
+            f"  {span['duration_s']:9.2f} s  {span['kind']:8} {span['name'][:40]:40} "
+            f"({span['agent']})"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize pipeline traces.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    summary_parser = subcommands.add_parser("summary", help="Print the slowest stages.")
+    summary_parser.add_argument("path")
+    summary_parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+    print(summarize(load_spans(args.path), args.top))
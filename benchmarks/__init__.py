@@ -0,0 +1,4 @@
+"""Offline benchmarks for the ADK documentation agent.
+
+Run from the repository root, e.g. `python -m benchmarks.bench_source_collection`.
+"""
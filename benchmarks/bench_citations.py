@@ -0,0 +1,99 @@
+"""Benchmark: two-pass legacy citation rewrite vs the compiled rewriter.
+
+Generates a multi-megabyte report with a citation tag every few sentences and
+rewrites it three ways: the original two `re.sub` passes, a single
+`CitationRewriter.rewrite` call, and `CitationRewriter.feed` over streamed
+chunks of model-token size.
+
+Usage:
+    python -m benchmarks.bench_citations [--megabytes 4] [--chunk-chars 64] [--repeat 5]
+"""
+
+import argparse
+import random
+import re
+import timeit
+from collections.abc import Callable
+
+from app.citations import CitationRewriter
+
+
+def legacy_rewrite(report: str, sources: dict) -> str:
+    """The original `citation_replacement_callback` rewrite."""
+
+    def tag_replacer(match: re.Match) -> str:
+        short_id = match.group(1)
+        if not (source_info := sources.get(short_id)):
+            return ""
+        display_text = source_info.get("title", source_info.get("domain", short_id))
+        return f" [{display_text}]({source_info['url']})"
+
+    processed = re.sub(
+        r'<cite\s+source\s*=\s*["\']?\s*(src-\d+)\s*["\']?\s*/>', tag_replacer, report
+    )
+    return re.sub(r"\s+([.,;:])", r"\1", processed)
+
+
+def synthetic_report(megabytes: float, num_sources: int = 300, seed: int = 7) -> str:
+    """Builds a report of about `megabytes` MB with ~1 tag per 3 sentences."""
+    rng = random.Random(seed)
+    words = "agent loop callback session state tool event runner model plan".split()
+    parts, size = [], 0
+    while size < megabytes * 1024 * 1024:
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(8, 20)))
+        if rng.random() < 0.35:
+            sentence += f' <cite source="src-{rng.randint(1, num_sources)}"/>'
+        sentence += rng.choice([".", " .", ",", ";"]) + rng.choice([" ", "\n\n"])
+        parts.append(sentence)
+        size += len(sentence)
+    return "".join(parts)
+
+
+def run(megabytes: float, chunk_chars: int, repeat: int) -> None:
+    sources = {
+        f"src-{i}": {
+            "title": f"ADK page {i}",
+            "url": f"https://google.github.io/adk-docs/page-{i}/",
+        }
+        for i in range(1, 301)
+    }
+    report = synthetic_report(megabytes)
+
+    expected = legacy_rewrite(report, sources)
+    rewritten = CitationRewriter(sources).rewrite(report)
+
+    def stream() -> str:
+        rewriter = CitationRewriter(sources)
+        output = [
+            rewriter.feed(report[position : position + chunk_chars])
+            for position in range(0, len(report), chunk_chars)
+        ]
+        output.append(rewriter.flush())
+        return "".join(output)
+
+    def best_of(fn: Callable[[], object]) -> float:
+        return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+    legacy_seconds = best_of(lambda: legacy_rewrite(report, sources))
+    single_pass_seconds = best_of(lambda: CitationRewriter(sources).rewrite(report))
+    streamed_seconds = best_of(stream)
+
+    assert rewritten == expected
+    assert stream() == expected
+    mb = len(report.encode("utf-8")) / 1024 / 1024
+    print(f"report: {mb:.1f} MB, {report.count('<cite')} citation tags")
+    for label, seconds in [
+        ("legacy two-pass", legacy_seconds),
+        ("compiled rewriter", single_pass_seconds),
+        (f"streamed ({chunk_chars} chars)", streamed_seconds),
+    ]:
+        print(f"{label:22} {seconds * 1000:9.1f} ms  {mb / seconds:8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megabytes", type=float, default=4)
+    parser.add_argument("--chunk-chars", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.megabytes, args.chunk_chars, args.repeat)
@@ -0,0 +1,169 @@
+"""Benchmark: retained session size, request size and memory of long sessions.
+
+Runs `--rounds` research rounds in one session on the stub model. Each round
+is a request followed by an approval. Research answers carry
+`--thought-chars` of thoughts and fresh grounding, as
+`include_thoughts=True` agents do. The run is repeated with the compaction
+policy switched off. For each run it reports latency, tracemalloc peak
+memory, the JSON bytes of the contents sent with all model requests, and
+the size of the stored session: its events, their JSON bytes, and the state
+JSON bytes. The JSON bytes of the stored events are also reported after
+every round, so their growth over the session shows.
+
+Usage:
+    python -m benchmarks.bench_compaction [--rounds 5] [--goals 10] [--iterations 20]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+import tracemalloc
+from collections.abc import AsyncGenerator
+
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.adk.sessions import Session
+from google.genai import types as genai_types
+
+import app.agent
+from app.agent import SessionCompactor, parallel_section_researcher, root_agent
+from app.compaction import CompactionPolicy
+from app.replay import substitute_backends
+from app.tracing import iter_agents
+from benchmarks.stubs import StubLlm, StubSearchBackend
+
+NO_COMPACTION = CompactionPolicy(
+    strip_thoughts=False, strip_grounding=False, drop_superseded=False, max_events=0
+)
+
+
+class MeasuredStubLlm(StubLlm):
+    """`StubLlm` that adds up the JSON bytes of the request contents."""
+
+    request_bytes: int = 0
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        self.request_bytes += sum(
+            len(content.model_dump_json(exclude_none=True))
+            for content in llm_request.contents
+        )
+        async for response in super().generate_content_async(llm_request, stream):
+            yield response
+
+
+def _session_bytes(session: Session) -> int:
+    return sum(
+        len(event.model_dump_json(exclude_none=True)) for event in session.events
+    )
+
+
+async def long_session(rounds: int, stub: StubLlm) -> tuple[int, list[int], int]:
+    """Runs the rounds.
+
+    Returns:
+        tuple[int, list[int], int]: The stored event count, the stored event
+            bytes after every round, and the state bytes.
+    """
+    with substitute_backends(
+        root_agent, lambda agent: stub, lambda tool: StubSearchBackend()
+    ):
+        runner = InMemoryRunner(agent=root_agent, app_name="bench")
+        created = await runner.session_service.create_session(
+            app_name="bench", user_id="bench"
+        )
+        retained = []
+        session: Session | None = None
+        for round_number in range(rounds):
+            for message in (
+                f"Research the Google ADK, round {round_number + 1}",
+                "sim",
+            ):
+                async for _ in runner.run_async(
+                    user_id="bench",
+                    session_id=created.id,
+                    new_message=genai_types.Content(
+                        role="user", parts=[genai_types.Part(text=message)]
+                    ),
+                ):
+                    pass
+            session = await runner.session_service.get_session(
+                app_name="bench", user_id="bench", session_id=created.id
+            )
+            assert session is not None
+            retained.append(_session_bytes(session))
+    assert session is not None
+    state_bytes = len(json.dumps(session.state, default=str))
+    return len(session.events), retained, state_bytes
+
+
+def _use_policy(policy: CompactionPolicy) -> None:
+    # Read by `compact_request_callback` on every model call.
+    app.agent.compaction_policy = policy
+    for agent in iter_agents(root_agent):
+        if isinstance(agent, SessionCompactor):
+            agent.policy = policy
+
+
+def run(rounds: int, goals: int, iterations: int, thought_chars: int) -> None:
+    if not app.agent.config.session_compaction:
+        raise SystemExit("Compaction is disabled (config.session_compaction).")
+    configured = app.agent.compaction_policy
+
+    print(
+        f"{rounds} rounds x {goals} goals x {iterations} iterations, "
+        f"{thought_chars} thought chars per research answer"
+    )
+    print(
+        f"{'compaction':10} {'latency s':>10} {'peak MiB':>9} {'requests KiB':>13} "
+        f"{'events':>7} {'events KiB':>11} {'state KiB':>10}"
+    )
+    growth = {}
+    try:
+        for label, policy in (("off", NO_COMPACTION), ("on", configured)):
+            _use_policy(policy)
+
+            def stub() -> MeasuredStubLlm:
+                return MeasuredStubLlm(
+                    goals=goals, iterations=iterations, thought_chars=thought_chars
+                )
+
+            measured = stub()
+            start = time.perf_counter()
+            events, retained, state_bytes = asyncio.run(long_session(rounds, measured))
+            latency = time.perf_counter() - start
+            growth[label] = retained
+
+            tracemalloc.start()
+            asyncio.run(long_session(rounds, stub()))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(
+                f"{label:10} {latency:10.2f} {peak / 2**20:9.1f} "
+                f"{measured.request_bytes / 1024:13.1f} {events:7d} "
+                f"{retained[-1] / 1024:11.1f} {state_bytes / 1024:10.1f}"
+            )
+    finally:
+        _use_policy(configured)
+
+    print("\nStored events KiB after each round")
+    print(f"{'compaction':10} " + " ".join(f"{n + 1:>8}" for n in range(rounds)))
+    for label, retained in growth.items():
+        print(f"{label:10} " + " ".join(f"{size / 1024:8.1f}" for size in retained))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--goals", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--thought-chars", type=int, default=4000)
+    args = parser.parse_args()
+    # See benchmarks.bench_end_to_end.
+    logging.getLogger("opentelemetry.context").setLevel(logging.CRITICAL)
+    if parallel_section_researcher is not None:
+        parallel_section_researcher.requests_per_second = 0
+    run(args.rounds, args.goals, args.iterations, args.thought_chars)
@@ -0,0 +1,121 @@
+"""Benchmark: the full planner -> research_pipeline flow on the stub model.
+
+Runs `root_agent` offline with `benchmarks.stubs.StubLlm` and `StubSearchBackend`,
+sending a research request and then an approval. The stub plans `--goals`
+research goals, and its evaluator fails until the `--iterations`-th
+refinement iteration. For every combination it reports:
+
+- end-to-end latency;
+- per-stage time from `pipeline_timeline`;
+- peak Python memory (tracemalloc, measured in a second run so it does not
+  slow the timed run);
+- the final session state size and event count.
+
+The goal researchers' start-rate limit is disabled unless `--rps` is given,
+so the numbers measure the pipeline rather than the limiter.
+
+Usage:
+    python -m benchmarks.bench_end_to_end [--goals 5,20,50] [--iterations 1,10,30]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+import tracemalloc
+
+from google.adk.runners import InMemoryRunner
+from google.genai import types as genai_types
+
+from app.agent import parallel_section_researcher, root_agent
+from app.pipeline import PIPELINE_TIMELINE_KEY
+from app.replay import substitute_backends
+from benchmarks.stubs import StubLlm, StubSearchBackend
+
+MESSAGES = ["Research the Google ADK", "sim"]
+
+
+async def converse(goals: int, iterations: int, delay_s: float) -> tuple[dict, int]:
+    """Runs the two user turns; returns the final state and event count."""
+    stub = StubLlm(goals=goals, iterations=iterations, delay_s=delay_s)
+    with substitute_backends(
+        root_agent, lambda agent: stub, lambda tool: StubSearchBackend()
+    ):
+        runner = InMemoryRunner(agent=root_agent, app_name="bench")
+        session = await runner.session_service.create_session(
+            app_name="bench", user_id="bench"
+        )
+        for message in MESSAGES:
+            async for _ in runner.run_async(
+                user_id="bench",
+                session_id=session.id,
+                new_message=genai_types.Content(
+                    role="user", parts=[genai_types.Part(text=message)]
+                ),
+            ):
+                pass
+        stored = await runner.session_service.get_session(
+            app_name="bench", user_id="bench", session_id=session.id
+        )
+    assert stored is not None
+    return stored.state, len(stored.events)
+
+
+def run(goal_counts: list[int], iteration_counts: list[int], delay_s: float) -> None:
+    print(
+        f"{'goals':>5} {'iters':>5} {'latency s':>10} {'peak MiB':>9} "
+        f"{'state KiB':>10} {'events':>7}  stages (s)"
+    )
+    for goals in goal_counts:
+        for iterations in iteration_counts:
+            start = time.perf_counter()
+            state, events = asyncio.run(converse(goals, iterations, delay_s))
+            latency = time.perf_counter() - start
+
+            tracemalloc.start()
+            asyncio.run(converse(goals, iterations, delay_s))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            timeline = state.get(PIPELINE_TIMELINE_KEY) or {}
+            stages = " ".join(
+                f"{stage['stage']}={stage['end_s'] - stage['start_s']:.2f}"
+                for stage in timeline.get("stages", [])
+            )
+            state_kib = len(json.dumps(state, default=str)) / 1024
+            print(
+                f"{goals:5d} {iterations:5d} {latency:10.2f} {peak / 2**20:9.1f} "
+                f"{state_kib:10.1f} {events:7d}  {stages or '(sequential pipeline)'}"
+            )
+            assert state.get("final_report_with_citations"), "No report was produced."
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--goals", default="5,20,50")
+    parser.add_argument("--iterations", default="1,10,30")
+    parser.add_argument(
+        "--model-delay-ms",
+        type=float,
+        default=0.0,
+        help="Simulated latency per model call.",
+    )
+    parser.add_argument(
+        "--rps",
+        type=float,
+        default=0.0,
+        help="Goal researcher start rate; 0 disables it.",
+    )
+    args = parser.parse_args()
+    # ADK's OpenTelemetry span of an agent that escalates out of a LoopAgent is
+    # closed from another context when its generator is collected; the error
+    # it logs is noise here.
+    logging.getLogger("opentelemetry.context").setLevel(logging.CRITICAL)
+    if parallel_section_researcher is not None:
+        parallel_section_researcher.requests_per_second = args.rps
+    run(
+        [int(n) for n in args.goals.split(",")],
+        [int(n) for n in args.iterations.split(",")],
+        args.model_delay_ms / 1000,
+    )
@@ -0,0 +1,65 @@
+"""Benchmark: cold import time of the agent package.
+
+Runs `python -X importtime` in fresh interpreters and reports the cumulative
+import time of the app modules, the share spent in the app's own code, and the
+slowest app modules. `--budget-ms` makes the run fail when the app's own
+import time exceeds the budget, so regressions such as network calls at
+import time show up in `make bench`.
+
+Usage:
+    python -m benchmarks.bench_import [--module app.agent] [--runs 3] [--budget-ms 500]
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def import_times(module: str) -> dict[str, tuple[int, int]]:
+    """Imports `module` in a fresh interpreter; returns {name: (self_us, cumulative_us)}."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in completed.stderr.splitlines():
+        if match := _LINE.match(line):
+            self_us, cumulative_us, _, name = match.groups()
+            times[name] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def run(module: str, runs: int, budget_ms: float | None) -> None:
+    samples = [import_times(module) for _ in range(runs)]
+    best = min(samples, key=lambda times: times[module][1])
+    total_ms = best[module][1] / 1000
+    own = {
+        name: self_us
+        for name, (self_us, _) in best.items()
+        if name == "app" or name.startswith("app.")
+    }
+    own_ms = sum(own.values()) / 1000
+
+    print(f"import {module}: {total_ms:8.1f} ms total (best of {runs})")
+    print(f"  app modules:    {own_ms:8.1f} ms self time")
+    print(f"  dependencies:   {total_ms - own_ms:8.1f} ms")
+    for name, self_us in sorted(own.items(), key=lambda item: -item[1])[:5]:
+        print(f"    {name:24} {self_us / 1000:8.1f} ms")
+    if budget_ms is not None and own_ms > budget_ms:
+        sys.exit(
+            f"app import time {own_ms:.1f} ms exceeds the {budget_ms:.0f} ms budget"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app.agent")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+    run(args.module, args.runs, args.budget_ms)
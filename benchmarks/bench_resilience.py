@@ -0,0 +1,161 @@
+"""Benchmark: tail latency of model calls with retries and hedging.
+
+Sends `--calls` requests, `--concurrency` at a time, to a fake model with a
+heavy-tailed latency: most calls take about `--latency-ms`, but
+`--slow-rate` of them are `--slow-factor` times slower. A `--throttle-rate`
+share of the calls is answered with a 429 and a retry hint instead. The
+same workload runs without retries, with retries, and with retries and
+hedging at the p95 latency. For each run it reports the latency
+percentiles of the successful calls, failed calls, and attempts and hedges
+per call.
+
+Usage:
+    python -m benchmarks.bench_resilience [--calls 400] [--concurrency 8] [--slow-rate 0.05]
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+from collections.abc import AsyncGenerator
+from typing import Any
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import errors as genai_errors
+from google.genai import types as genai_types
+from pydantic import PrivateAttr
+
+from app.resilience import CallPolicy, ResilientCaller, ResilientLlm
+
+
+class FlakyLlm(BaseLlm):
+    """A fake model with a heavy latency tail and occasional 429s."""
+
+    latency_s: float = 0.05
+    slow_rate: float = 0.05
+    slow_factor: float = 20.0
+    throttle_rate: float = 0.02
+    retry_after_s: float = 0.05
+    seed: int = 0
+    _rng: random.Random = PrivateAttr()
+
+    def model_post_init(self, context: Any) -> None:
+        self._rng = random.Random(self.seed)
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        if self._rng.random() < self.throttle_rate:
+            raise genai_errors.ClientError(
+                429,
+                {
+                    "error": {
+                        "code": 429,
+                        "status": "RESOURCE_EXHAUSTED",
+                        "details": [
+                            {
+                                "@type": "type.googleapis.com/google.rpc.RetryInfo",
+                                "retryDelay": f"{self.retry_after_s}s",
+                            }
+                        ],
+                    }
+                },
+            )
+        delay = self.latency_s * self._rng.uniform(0.8, 1.2)
+        if self._rng.random() < self.slow_rate:
+            delay *= self.slow_factor
+        await asyncio.sleep(delay)
+        yield LlmResponse(
+            content=genai_types.Content(
+                role="model", parts=[genai_types.Part(text="ok")]
+            )
+        )
+
+
+async def workload(
+    llm: ResilientLlm, calls: int, concurrency: int
+) -> tuple[float, list[float], int]:
+    """Runs the calls; returns the wall time, latencies and failures."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    failures = 0
+
+    async def call() -> None:
+        nonlocal failures
+        request = LlmRequest(
+            model=llm.model,
+            contents=[
+                genai_types.Content(role="user", parts=[genai_types.Part(text="q")])
+            ],
+        )
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                async for _ in llm.generate_content_async(request):
+                    pass
+            except Exception:
+                failures += 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(calls)))
+    return time.perf_counter() - started, latencies, failures
+
+
+def run(args: argparse.Namespace) -> None:
+    print(
+        f"{args.calls} calls, {args.concurrency} concurrent, {args.latency_ms} ms typical, "
+        f"{args.slow_rate:.0%} x{args.slow_factor:g} slow, {args.throttle_rate:.0%} throttled"
+    )
+    print(
+        f"{'policy':18} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'max ms':>7} "
+        f"{'failed':>6} {'attempts':>8} {'hedges':>6}"
+    )
+    backoff = args.latency_ms / 1000
+    policies = {
+        "no retries": CallPolicy(max_attempts=1),
+        "retries": CallPolicy(backoff_base_s=backoff),
+        "retries + hedging": CallPolicy(backoff_base_s=backoff, hedge=True),
+    }
+    for label, policy in policies.items():
+        fake = FlakyLlm(
+            model="fake",
+            latency_s=args.latency_ms / 1000,
+            slow_rate=args.slow_rate,
+            slow_factor=args.slow_factor,
+            throttle_rate=args.throttle_rate,
+            retry_after_s=backoff,
+            seed=args.seed,
+        )
+        caller = ResilientCaller()
+        llm = ResilientLlm(
+            model="fake", route="bench", policy=policy, caller=caller, llm=fake
+        )
+        _, latencies, failures = asyncio.run(
+            workload(llm, args.calls, args.concurrency)
+        )
+        percentiles = statistics.quantiles(latencies, n=100)
+        metrics = caller.metrics()["bench/fake"]
+        print(
+            f"{label:18} {percentiles[49] * 1000:7.0f} {percentiles[94] * 1000:7.0f} "
+            f"{percentiles[98] * 1000:7.0f} {max(latencies) * 1000:7.0f} {failures:6d} "
+            f"{metrics['attempts'] / args.calls:8.2f} {metrics['hedges']:6d}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-factor", type=float, default=20.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    # Every retry logs a warning; keep the table readable.
+    logging.disable(logging.WARNING)
+    run(args)
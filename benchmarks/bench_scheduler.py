@@ -0,0 +1,172 @@
+"""Benchmark: throughput and tail latency of concurrent research runs.
+
+Drives `--sessions` fake users at once through `root_agent` on the stub
+model. Each user sends a research request, and all approvals are released
+together. Model calls share a simulated quota of `--capacity` calls in
+flight. A call over the quota is throttled and retried after a backoff, as
+after a 429 response. The burst is run without the run scheduler and then
+with it, limited to `--max-concurrent` pipelines. For each run it reports
+throughput, the p50/p95/p99 latency of the approval turn, the longest queue
+wait, throttled calls and rejected approvals.
+
+All sessions share one stub, so its evaluator passes on the first
+iteration.
+
+Usage:
+    python -m benchmarks.bench_scheduler [--sessions 16] [--max-concurrent 4] [--capacity 8]
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+from collections.abc import AsyncGenerator
+
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.genai import types as genai_types
+
+from app.agent import parallel_section_researcher, root_agent
+from app.replay import substitute_backends
+from app.scheduling import RunScheduler
+from benchmarks.stubs import StubLlm, StubSearchBackend
+
+
+class QuotaStubLlm(StubLlm):
+    """A stub that throttles calls beyond `capacity` calls in flight."""
+
+    capacity: int = 8
+    call_s: float = 0.05
+    backoff_s: float = 0.25
+    in_flight: int = 0
+    throttled: int = 0
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        while self.in_flight >= self.capacity:
+            self.throttled += 1
+            await asyncio.sleep(self.backoff_s)
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(self.call_s)
+        finally:
+            self.in_flight -= 1
+        async for response in super().generate_content_async(llm_request, stream):
+            yield response
+
+
+def message(text: str) -> genai_types.Content:
+    return genai_types.Content(role="user", parts=[genai_types.Part(text=text)])
+
+
+async def user(
+    runner: InMemoryRunner, index: int, planned: asyncio.Event, approve: asyncio.Event
+) -> tuple[float, dict]:
+    """Plans, waits for the burst, approves; returns the approval turn latency."""
+    session = await runner.session_service.create_session(
+        app_name="bench", user_id=f"user{index}"
+    )
+    async for _ in runner.run_async(
+        user_id=session.user_id,
+        session_id=session.id,
+        new_message=message("Research ADK"),
+    ):
+        pass
+    planned.set()
+    await approve.wait()
+    start = time.perf_counter()
+    async for _ in runner.run_async(
+        user_id=session.user_id, session_id=session.id, new_message=message("sim")
+    ):
+        pass
+    latency = time.perf_counter() - start
+    stored = await runner.session_service.get_session(
+        app_name="bench", user_id=session.user_id, session_id=session.id
+    )
+    assert stored is not None
+    return latency, stored.state
+
+
+async def burst(sessions: int) -> tuple[float, list[tuple[float, dict]]]:
+    runner = InMemoryRunner(agent=root_agent, app_name="bench")
+    approve = asyncio.Event()
+    planned = [asyncio.Event() for _ in range(sessions)]
+    users = [
+        asyncio.create_task(user(runner, i, planned[i], approve))
+        for i in range(sessions)
+    ]
+    # Every user plans first, so the approvals arrive together.
+    await asyncio.gather(*(event.wait() for event in planned))
+    start = time.perf_counter()
+    approve.set()
+    results = await asyncio.gather(*users)
+    return time.perf_counter() - start, results
+
+
+def run(sessions: int, goals: int, max_concurrent: int, capacity: int) -> None:
+    stub = QuotaStubLlm(goals=goals, iterations=1, capacity=capacity)
+    configured = root_agent.scheduler
+    print(
+        f"{sessions} sessions x {goals} goals, model quota {capacity} calls in flight"
+    )
+    print(
+        f"{'scheduler':18} {'runs/s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+        f"{'max wait s':>10} {'throttled':>9} {'rejected':>8}"
+    )
+    schedulers = {
+        "off": None,
+        f"max {max_concurrent} running": RunScheduler(
+            max_concurrent=max_concurrent,
+            max_per_user=1,
+            max_per_session=1,
+            max_queued=sessions,
+        ),
+    }
+    try:
+        with substitute_backends(
+            root_agent, lambda agent: stub, lambda tool: StubSearchBackend()
+        ):
+            for label, scheduler in schedulers.items():
+                root_agent.scheduler = scheduler
+                stub.throttled = 0
+                elapsed, results = asyncio.run(burst(sessions))
+                done = [
+                    latency
+                    for latency, state in results
+                    if state.get("final_report_with_citations")
+                ]
+                rejected = sum(
+                    state.get("confirmation_decision") == "rejected"
+                    for _, state in results
+                )
+                waits = [
+                    (state.get("run_queue") or {}).get("waited_s", 0.0)
+                    for _, state in results
+                ]
+                if len(done) > 1:
+                    percentiles = statistics.quantiles(done, n=100)
+                    p50, p95, p99 = percentiles[49], percentiles[94], percentiles[98]
+                else:
+                    p50 = p95 = p99 = done[0] if done else 0.0
+                print(
+                    f"{label:18} {len(done) / elapsed:7.2f} {p50:7.2f} {p95:7.2f} "
+                    f"{p99:7.2f} {max(waits):10.2f} {stub.throttled:9d} {rejected:8d}"
+                )
+    finally:
+        root_agent.scheduler = configured
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--goals", type=int, default=5)
+    parser.add_argument("--max-concurrent", type=int, default=4)
+    parser.add_argument("--capacity", type=int, default=8)
+    args = parser.parse_args()
+    # See benchmarks.bench_end_to_end.
+    logging.getLogger("opentelemetry.context").setLevel(logging.CRITICAL)
+    if parallel_section_researcher is not None:
+        parallel_section_researcher.requests_per_second = 0
+    run(args.sessions, args.goals, args.max_concurrent, args.capacity)
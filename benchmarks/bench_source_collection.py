@@ -0,0 +1,170 @@
+"""Benchmark: full-rescan vs incremental collection of research sources.
+
+Replays a synthetic session in which `section_researcher` and then every
+`iterative_refinement_loop` pass append a batch of grounding events, calling
+the collector after each batch exactly like the `after_agent_callback` does.
+
+Usage:
+    python -m benchmarks.bench_source_collection [--events 5000] [--passes 30]
+"""
+
+import argparse
+import random
+import time
+
+from google.adk.events import Event
+from google.genai import types as genai_types
+
+from app.sources import ClaimIndexCache, collect_sources
+
+
+def legacy_collect(events: list[Event], state: dict) -> None:
+    """The original collector: walks every event on every call."""
+    url_to_short_id = state.get("url_to_short_id", {})
+    sources = state.get("sources", {})
+    id_counter = len(url_to_short_id) + 1
+    for event in events:
+        if not (event.grounding_metadata and event.grounding_metadata.grounding_chunks):
+            continue
+        chunks_info = {}
+        for idx, chunk in enumerate(event.grounding_metadata.grounding_chunks):
+            if not chunk.web:
+                continue
+            url = chunk.web.uri
+            title = (
+                chunk.web.title
+                if chunk.web.title != chunk.web.domain
+                else chunk.web.domain
+            )
+            if url not in url_to_short_id:
+                short_id = f"src-{id_counter}"
+                url_to_short_id[url] = short_id
+                sources[short_id] = {
+                    "short_id": short_id,
+                    "title": title,
+                    "url": url,
+                    "domain": chunk.web.domain,
+                    "supported_claims": [],
+                }
+                id_counter += 1
+            chunks_info[idx] = url_to_short_id[url]
+        for support in event.grounding_metadata.grounding_supports or []:
+            confidence_scores = support.confidence_scores or []
+            chunk_indices = support.grounding_chunk_indices or []
+            for i, chunk_idx in enumerate(chunk_indices):
+                if chunk_idx in chunks_info:
+                    short_id = chunks_info[chunk_idx]
+                    confidence = (
+                        confidence_scores[i] if i < len(confidence_scores) else 0.5
+                    )
+                    text_segment = support.segment.text if support.segment else ""
+                    sources[short_id]["supported_claims"].append(
+                        {"text_segment": text_segment, "confidence": confidence}
+                    )
+    state["url_to_short_id"] = url_to_short_id
+    state["sources"] = sources
+
+
+def incremental_collect(
+    events: list[Event], state: dict, cache: ClaimIndexCache, session_id: str
+) -> None:
+    """Mirrors `collect_research_sources_callback` without a CallbackContext."""
+    url_to_short_id = state.get("url_to_short_id", {})
+    sources = state.get("sources", {})
+    claim_index = cache.get(session_id, sources)
+    state["sources_event_cursor"] = collect_sources(
+        events,
+        sources,
+        url_to_short_id,
+        state.get("sources_event_cursor", 0),
+        claim_index,
+    )
+    cache.update(session_id, sources, claim_index)
+    state["url_to_short_id"] = url_to_short_id
+    state["sources"] = sources
+
+
+def synthetic_batches(
+    total_events: int, passes: int, seed: int = 7
+) -> list[list[Event]]:
+    """Builds `passes` batches of grounding events over a small URL pool."""
+    rng = random.Random(seed)
+    urls = [f"https://google.github.io/adk-docs/page-{i}/" for i in range(200)]
+    per_pass = max(1, total_events // passes)
+    batches = []
+    for _ in range(passes):
+        batch = []
+        for _ in range(per_pass):
+            picked = rng.sample(urls, 4)
+            chunks = [
+                genai_types.GroundingChunk(
+                    web=genai_types.GroundingChunkWeb(
+                        uri=url, title=url.rsplit("/", 2)[-2], domain="google.github.io"
+                    )
+                )
+                for url in picked
+            ]
+            supports = [
+                genai_types.GroundingSupport(
+                    segment=genai_types.Segment(text=f"claim {rng.randrange(400)}"),
+                    grounding_chunk_indices=[rng.randrange(4)],
+                    confidence_scores=[round(rng.random(), 2)],
+                )
+                for _ in range(3)
+            ]
+            batch.append(
+                Event(
+                    author="section_researcher",
+                    grounding_metadata=genai_types.GroundingMetadata(
+                        grounding_chunks=chunks, grounding_supports=supports
+                    ),
+                )
+            )
+            # Interleave plain model events as in a real session.
+            batch.append(Event(author="research_evaluator"))
+        batches.append(batch)
+    return batches
+
+
+def run(total_events: int, passes: int) -> None:
+    batches = synthetic_batches(total_events, passes)
+
+    events: list[Event] = []
+    legacy_state: dict = {}
+    start = time.perf_counter()
+    for batch in batches:
+        events.extend(batch)
+        legacy_collect(events, legacy_state)
+    legacy_seconds = time.perf_counter() - start
+
+    events = []
+    incremental_state: dict = {}
+    cache = ClaimIndexCache()
+    start = time.perf_counter()
+    for batch in batches:
+        events.extend(batch)
+        incremental_collect(events, incremental_state, cache, "bench-session")
+    incremental_seconds = time.perf_counter() - start
+
+    def claim_count(state: dict) -> int:
+        return sum(len(s["supported_claims"]) for s in state["sources"].values())
+
+    assert legacy_state["url_to_short_id"] == incremental_state["url_to_short_id"]
+    print(f"events: {len(events)} ({total_events} grounding) over {passes} passes")
+    print(
+        f"legacy      {legacy_seconds * 1000:9.1f} ms  "
+        f"claims stored: {claim_count(legacy_state)}"
+    )
+    print(
+        f"incremental {incremental_seconds * 1000:9.1f} ms  "
+        f"claims stored: {claim_count(incremental_state)}"
+    )
+    print(f"speedup     {legacy_seconds / incremental_seconds:9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--passes", type=int, default=30)
+    args = parser.parse_args()
+    run(args.events, args.passes)
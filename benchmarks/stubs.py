@@ -0,0 +1,241 @@
+"""Deterministic stand-ins for the model and search backend.
+
+`StubLlm` and `StubSearchBackend` need no fixture. They answer every agent of
+this pipeline with synthetic but well-formed output: a plan with a chosen
+number of goals, grounded research, and evaluations that fail a chosen number
+of times before passing. Swap them in with `app.replay.substitute_backends`.
+"""
+
+import asyncio
+import json
+import re
+from collections import defaultdict
+from collections.abc import AsyncGenerator
+from typing import Any
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import types as genai_types
+from pydantic import PrivateAttr
+
+from app.replay import request_agent
+from app.search import ADK_DOCS_SITE, SEARCH_TOOL_NAME, SearchResult
+
+_SOURCE_ID = re.compile(r"\bsrc-\d+\b")
+_FOLLOW_UP_QUERY = re.compile(r"'search_query': '([^']*)'")
+
+
+def _grounding(
+    key: str, sentences: list[str], sources: int, queries: list[str] | None = None
+) -> genai_types.GroundingMetadata:
+    """Grounds each sentence on one of `sources` docs pages unique to `key`."""
+    return genai_types.GroundingMetadata(
+        web_search_queries=queries,
+        grounding_chunks=[
+            genai_types.GroundingChunk(
+                web=genai_types.GroundingChunkWeb(
+                    uri=f"https://{ADK_DOCS_SITE}stub/{key}/{k}/",
+                    title=f"ADK docs {key} {k}",
+                    domain="google.github.io",
+                )
+            )
+            for k in range(sources)
+        ],
+        grounding_supports=[
+            genai_types.GroundingSupport(
+                segment=genai_types.Segment(text=sentence),
+                grounding_chunk_indices=[index % sources],
+                confidence_scores=[0.9],
+            )
+            for index, sentence in enumerate(sentences)
+        ],
+    )
+
+
+class StubSearchBackend:
+    """Answers every query with `sources` docs pages unique to the query."""
+
+    def __init__(self, sources: int = 3):
+        self.sources = sources
+        self.calls: list[str] = []
+
+    async def search(self, query: str) -> SearchResult:
+        self.calls.append(query)
+        key = f"search-{len(self.calls)}"
+        sentences = [f"Result {k} for {query}." for k in range(self.sources)]
+        return SearchResult(
+            query=query,
+            text=" ".join(sentences),
+            grounding_metadata=_grounding(key, sentences, self.sources),
+        )
+
+
+class StubLlm(BaseLlm):
+    """Deterministic stand-in for Gemini behind every agent of the pipeline.
+
+    Agents are recognized by name. Research agents answer with grounding
+    metadata on `sources_per_call` new docs pages per call. When they have
+    `SearchTool` instead of the built-in search, they call it once first. The
+    evaluator grades "fail" with fresh follow-up queries until its
+    `iterations`-th call. With `thought_chars`, research answers start with a
+    thought part of that length, like agents with `include_thoughts=True`.
+    Each later plan is marked as a revision, so it awaits approval again.
+    Token usage is reported as one token per 4
+    characters of request and response.
+
+    The default model name contains "gemini-2" so the built-in
+    `google_search` tool accepts it.
+    """
+
+    model: str = "gemini-2-stub"
+    goals: int = 5
+    iterations: int = 3
+    sources_per_call: int = 3
+    thought_chars: int = 0
+    delay_s: float = 0.0
+    _calls: dict[str, int] = PrivateAttr(default_factory=lambda: defaultdict(int))
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        if self.delay_s:
+            await asyncio.sleep(self.delay_s)
+        agent = request_agent(llm_request)
+        self._calls[agent] += 1
+        response = self._respond(agent, self._calls[agent], llm_request)
+        prompt = _instruction(llm_request) + "".join(
+            str(content.model_dump(exclude_none=True))
+            for content in llm_request.contents
+        )
+        parts = (response.content.parts or []) if response.content else []
+        output = "".join(
+            part.text or str(part.function_call) for part in parts if not part.thought
+        )
+        thoughts = "".join(part.text or "" for part in parts if part.thought)
+        response.usage_metadata = genai_types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=len(prompt) // 4,
+            candidates_token_count=len(output) // 4,
+            thoughts_token_count=len(thoughts) // 4,
+        )
+        yield response
+
+    def _respond(self, agent: str, call: int, llm_request: LlmRequest) -> LlmResponse:
+        function_responses = [
+            part.function_response
+            for content in llm_request.contents[-1:]
+            for part in content.parts or []
+            if part.function_response
+        ]
+        if agent == "interactive_planner_agent":
+            if function_responses:
+                result = (function_responses[0].response or {}).get("result", "")
+                return _text(str(result))
+            return _call("plan_generator", {"request": "Research the Google ADK."})
+        if agent == "plan_generator":
+            revision = f" (revision {call})" if call > 1 else ""
+            goals = [
+                f"- [RESEARCH] Investigate ADK topic {i}{revision}."
+                for i in range(1, self.goals + 1)
+            ]
+            return _text(
+                "\n".join([*goals, "- [DELIVERABLE][IMPLIED] Create a summary table."])
+            )
+        if agent == "section_planner":
+            return _text(
+                "\n\n".join(
+                    f"# Section {i}\nOverview of ADK topic {i}."
+                    for i in range(1, min(self.goals, 6) + 1)
+                )
+            )
+        if agent == "research_evaluator":
+            grade = "pass" if call >= self.iterations else "fail"
+            queries = (
+                []
+                if grade == "pass"
+                else [
+                    {"search_query": f"site:{ADK_DOCS_SITE} aspect{q} iteration{call}"}
+                    for q in range(1, 4)
+                ]
+            )
+            return _text(
+                json.dumps(
+                    {
+                        "grade": grade,
+                        "comment": f"Evaluation {call}.",
+                        "follow_up_queries": queries,
+                    }
+                )
+            )
+        if agent == "deliverable_synthesizer":
+            return _text(
+                "## [DELIVERABLE] Create a summary table.\n\n| Topic | Notes |\n|---|---|"
+            )
+        if agent in ("report_composer_with_citations",) or agent.startswith(
+            "report_section_writer"
+        ):
+            instruction = _instruction(llm_request)
+            cited = list(dict.fromkeys(_SOURCE_ID.findall(instruction)))[:5]
+            body = " ".join(
+                f'ADK behavior {i} is documented <cite source="{source}"/>.'
+                for i, source in enumerate(cited, start=1)
+            )
+            heading = (
+                "" if agent.startswith("report_section_writer") else "# Report\n\n"
+            )
+            return _text(f"{heading}{body or 'No sources were cited.'}")
+        if agent.startswith(
+            ("goal_researcher", "section_researcher", "enhanced_search_executor")
+        ):
+            if SEARCH_TOOL_NAME in llm_request.tools_dict and not function_responses:
+                return _call(SEARCH_TOOL_NAME, {"query": f"{agent} call {call}"})
+            sentences = [
+                f"{agent} finding {call}.{k} about ADK."
+                for k in range(1, self.sources_per_call + 1)
+            ]
+            heading = (
+                f"## [new] Follow-up {call}\n\n"
+                if agent == "enhanced_search_executor"
+                else ""
+            )
+            parts = [genai_types.Part(text=heading + " ".join(sentences))]
+            if self.thought_chars:
+                thought = (
+                    f"Thinking about {agent} call {call}. " * self.thought_chars
+                )[: self.thought_chars]
+                parts.insert(0, genai_types.Part(text=thought, thought=True))
+            response = LlmResponse(
+                content=genai_types.Content(role="model", parts=parts)
+            )
+            if not function_responses:
+                # The executor runs the follow-up queries of the evaluation.
+                search_queries: list[str] = _FOLLOW_UP_QUERY.findall(
+                    _instruction(llm_request)
+                ) or [f"site:{ADK_DOCS_SITE} {agent} call {call}"]
+                response.grounding_metadata = _grounding(
+                    f"{agent}-{call}", sentences, self.sources_per_call, search_queries
+                )
+            return response
+        return _text("OK")
+
+
+def _instruction(llm_request: LlmRequest) -> str:
+    config = llm_request.config
+    return str(config.system_instruction or "") if config else ""
+
+
+def _text(text: str) -> LlmResponse:
+    return LlmResponse(
+        content=genai_types.Content(role="model", parts=[genai_types.Part(text=text)])
+    )
+
+
+def _call(name: str, args: dict[str, Any]) -> LlmResponse:
+    return LlmResponse(
+        content=genai_types.Content(
+            role="model",
+            parts=[
+                genai_types.Part(
+                    function_call=genai_types.FunctionCall(name=name, args=args)
+                )
+            ],
+        )
+    )
@@ -0,0 +1,222 @@
+"""Tests for the single-pass and streaming citation rewriter."""
+
+import gc
+import random
+import re
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.models import LlmResponse
+from google.adk.sessions import InMemorySessionService, Session
+from google.genai import types as genai_types
+
+from app.agent import _streaming_rewriters, stream_citations_callback
+from app.citations import CitationRewriter
+
+SOURCES = {
+    "src-1": {"title": "Loop agents", "url": "https://google.github.io/adk-docs/loop/"},
+    "src-2": {
+        "domain": "google.github.io",
+        "url": "https://google.github.io/adk-docs/",
+    },
+    "src-3": {"title": "Odd title ; spaced", "url": "https://example.com/odd"},
+}
+
+
+def legacy_rewrite(report: str, sources: dict) -> str:
+    """The original two-pass rewrite of `citation_replacement_callback`."""
+
+    def tag_replacer(match: re.Match) -> str:
+        short_id = match.group(1)
+        if not (source_info := sources.get(short_id)):
+            return ""
+        display_text = source_info.get("title", source_info.get("domain", short_id))
+        return f" [{display_text}]({source_info['url']})"
+
+    processed = re.sub(
+        r'<cite\s+source\s*=\s*["\']?\s*(src-\d+)\s*["\']?\s*/>', tag_replacer, report
+    )
+    return re.sub(r"\s+([.,;:])", r"\1", processed)
+
+
+def random_report(rng: random.Random, pieces: int) -> str:
+    vocabulary = [
+        "LoopAgent",
+        "runs",
+        " ",
+        "  ",
+        "\n",
+        ".",
+        ",",
+        ";",
+        ":",
+        "<",
+        "a < b",
+        '<cite source="src-1"/>',
+        "<cite source='src-2' />",
+        "<cite  source = src-3/>",
+        '<cite source="src-9"/>',
+        "<cite source=",
+        "<citation>",
+    ]
+    return "".join(rng.choice(vocabulary) for _ in range(pieces))
+
+
+def stream(report: str, rng: random.Random) -> str:
+    rewriter = CitationRewriter(SOURCES)
+    output, position = [], 0
+    while position < len(report):
+        size = rng.randint(1, 12)
+        output.append(rewriter.feed(report[position : position + size]))
+        position += size
+    output.append(rewriter.flush())
+    return "".join(output)
+
+
+def text_of(response: LlmResponse) -> str:
+    assert response.content and response.content.parts
+    return response.content.parts[0].text or ""
+
+
+def test_rewrite_matches_legacy_output() -> None:
+    report = (
+        'LoopAgent repeats <cite source="src-1"/>. Callbacks run '
+        "<cite source='src-2'/> <cite source=\"src-7\"/> , and tools "
+        '<cite source=src-3/> ; done <cite source="src-9"/> .'
+    )
+
+    assert CitationRewriter(SOURCES).rewrite(report) == legacy_rewrite(report, SOURCES)
+    assert CitationRewriter(SOURCES).rewrite(report).endswith("done.")
+
+
+def test_random_reports_match_legacy_whole_and_streamed() -> None:
+    rng = random.Random(7)
+    for _ in range(500):
+        report = random_report(rng, rng.randint(0, 40))
+        expected = legacy_rewrite(report, SOURCES)
+        assert CitationRewriter(SOURCES).rewrite(report) == expected, report
+        assert stream(report, rng) == expected, report
+
+
+def test_tag_split_across_chunks_is_held_back() -> None:
+    rewriter = CitationRewriter(SOURCES)
+
+    assert rewriter.feed("Loops repeat <ci") == "Loops repeat"
+    assert rewriter.feed('te source="sr') == ""
+    assert rewriter.feed('c-1"/>') == ""
+    assert rewriter.feed(" until they escalate.") == (
+        "  [Loop agents](https://google.github.io/adk-docs/loop/) until they escalate."
+    )
+    assert rewriter.flush() == ""
+
+
+def test_plain_text_is_not_held_back() -> None:
+    rewriter = CitationRewriter(SOURCES)
+
+    assert rewriter.feed("a < b and <b>bold</b>") == "a < b and <b>bold</b>"
+    assert rewriter.feed(" next ") == " next"
+    assert rewriter.feed(".") == "."
+
+
+def test_streaming_callback_rewrites_partial_responses() -> None:
+    session = Session(id="s", app_name="test", user_id="u", state={"sources": SOURCES})
+    callback_context = CallbackContext(
+        InvocationContext(
+            session_service=InMemorySessionService(),
+            invocation_id="inv-1",
+            agent=BaseAgent(name="report_composer_with_citations"),
+            session=session,
+        )
+    )
+
+    def respond(text: str, partial: bool = True) -> LlmResponse:
+        response = LlmResponse(
+            content=genai_types.Content(
+                role="model", parts=[genai_types.Part(text=text)]
+            ),
+            partial=partial,
+        )
+        stream_citations_callback(callback_context, response)
+        return response
+
+    streamed = [
+        text_of(respond(chunk))
+        for chunk in ["Loops repeat <cite sou", 'rce="src-1"/>', " until done."]
+    ]
+    final = respond('Loops repeat <cite source="src-1"/> until done.', partial=False)
+
+    assert "".join(streamed) == legacy_rewrite(
+        'Loops repeat <cite source="src-1"/> until done.', SOURCES
+    )
+    assert streamed[0] == "Loops repeat"
+    assert text_of(final).count("<cite") == 1
+
+
+def test_streaming_callback_flushes_the_held_back_tail() -> None:
+    def run(end: LlmResponse) -> LlmResponse:
+        session = Session(
+            id="s", app_name="test", user_id="u", state={"sources": SOURCES}
+        )
+        callback_context = CallbackContext(
+            InvocationContext(
+                session_service=InMemorySessionService(),
+                invocation_id="inv-3",
+                agent=BaseAgent(name="report_composer_with_citations"),
+                session=session,
+            )
+        )
+        chunk = LlmResponse(
+            content=genai_types.Content(
+                role="model", parts=[genai_types.Part(text="Use a < b <ci")]
+            ),
+            partial=True,
+        )
+        stream_citations_callback(callback_context, chunk)
+        assert text_of(chunk) == "Use a < b"
+        stream_citations_callback(callback_context, end)
+        assert id(callback_context._invocation_context) not in _streaming_rewriters
+        return end
+
+    final = run(
+        LlmResponse(
+            content=genai_types.Content(
+                role="model", parts=[genai_types.Part(text="Use a < b <ci")]
+            )
+        )
+    )
+    assert text_of(final) == "Use a < b <ci"
+    assert final.custom_metadata == {"stream_tail": " <ci"}
+
+    turn_complete = run(LlmResponse(turn_complete=True))
+    assert turn_complete.partial
+    assert text_of(turn_complete) == " <ci"
+
+
+def test_streaming_rewriters_go_away_with_interrupted_runs() -> None:
+    def interrupted_run() -> None:
+        session = Session(
+            id="s", app_name="test", user_id="u", state={"sources": SOURCES}
+        )
+        callback_context = CallbackContext(
+            InvocationContext(
+                session_service=InMemorySessionService(),
+                invocation_id="inv-2",
+                agent=BaseAgent(name="report_composer_with_citations"),
+                session=session,
+            )
+        )
+        response = LlmResponse(
+            content=genai_types.Content(
+                role="model", parts=[genai_types.Part(text="Loops")]
+            ),
+            partial=True,
+        )
+        stream_citations_callback(callback_context, response)
+        assert len(_streaming_rewriters) == before + 1
+
+    before = len(_streaming_rewriters)
+    # No final response: the run failed or was cancelled mid-stream.
+    interrupted_run()
+    gc.collect()
+    assert len(_streaming_rewriters) == before
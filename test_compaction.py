@@ -0,0 +1,220 @@
+"""Tests for compaction of the stored session events and model requests."""
+
+import asyncio
+from typing import Any
+
+from google.adk.events import Event, EventActions
+from google.adk.runners import InMemoryRunner
+from google.adk.sessions import Session
+from google.genai import types as genai_types
+
+from app.agent import root_agent
+from app.compaction import (
+    COMPACTION_CURSOR_KEY,
+    CompactionPolicy,
+    compact_contents,
+    compact_session_events,
+    current_findings_records,
+)
+from app.replay import substitute_backends
+from app.search import SEARCH_TOOL_NAME
+from app.sources import SOURCES_CURSOR_KEY
+from benchmarks.stubs import StubLlm, StubSearchBackend
+
+
+def model_content(text: str, thought: str | None = None) -> genai_types.Content:
+    parts = [genai_types.Part(text=thought, thought=True)] if thought else []
+    parts.append(genai_types.Part(text=text))
+    return genai_types.Content(role="model", parts=parts)
+
+
+def user_content(text: str) -> genai_types.Content:
+    return genai_types.Content(role="user", parts=[genai_types.Part(text=text)])
+
+
+def function_contents(call_id: str) -> list[genai_types.Content]:
+    call = genai_types.FunctionCall(
+        id=call_id, name=SEARCH_TOOL_NAME, args={"query": "q"}
+    )
+    response = genai_types.FunctionResponse(
+        id=call_id,
+        name=SEARCH_TOOL_NAME,
+        response={"summary": "s", "grounding_metadata": {"grounding_chunks": []}},
+    )
+    return [
+        genai_types.Content(role="model", parts=[genai_types.Part(function_call=call)]),
+        genai_types.Content(
+            role="user", parts=[genai_types.Part(function_response=response)]
+        ),
+    ]
+
+
+def parts_of(content: genai_types.Content | None) -> list[genai_types.Part]:
+    assert content and content.parts
+    return content.parts
+
+
+def response_of(content: genai_types.Content | None) -> dict[str, Any]:
+    function_response = parts_of(content)[0].function_response
+    assert function_response and function_response.response is not None
+    return function_response.response
+
+
+def test_strips_thoughts_and_grounding_from_a_copy() -> None:
+    contents = [
+        model_content("old", thought="thinking"),
+        *function_contents("call-1"),
+        model_content("", thought="only thinking"),
+    ]
+    compacted, stats = compact_contents(contents, CompactionPolicy())
+
+    assert (stats.thought_parts, stats.grounding) == (2, 1)
+    assert [len(parts_of(content)) for content in compacted] == [1, 1, 1, 1]
+    assert not any(part.thought for content in compacted for part in parts_of(content))
+    assert "grounding_metadata" not in response_of(compacted[2])
+    # The request's contents are copied, never changed.
+    assert parts_of(contents[0])[0].thought
+    assert "grounding_metadata" in response_of(contents[2])
+
+
+def test_stored_events_are_compacted_once_their_sources_are_collected() -> None:
+    call, response = function_contents("call-1")
+    events = [
+        Event(author="goal_researcher_1", content=model_content("a", "thinking")),
+        Event(author="goal_researcher_1", content=call),
+        Event(author="goal_researcher_1", content=response),
+        Event(author="research_evaluator", content=model_content("b", "thinking")),
+    ]
+    policy = CompactionPolicy(max_events=0)
+
+    cursor, stats = compact_session_events(events, policy, lambda a: True, {}, 3)
+    assert (cursor["stripped"], cursor["checked"]) == (3, 0)
+    assert (stats.thought_parts, stats.grounding) == (1, 1)
+    assert [part.text for part in parts_of(events[0].content)] == ["a"]
+    assert "grounding_metadata" not in response_of(events[2].content)
+    # Not collected yet: the grounding may still be needed.
+    assert parts_of(events[3].content)[0].thought
+
+    # Resumes from the cursor instead of rescanning the session.
+    cursor, stats = compact_session_events(events, policy, lambda a: True, cursor, 4)
+    assert cursor["stripped"] == 4
+    assert (stats.thought_parts, stats.grounding) == (1, 0)
+
+
+def test_overwritten_state_delta_values_are_dropped_from_stored_events() -> None:
+    def writes(**state_delta: Any) -> Event:
+        return Event(author="collector", actions=EventActions(state_delta=state_delta))
+
+    events = [writes(sources={"src-1": 1}, plan="p"), writes(sources={"src-2": 2})]
+    policy = CompactionPolicy()
+
+    cursor, stats = compact_session_events(events, policy, lambda a: True, {}, 2)
+    assert stats.state_values == 1
+    assert [event.actions.state_delta for event in events] == [
+        {"plan": "p"},
+        {"sources": {"src-2": 2}},
+    ]
+
+    # Writers are remembered across calls.
+    events.append(writes(sources={"src-3": 3}))
+    _, stats = compact_session_events(events, policy, lambda a: True, cursor, 3)
+    assert stats.state_values == 1
+    assert events[1].actions.state_delta == {}
+
+
+def test_cap_keeps_user_messages_tool_calls_and_kept_authors() -> None:
+    events = [
+        Event(author="user", content=user_content("topic")),
+        Event(author="interactive_planner_agent", content=model_content("old plan")),
+        Event(author="section_researcher", content=model_content("findings")),
+        *(
+            Event(author="section_researcher", content=content)
+            for content in function_contents("call-1")
+        ),
+        Event(author="report_composer", content=model_content("old report")),
+        Event(author="research_evaluator", content=model_content("grade: fail")),
+        Event(author="report_composer", content=model_content("new report")),
+    ]
+    kept = {"section_researcher", "research_evaluator"}
+
+    cursor, stats = compact_session_events(
+        events,
+        CompactionPolicy(strip_grounding=False, max_events=2),
+        lambda author: author in kept,
+        {},
+        len(events),
+    )
+
+    assert stats.events_dropped == 2
+    assert (cursor["stripped"], cursor["checked"]) == (len(events), len(events) - 2)
+    assert [event.content is None for event in events] == [
+        False,
+        True,
+        False,
+        False,
+        False,
+        True,
+        False,
+        False,
+    ]
+
+
+def test_current_findings_records_keeps_latest_versions_in_order() -> None:
+    records = [
+        {"id": "sec-1", "title": "A", "text": "v1", "iteration": 0},
+        {"id": "sec-2", "title": "B", "text": "v1", "iteration": 0},
+        {"id": "sec-1", "title": "A", "text": "v2", "iteration": 1},
+    ]
+    assert [(r["id"], r["text"]) for r in current_findings_records(records)] == [
+        ("sec-1", "v2"),
+        ("sec-2", "v1"),
+    ]
+
+
+def test_long_sessions_store_compacted_events_and_keep_their_sources() -> None:
+    stub = StubLlm(goals=3, iterations=3, thought_chars=200)
+
+    async def scenario() -> Session | None:
+        runner = InMemoryRunner(agent=root_agent, app_name="test")
+        session = await runner.session_service.create_session(
+            app_name="test", user_id="u"
+        )
+        for message in ["Research ADK callbacks", "sim"]:
+            async for _ in runner.run_async(
+                user_id="u",
+                session_id=session.id,
+                new_message=genai_types.Content(
+                    role="user", parts=[genai_types.Part(text=message)]
+                ),
+            ):
+                pass
+        return await runner.session_service.get_session(
+            app_name="test", user_id="u", session_id=session.id
+        )
+
+    with substitute_backends(
+        root_agent, lambda agent: stub, lambda tool: StubSearchBackend()
+    ):
+        session = asyncio.run(scenario())
+
+    assert session is not None
+    state = session.state
+    assert state["session_compaction"]["thought_parts"] > 0
+    compacted = state[COMPACTION_CURSOR_KEY]["stripped"]
+    assert 0 < compacted <= state[SOURCES_CURSOR_KEY]
+    assert not any(
+        part.thought
+        or (
+            part.function_response
+            and "grounding_metadata" in (part.function_response.response or {})
+        )
+        for event in session.events[:compacted]
+        for part in ((event.content.parts or []) if event.content else [])
+    )
+    assert (
+        sum(event.author == "enhanced_search_executor" for event in session.events) >= 2
+    )
+    # Three goals and two refinement passes, three new pages each.
+    assert len(state["sources"]) == 15
+    ids = [record["id"] for record in state["findings_sections"]]
+    assert len(ids) == len(set(ids))
@@ -0,0 +1,78 @@
+"""Tests for lazy environment setup and instruction date stamps."""
+
+import asyncio
+import datetime
+import subprocess
+import sys
+
+import google.auth
+import pytest
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.sessions import InMemorySessionService, Session
+
+from app import config as config_module
+from app.agent import plan_generator
+
+
+def test_importing_the_app_resolves_no_credentials() -> None:
+    probe = (
+        "import google.auth\n"
+        "def fail(*args, **kwargs):\n"
+        "    raise AssertionError('google.auth.default() called at import')\n"
+        "google.auth.default = fail\n"
+        "import app, app.agent\n"
+        "assert app.root_agent.name == 'confirmation_gate'\n"
+    )
+
+    completed = subprocess.run(
+        [sys.executable, "-c", probe], capture_output=True, text=True
+    )
+
+    assert completed.returncode == 0, completed.stderr
+
+
+def test_credentials_are_resolved_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls: list[int] = []
+
+    def default() -> tuple[None, str]:
+        calls.append(1)
+        return None, "test-project"
+
+    monkeypatch.setattr(google.auth, "default", default)
+    monkeypatch.setenv("GOOGLE_GENAI_USE_VERTEXAI", "True")
+    monkeypatch.delenv("GOOGLE_CLOUD_PROJECT", raising=False)
+    monkeypatch.setattr(config_module, "env_path", config_module.env_path / "missing")
+    config_module.ensure_environment.cache_clear()
+
+    assert config_module.ensure_environment() == "test-project"
+    assert config_module.ensure_environment() == "test-project"
+    assert len(calls) == 1
+    config_module.ensure_environment.cache_clear()
+
+
+def test_instruction_date_is_stamped_at_call_time(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    session = Session(
+        id="s", app_name="test", user_id="u", state={"research_plan": "- [RESEARCH] A"}
+    )
+    ctx = ReadonlyContext(
+        InvocationContext(
+            session_service=InMemorySessionService(),
+            invocation_id="inv-1",
+            agent=plan_generator,
+            session=session,
+        )
+    )
+
+    class Tomorrow(datetime.datetime):
+        @classmethod
+        def now(cls, tz: datetime.tzinfo | None = None) -> "Tomorrow":
+            return cls(2031, 1, 2)
+
+    monkeypatch.setattr(datetime, "datetime", Tomorrow)
+    instruction, _ = asyncio.run(plan_generator.canonical_instruction(ctx))
+
+    assert "Current date: 2031-01-02" in instruction
+    assert "- [RESEARCH] A" in instruction
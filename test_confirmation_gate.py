@@ -3,7 +3,19 @@
 Script de teste para verificar o funcionamento do ConfirmationGateAgent
 """
 
+import asyncio
+from collections.abc import AsyncGenerator
+
+import pytest
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.genai import types as genai_types
+
 from app.agent import ConfirmationGateAgent
+from app.confirmation import classify_reply, is_cancel_request
 
 def test_confirmation_words():
     """Testa se as palavras de confirmação estão configuradas"""
@@ -26,13 +38,141 @@ def test_confirmation_words():
         ("sim, pode executar", True),
         ("ok, vamos lá", True),
         ("hmm não sei", False),
+        ("Não, não execute ainda", False),
+        ("sim, mas adicione uma seção sobre callbacks", False),
+        ("pesquise sobre o Google ADK", False),
+        ("Go ahead!", True),
+        ("don't run it yet", False),
     ]
     
     print("\n🧪 Testando detecção de confirmação:")
     for text, expected in test_cases:
-        found = any(word in text.lower() for word in agent.CONFIRMATION_WORDS)
+        found = classify_reply(text) == "approval"
         status = "✅" if found == expected else "❌"
         print(f"  {status} '{text}' -> {'Confirmado' if found else 'Não confirmado'}")
+        assert found == expected, text
+
+    assert is_cancel_request("Cancela, por favor") and is_cancel_request("stop it")
+    assert not is_cancel_request("não pare a pesquisa antes de cobrir os callbacks do ADK")
+
+
+class PlanLlm(BaseLlm):
+    """Modelo falso que sempre apresenta o mesmo plano e conta as chamadas."""
+
+    calls: int = 0
+    tools: tuple[str, ...] = ()
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        self.calls += 1
+        self.tools = (*self.tools, *llm_request.tools_dict)
+        yield LlmResponse(
+            content=genai_types.Content(
+                role="model", parts=[genai_types.Part(text="- [RESEARCH] Plano")]
+            )
+        )
+
+
+class FakePipeline(BaseAgent):
+    """Pipeline falso que só registra que foi executado."""
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        yield Event(author=self.name)
+
+
+def test_gate_runs_pipeline_on_approval_without_model_call() -> None:
+    """Aprovação executa o pipeline direto; feedback volta para o planejador"""
+    model = PlanLlm(model="stub")
+    planner = LlmAgent(
+        name="interactive_planner_agent",
+        model=model,
+        output_key="research_plan",
+        disallow_transfer_to_parent=True,
+        disallow_transfer_to_peers=True,
+    )
+    gate = ConfirmationGateAgent(sub_agents=[planner, FakePipeline(name="research_pipeline")])
+
+    async def run() -> list[list[str]]:
+        runner = InMemoryRunner(agent=gate, app_name="test")
+        session = await runner.session_service.create_session(
+            app_name="test", user_id="u"
+        )
+        authors = []
+        for text in ["pesquise callbacks", "mude o foco", "sim, pode executar", "ok"]:
+            turn = []
+            async for event in runner.run_async(
+                user_id="u",
+                session_id=session.id,
+                new_message=genai_types.Content(
+                    role="user", parts=[genai_types.Part(text=text)]
+                ),
+            ):
+                turn.append(event.author)
+            authors.append(turn)
+        return authors
+
+    authors = asyncio.run(run())
+
+    assert "interactive_planner_agent" in authors[0]
+    assert "interactive_planner_agent" in authors[1]
+    assert authors[2] == ["confirmation_gate", "research_pipeline"]
+    # O mesmo plano não é executado duas vezes.
+    assert "research_pipeline" not in authors[3]
+    assert model.calls == 3
+    # O planejador não consegue transferir para o pipeline por conta própria.
+    assert "transfer_to_agent" not in model.tools
+
+
+def test_only_the_gate_starts_research_pipeline() -> None:
+    """O pipeline pertence ao portão; o planejador não tem como transferir"""
+    from app.agent import interactive_planner_agent, research_pipeline, root_agent
+
+    assert research_pipeline.parent_agent is root_agent
+    assert root_agent.sub_agents[0] is interactive_planner_agent
+    assert not interactive_planner_agent.sub_agents
+    assert interactive_planner_agent.disallow_transfer_to_parent
+    assert interactive_planner_agent.disallow_transfer_to_peers
+
+
+@pytest.mark.parametrize(
+    "reply",
+    [
+        "Pode incluir callbacks?",
+        "pode adicionar sessões",
+        "go deeper",
+        "run more searches",
+        "vai mais fundo",
+        "start over",
+        "faça mais curto",
+        "okay?",
+        "sim?",
+    ],
+)
+def test_questions_and_feedback_are_not_approvals(reply: str) -> None:
+    """Perguntas e pedidos de mudança vão para o planejador"""
+    assert classify_reply(reply) != "approval"
+    if reply.endswith("?"):
+        assert classify_reply(reply) == "ambiguous"
+
+
+@pytest.mark.parametrize(
+    "reply, cancels",
+    [
+        ("não pare", False),
+        ("cancela isso não", False),
+        ("don't stop", False),
+        ("não cancele a pesquisa", False),
+        ("não, cancela", True),
+        ("no, stop it", True),
+        ("pare, por favor", True),
+    ],
+)
+def test_negated_cancel_verbs_do_not_cancel(reply: str, cancels: bool) -> None:
+    """Um "não" junto do verbo inverte o pedido de cancelamento"""
+    assert is_cancel_request(reply) is cancels
 
 if __name__ == "__main__":
-    test_confirmation_words()
\ No newline at end of file
+    test_confirmation_words()
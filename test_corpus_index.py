@@ -0,0 +1,105 @@
+"""Tests for the offline ADK docs corpus index."""
+
+import asyncio
+from pathlib import Path
+from typing import Any
+
+from google.adk.events import Event
+
+from app.corpus_index import (
+    CorpusIndex,
+    LocalIndexSearchBackend,
+    build_index,
+    trigram_embedding,
+)
+from app.sources import collect_sources
+
+
+def write_docs(root: Path) -> None:
+    (root / "agents").mkdir()
+    (root / "index.md").write_text(
+        "# Agent Development Kit\n\nADK is a framework for building agents.\n"
+    )
+    (root / "agents" / "workflow-agents.md").write_text(
+        "# Workflow agents\n\n"
+        "A LoopAgent runs its sub-agents repeatedly until max_iterations is reached "
+        "or a sub-agent escalates.\n\n"
+        "A SequentialAgent runs its sub-agents in order.\n"
+    )
+    (root / "callbacks.html").write_text(
+        "<html><head><title>Callbacks</title><script>var x;</script></head>"
+        "<body><nav>menu</nav><p>before_model_callback runs before every model "
+        "call.</p><p>after_agent_callback runs after the agent.</p></body></html>"
+    )
+
+
+def test_bm25_ranks_matching_page_first(tmp_path: Path) -> None:
+    docs, index_dir = tmp_path / "docs", tmp_path / "index"
+    docs.mkdir()
+    write_docs(docs)
+
+    assert build_index(docs, index_dir) == 3
+    index = CorpusIndex(index_dir)
+    hits = index.search("site:google.github.io/adk-docs/ LoopAgent max_iterations")
+    index.close()
+
+    assert (
+        hits[0].chunk.url == "https://google.github.io/adk-docs/agents/workflow-agents/"
+    )
+    assert hits[0].chunk.title == "Workflow agents"
+
+
+def test_html_pages_drop_scripts_and_navigation(tmp_path: Path) -> None:
+    docs, index_dir = tmp_path / "docs", tmp_path / "index"
+    docs.mkdir()
+    write_docs(docs)
+    build_index(docs, index_dir)
+
+    index = CorpusIndex(index_dir)
+    [hit] = index.search("before_model_callback", top_k=1)
+    index.close()
+
+    assert hit.chunk.url == "https://google.github.io/adk-docs/callbacks/"
+    assert "menu" not in hit.chunk.text
+    assert "var x" not in hit.chunk.text
+
+
+def test_vector_search_matches_inflected_terms(tmp_path: Path) -> None:
+    docs, index_dir = tmp_path / "docs", tmp_path / "index"
+    docs.mkdir()
+    write_docs(docs)
+    build_index(docs, index_dir, embed_fn=trigram_embedding)
+
+    lexical_only = CorpusIndex(index_dir)
+    hybrid = CorpusIndex(index_dir, embed_fn=trigram_embedding)
+
+    assert lexical_only.search("escalating loops") == []
+    assert hybrid.search("escalating loops")[0].chunk.title == "Workflow agents"
+    lexical_only.close()
+    hybrid.close()
+
+
+def test_backend_results_become_citable_sources(tmp_path: Path) -> None:
+    docs, index_dir = tmp_path / "docs", tmp_path / "index"
+    docs.mkdir()
+    write_docs(docs)
+    build_index(docs, index_dir)
+    backend = LocalIndexSearchBackend(CorpusIndex(index_dir), top_k=2)
+
+    result = asyncio.run(backend.search("SequentialAgent order"))
+
+    sources: dict[str, Any] = {}
+    url_to_short_id: dict[str, str] = {}
+    collect_sources(
+        [
+            Event(
+                author="section_researcher",
+                grounding_metadata=result.grounding_metadata,
+            )
+        ],
+        sources,
+        url_to_short_id,
+    )
+    assert sources["src-1"]["url"].endswith("/agents/workflow-agents/")
+    assert sources["src-1"]["supported_claims"][0]["confidence"] == 1.0
+    backend.index.close()
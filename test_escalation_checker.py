@@ -0,0 +1,150 @@
+"""Tests for the convergence checks that stop the refinement loop."""
+
+import asyncio
+import time
+
+from google.adk.runners import InMemoryRunner
+from google.genai import types as genai_types
+
+from app.agent import EscalationChecker
+
+
+def evaluation(*queries: str, grade: str = "fail") -> dict:
+    return {
+        "grade": grade,
+        "comment": "",
+        "follow_up_queries": [{"search_query": q} for q in queries],
+    }
+
+
+def source(claims: int) -> dict:
+    return {"supported_claims": [{"text_segment": str(i)} for i in range(claims)]}
+
+
+def run_checker(checker: EscalationChecker, state: dict) -> tuple[dict, bool]:
+    async def run() -> tuple[dict, bool]:
+        runner = InMemoryRunner(agent=checker, app_name="test")
+        session = await runner.session_service.create_session(
+            app_name="test", user_id="u", state=state
+        )
+        escalated = False
+        async for event in runner.run_async(
+            user_id="u",
+            session_id=session.id,
+            new_message=genai_types.Content(
+                role="user", parts=[genai_types.Part(text="go")]
+            ),
+        ):
+            escalated = escalated or bool(event.actions.escalate)
+        stored = await runner.session_service.get_session(
+            app_name="test", user_id="u", session_id=session.id
+        )
+        assert stored is not None
+        return stored.state, escalated
+
+    return asyncio.run(run())
+
+
+def test_pass_grade_stops_the_loop() -> None:
+    state, escalated = run_checker(
+        EscalationChecker(name="checker"),
+        {"research_evaluation": evaluation(grade="pass")},
+    )
+
+    assert escalated
+    assert state["refinement_stop_reason"] == "pass"
+
+
+def test_new_queries_and_new_sources_keep_refining() -> None:
+    state, escalated = run_checker(
+        EscalationChecker(name="checker", stall_iterations=2, query_similarity=0.8),
+        {
+            "research_evaluation": evaluation("LoopAgent escalate event"),
+            "sources": {"src-1": source(2), "src-2": source(1)},
+            "refinement_progress": [[1, 1], [1, 2]],
+            "refinement_queries": ["site:google.github.io/adk-docs/ agenttool"],
+        },
+    )
+
+    assert not escalated
+    assert state.get("refinement_stop_reason") is None
+    assert state["refinement_progress"][-1] == [2, 3]
+    assert state["refinement_queries"][-1] == (
+        "site:google.github.io/adk-docs/ loopagent escalate event"
+    )
+
+
+def test_stalled_sources_stop_the_loop() -> None:
+    state, escalated = run_checker(
+        EscalationChecker(name="checker", stall_iterations=2),
+        {
+            "research_evaluation": evaluation("a brand new question"),
+            "sources": {"src-1": source(2)},
+            "refinement_progress": [[1, 2], [1, 2]],
+        },
+    )
+
+    assert escalated
+    assert state["refinement_stop_reason"] == "no_new_sources"
+
+
+def test_repeated_follow_up_queries_stop_the_loop() -> None:
+    state, escalated = run_checker(
+        EscalationChecker(name="checker", query_similarity=0.8),
+        {
+            "research_evaluation": evaluation(
+                "site:google.github.io/adk-docs/ LoopAgent  max_iterations"
+            ),
+            "refinement_queries": [
+                "site:google.github.io/adk-docs/ loopagent max_iterations"
+            ],
+        },
+    )
+
+    assert escalated
+    assert state["refinement_stop_reason"] == "repeated_queries"
+
+
+def test_follow_ups_dropped_as_executed_count_as_repeated() -> None:
+    filtered = {**evaluation(), "dropped_follow_up_queries": ["adk callbacks"]}
+    state, escalated = run_checker(
+        EscalationChecker(name="checker"), {"research_evaluation": filtered}
+    )
+    no_queries_state, _ = run_checker(
+        EscalationChecker(name="checker"), {"research_evaluation": evaluation()}
+    )
+
+    assert escalated
+    assert state["refinement_stop_reason"] == "repeated_queries"
+    assert no_queries_state["refinement_stop_reason"] == "no_follow_up_queries"
+
+
+def test_budgets_stop_the_loop() -> None:
+    metrics = [
+        {"prompt_tokens": 900, "output_tokens": 50, "thought_tokens": 50},
+    ]
+    token_state, escalated = run_checker(
+        EscalationChecker(name="checker", max_tokens=1000),
+        {"research_evaluation": evaluation("q"), "refinement_metrics": metrics},
+    )
+    state, _ = run_checker(
+        EscalationChecker(name="checker", max_seconds=60),
+        {
+            "research_evaluation": evaluation("q"),
+            "refinement_started_at": time.time() - 61,
+        },
+    )
+
+    assert escalated
+    assert token_state["refinement_stop_reason"] == "token_budget"
+    assert state["refinement_stop_reason"] == "time_budget"
+
+
+def test_last_iteration_is_recorded_without_escalating() -> None:
+    state, escalated = run_checker(
+        EscalationChecker(name="checker", max_iterations=3),
+        {"research_evaluation": evaluation("q"), "refinement_iteration": 3},
+    )
+
+    assert not escalated
+    assert state["refinement_stop_reason"] == "max_iterations"
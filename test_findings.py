@@ -0,0 +1,197 @@
+"""Tests for delta-based refinement of the research findings."""
+
+import asyncio
+import json
+from collections.abc import AsyncGenerator
+
+from google.adk.agents import LoopAgent
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.genai import types as genai_types
+
+from app.agent import enhanced_search_executor, research_evaluator
+from app.findings import (
+    current_sections,
+    merge_findings_delta,
+    render_evaluator_view,
+    render_findings,
+    sections_from_text,
+)
+
+FINDINGS = """## [RESEARCH] Analyze LoopAgent
+
+LoopAgent repeats its sub-agents.
+
+## [RESEARCH] Investigate callbacks
+
+Callbacks run around model calls.
+"""
+
+
+def test_delta_appends_versions_and_keeps_unchanged_sections() -> None:
+    records = sections_from_text(FINDINGS)
+
+    records, change = merge_findings_delta(
+        records,
+        "## [sec-2] Callbacks\n\nCallbacks run around model and tool calls.\n\n"
+        "## [new] Sessions\n\nSessions hold state.",
+        iteration=1,
+    )
+
+    assert len(records) == 4
+    latest = current_sections(records)
+    assert latest["sec-1"]["text"] == "LoopAgent repeats its sub-agents."
+    assert latest["sec-2"]["title"] == "[RESEARCH] Investigate callbacks"
+    assert latest["sec-2"]["text"] == "Callbacks run around model and tool calls."
+    assert change["changed_ids"] == ["sec-2"]
+    assert change["added_ids"] == ["sec-3"]
+    assert render_findings(records).index("Analyze LoopAgent") < render_findings(
+        records
+    ).index("Sessions hold state.")
+
+
+def test_delta_matches_sections_by_title_and_skips_identical_text() -> None:
+    records = sections_from_text(FINDINGS)
+
+    records, change = merge_findings_delta(
+        records,
+        "## [RESEARCH] Analyze LoopAgent\n\nLoopAgent repeats its sub-agents.",
+        iteration=1,
+    )
+
+    assert len(records) == 2
+    assert change["summary"] == "Iteration 1: no sections changed"
+
+
+def test_delta_without_headings_becomes_one_section() -> None:
+    records, change = merge_findings_delta(
+        sections_from_text(FINDINGS), "Plain text without headings.", iteration=1
+    )
+
+    assert change["added_ids"] == ["sec-3"]
+    assert current_sections(records)["sec-3"]["text"] == "Plain text without headings."
+
+
+def test_evaluator_reads_full_text_only_when_needed() -> None:
+    records = sections_from_text(FINDINGS * 5)
+    view, complete = render_evaluator_view(records, None, full_review_ratio=0.5)
+    assert complete and "LoopAgent repeats" in view
+
+    records, change = merge_findings_delta(
+        records, "## [sec-2] x\n\nMore detail on callbacks.", iteration=1
+    )
+    view, complete = render_evaluator_view(records, change, full_review_ratio=0.5)
+
+    assert not complete
+    assert "More detail on callbacks." in view
+    assert "LoopAgent repeats" not in view
+    assert "- [sec-1] [RESEARCH] Analyze LoopAgent" in view
+
+
+class ScriptedLlm(BaseLlm):
+    """Returns scripted texts in order with fixed token usage."""
+
+    responses: list[str]
+    requests: tuple[LlmRequest, ...] = ()
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        self.requests = (*self.requests, llm_request)
+        yield LlmResponse(
+            content=genai_types.Content(
+                role="model", parts=[genai_types.Part(text=self.responses.pop(0))]
+            ),
+            usage_metadata=genai_types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=100, candidates_token_count=10
+            ),
+        )
+
+
+def test_refinement_loop_merges_deltas_and_records_metrics() -> None:
+    evaluator_model = ScriptedLlm(
+        model="stub",
+        responses=[
+            json.dumps(
+                {
+                    "grade": "fail",
+                    "comment": "Callbacks too thin.",
+                    "follow_up_queries": [{"search_query": query}],
+                }
+            )
+            for query in ["callback ordering", "tool definitions"]
+        ],
+    )
+    executor_model = ScriptedLlm(
+        model="stub",
+        responses=[
+            "## [sec-2] Callbacks\n\nBefore and after callbacks.",
+            "## [new] Tools\n\nTools are functions.",
+        ],
+    )
+    loop = LoopAgent(
+        name="iterative_refinement_loop",
+        max_iterations=2,
+        sub_agents=[
+            research_evaluator.model_copy(
+                update={"model": evaluator_model, "parent_agent": None}
+            ),
+            enhanced_search_executor.model_copy(
+                update={
+                    "model": executor_model,
+                    "tools": [],
+                    "planner": None,
+                    "parent_agent": None,
+                }
+            ),
+        ],
+    )
+
+    async def run() -> dict:
+        runner = InMemoryRunner(agent=loop, app_name="test")
+        records = sections_from_text(FINDINGS)
+        session = await runner.session_service.create_session(
+            app_name="test",
+            user_id="u",
+            state={
+                "research_plan": "- [RESEARCH] Analyze LoopAgent",
+                "section_research_findings": FINDINGS,
+                "findings_sections": records,
+                "findings_index": "",
+                "findings_last_delta": None,
+                "refinement_iteration": 0,
+                "refinement_metrics": [],
+            },
+        )
+        async for _ in runner.run_async(
+            user_id="u",
+            session_id=session.id,
+            new_message=genai_types.Content(
+                role="user", parts=[genai_types.Part(text="go")]
+            ),
+        ):
+            pass
+        stored = await runner.session_service.get_session(
+            app_name="test", user_id="u", session_id=session.id
+        )
+        assert stored is not None
+        return stored.state
+
+    state = asyncio.run(run())
+
+    assert "Before and after callbacks." in state["section_research_findings"]
+    assert "Tools are functions." in state["section_research_findings"]
+    assert len(state["findings_sections"]) == 4
+    second_config = evaluator_model.requests[1].config
+    assert second_config
+    second_prompt = str(second_config.system_instruction)
+    assert "FINDINGS UPDATE" in second_prompt
+    assert "Callbacks too thin." in second_prompt
+    assert [(m["iteration"], m["agent"]) for m in state["refinement_metrics"]] == [
+        (1, "research_evaluator"),
+        (1, "enhanced_search_executor"),
+        (2, "research_evaluator"),
+        (2, "enhanced_search_executor"),
+    ]
+    assert all(m["prompt_tokens"] == 100 for m in state["refinement_metrics"])
+    assert all(m["output_tokens"] == 10 for m in state["refinement_metrics"])
@@ -0,0 +1,180 @@
+"""Tests for the concurrent [RESEARCH] fan-out, using stub models offline."""
+
+import asyncio
+import re
+import time
+from collections.abc import AsyncGenerator
+
+from google.adk.agents import LlmAgent
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.genai import types as genai_types
+from pydantic import Field
+
+from app.agent import ParallelSectionResearcher
+
+PLAN = """Here is the plan:
+- [RESEARCH] Analyze LoopAgent termination.
+- [RESEARCH] Investigate callbacks.
+- [RESEARCH] Identify session state rules.
+- [RESEARCH] Analyze AgentTool usage.
+- [DELIVERABLE][IMPLIED] Create a comparison table.
+"""
+
+
+class StubResearchLlm(BaseLlm):
+    """Answers after `delay` seconds; grounds each goal on its own URL."""
+
+    delay: float = 0.0
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        await asyncio.sleep(self.delay)
+        assert llm_request.config
+        instruction = str(llm_request.config.system_instruction)
+        if match := re.search(r"\*\*Research goal:\*\* (.+)", instruction):
+            goal = match.group(1).strip()
+            slug = re.sub(r"\W+", "-", goal.lower()).strip("-")
+            yield LlmResponse(
+                content=genai_types.Content(
+                    role="model", parts=[genai_types.Part(text=f"Summary of {goal}")]
+                ),
+                grounding_metadata=genai_types.GroundingMetadata(
+                    grounding_chunks=[
+                        genai_types.GroundingChunk(
+                            web=genai_types.GroundingChunkWeb(
+                                uri=f"https://google.github.io/adk-docs/{slug}/",
+                                title=goal,
+                                domain="google.github.io",
+                            )
+                        )
+                    ],
+                    grounding_supports=[
+                        genai_types.GroundingSupport(
+                            segment=genai_types.Segment(text=f"Summary of {goal}"),
+                            grounding_chunk_indices=[0],
+                            confidence_scores=[0.9],
+                        )
+                    ],
+                ),
+            )
+        else:
+            yield LlmResponse(
+                content=genai_types.Content(
+                    role="model", parts=[genai_types.Part(text="| Goal | Finding |")]
+                )
+            )
+
+
+class ContentsRecordingLlm(StubResearchLlm):
+    """Records the goal and the contents of every research request."""
+
+    requests: list[tuple[str, str]] = Field(default_factory=list)
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        assert llm_request.config
+        instruction = str(llm_request.config.system_instruction)
+        if match := re.search(r"\*\*Research goal:\*\* (.+)", instruction):
+            self.requests.append((match.group(1).strip(), str(llm_request.contents)))
+        async for response in super().generate_content_async(llm_request, stream):
+            yield response
+
+
+def build_researcher(
+    delay: float, max_concurrency: int, model: StubResearchLlm | None = None
+) -> ParallelSectionResearcher:
+    model = model or StubResearchLlm(model="stub", delay=delay)
+    return ParallelSectionResearcher(
+        name="parallel_section_researcher",
+        goal_researcher=LlmAgent(name="goal_researcher", model=model),
+        deliverable_synthesizer=LlmAgent(
+            name="deliverable_synthesizer",
+            model=model,
+            include_contents="none",
+            instruction="Summaries: {research_goal_summaries}",
+            output_key="deliverable_artifacts",
+        ),
+        fallback_researcher=LlmAgent(
+            name="section_researcher",
+            model=model,
+            output_key="section_research_findings",
+        ),
+        max_concurrency=max_concurrency,
+        requests_per_second=0,
+    )
+
+
+async def run_researcher(
+    agent: ParallelSectionResearcher, plan: str
+) -> tuple[dict, float]:
+    runner = InMemoryRunner(agent=agent, app_name="test")
+    session = await runner.session_service.create_session(
+        app_name="test", user_id="u", state={"research_plan": plan}
+    )
+    start = time.perf_counter()
+    async for _ in runner.run_async(
+        user_id="u",
+        session_id=session.id,
+        new_message=genai_types.Content(
+            role="user", parts=[genai_types.Part(text="go")]
+        ),
+    ):
+        pass
+    elapsed = time.perf_counter() - start
+    stored = await runner.session_service.get_session(
+        app_name="test", user_id="u", session_id=session.id
+    )
+    assert stored is not None
+    return stored.state, elapsed
+
+
+def test_goals_run_concurrently_and_merge_in_plan_order() -> None:
+    sequential_state, sequential_seconds = asyncio.run(
+        run_researcher(build_researcher(delay=0.2, max_concurrency=1), PLAN)
+    )
+    parallel_state, parallel_seconds = asyncio.run(
+        run_researcher(build_researcher(delay=0.2, max_concurrency=4), PLAN)
+    )
+
+    assert parallel_seconds * 2 < sequential_seconds
+    assert (
+        parallel_state["section_research_findings"]
+        == (sequential_state["section_research_findings"])
+    )
+    assert parallel_state["sources"] == sequential_state["sources"]
+    findings = parallel_state["section_research_findings"]
+    assert findings.index("LoopAgent termination") < findings.index("AgentTool usage")
+    assert findings.endswith("| Goal | Finding |")
+    assert [s["title"] for s in parallel_state["sources"].values()] == [
+        "Analyze LoopAgent termination.",
+        "Investigate callbacks.",
+        "Identify session state rules.",
+        "Analyze AgentTool usage.",
+    ]
+
+
+def test_plan_without_goal_prefixes_uses_fallback_researcher() -> None:
+    state, _ = asyncio.run(
+        run_researcher(
+            build_researcher(delay=0, max_concurrency=4), "Just research ADK."
+        )
+    )
+
+    assert state["section_research_findings"] == "| Goal | Finding |"
+
+
+def test_goal_researchers_do_not_see_each_other_beyond_nine_goals() -> None:
+    goals = [f"Investigate ADK topic {i}." for i in range(1, 12)]
+    plan = "\n".join(f"- [RESEARCH] {goal}" for goal in goals)
+    model = ContentsRecordingLlm(model="stub")
+    # One at a time, so every earlier goal's events are already in the session.
+    asyncio.run(
+        run_researcher(build_researcher(delay=0, max_concurrency=1, model=model), plan)
+    )
+
+    assert [goal for goal, _ in model.requests] == goals
+    for goal, contents in model.requests:
+        assert not [other for other in goals if other != goal and other in contents]
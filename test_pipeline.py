@@ -0,0 +1,196 @@
+"""Tests for the dependency-aware research pipeline agent."""
+
+import asyncio
+import time
+from collections.abc import AsyncGenerator
+
+from google.adk.agents import BaseAgent, LlmAgent, SequentialAgent
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.genai import types as genai_types
+from pydantic import Field
+
+from app.pipeline import DependencyPipelineAgent, PipelineStage, stage_dependencies
+
+
+class EchoLlm(BaseLlm):
+    """Answers with its instruction after `delay` seconds."""
+
+    delay: float = 0.0
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        await asyncio.sleep(self.delay)
+        # The agent instruction comes first; ADK appends its identity after it.
+        assert llm_request.config
+        instruction = str(llm_request.config.system_instruction).split("\n\n")[0]
+        yield LlmResponse(
+            content=genai_types.Content(
+                role="model",
+                parts=[genai_types.Part(text=instruction)],
+            )
+        )
+
+
+def build_stages(delay: float) -> list[PipelineStage]:
+    model = EchoLlm(model="stub", delay=delay)
+
+    def agent(name: str, instruction: str, output_key: str) -> LlmAgent:
+        return LlmAgent(
+            name=name,
+            model=model,
+            instruction=instruction,
+            output_key=output_key,
+            include_contents="none",
+        )
+
+    return [
+        PipelineStage(
+            agent=agent(
+                "section_planner", "outline of {research_plan}", "report_sections"
+            ),
+            reads=["research_plan"],
+            writes=["report_sections"],
+        ),
+        PipelineStage(
+            agent=agent(
+                "section_researcher",
+                "findings on {research_plan}",
+                "section_research_findings",
+            ),
+            reads=["research_plan"],
+            writes=["section_research_findings"],
+        ),
+        PipelineStage(
+            agent=agent(
+                "refiner",
+                "refined {section_research_findings}",
+                "section_research_findings",
+            ),
+            reads=["section_research_findings"],
+            writes=["section_research_findings"],
+        ),
+        PipelineStage(
+            agent=agent(
+                "report_composer",
+                "report: {report_sections} / {section_research_findings}",
+                "final_cited_report",
+            ),
+            reads=["report_sections", "section_research_findings"],
+            writes=["final_cited_report"],
+        ),
+    ]
+
+
+async def run_pipeline(agent: BaseAgent) -> tuple[dict, float]:
+    runner = InMemoryRunner(agent=agent, app_name="test")
+    session = await runner.session_service.create_session(
+        app_name="test", user_id="u", state={"research_plan": "ADK callbacks"}
+    )
+    start = time.perf_counter()
+    async for _ in runner.run_async(
+        user_id="u",
+        session_id=session.id,
+        new_message=genai_types.Content(
+            role="user", parts=[genai_types.Part(text="go")]
+        ),
+    ):
+        pass
+    elapsed = time.perf_counter() - start
+    stored = await runner.session_service.get_session(
+        app_name="test", user_id="u", session_id=session.id
+    )
+    assert stored is not None
+    return stored.state, elapsed
+
+
+def test_dependencies_follow_declared_reads_and_writes() -> None:
+    assert stage_dependencies(build_stages(0)) == [[], [], [1], [0, 1, 2]]
+
+
+def test_planner_overlaps_research_with_the_same_final_state() -> None:
+    sequential_state, sequential_seconds = asyncio.run(
+        run_pipeline(
+            SequentialAgent(
+                name="research_pipeline",
+                sub_agents=[stage.agent for stage in build_stages(0.2)],
+            )
+        )
+    )
+    dag_state, dag_seconds = asyncio.run(
+        run_pipeline(
+            DependencyPipelineAgent(name="research_pipeline", stages=build_stages(0.2))
+        )
+    )
+
+    timeline = dag_state.pop("pipeline_timeline")
+    assert dag_state == sequential_state
+    assert dag_state["final_cited_report"] == (
+        "report: outline of ADK callbacks / refined findings on ADK callbacks"
+    )
+    assert dag_seconds < sequential_seconds - 0.15
+    stages = {stage["stage"]: stage for stage in timeline["stages"]}
+    assert stages["section_planner"]["start_s"] < stages["section_researcher"]["end_s"]
+    assert stages["report_composer"]["after"] == [
+        "section_planner",
+        "section_researcher",
+        "refiner",
+    ]
+    assert timeline["elapsed_s"] < timeline["sequential_s"]
+
+
+class TranscriptLlm(BaseLlm):
+    """Records the texts of the conversation each agent is shown."""
+
+    seen: dict[str, list[str]] = Field(default_factory=dict)
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        assert llm_request.config
+        agent = str(llm_request.config.system_instruction).split("\n\n")[0]
+        self.seen[agent] = [
+            part.text
+            for content in llm_request.contents
+            for part in content.parts or []
+            if part.text
+        ]
+        yield LlmResponse(
+            content=genai_types.Content(
+                role="model", parts=[genai_types.Part(text=f"{agent} done")]
+            )
+        )
+
+
+def test_stages_after_the_researcher_see_its_findings() -> None:
+    model = TranscriptLlm(model="stub")
+
+    def agent(name: str, output_key: str) -> LlmAgent:
+        # Default include_contents, like enhanced_search_executor.
+        return LlmAgent(name=name, model=model, instruction=name, output_key=output_key)
+
+    stages = [
+        PipelineStage(
+            agent=agent("section_planner", "report_sections"),
+            reads=["research_plan"],
+            writes=["report_sections"],
+        ),
+        PipelineStage(
+            agent=agent("section_researcher", "section_research_findings"),
+            reads=["research_plan"],
+            writes=["section_research_findings"],
+        ),
+        PipelineStage(
+            agent=agent("search_executor", "section_research_findings"),
+            reads=["section_research_findings"],
+            writes=["section_research_findings"],
+        ),
+    ]
+    asyncio.run(
+        run_pipeline(DependencyPipelineAgent(name="research_pipeline", stages=stages))
+    )
+
+    assert any(
+        "section_researcher done" in text for text in model.seen["search_executor"]
+    )
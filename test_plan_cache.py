@@ -0,0 +1,117 @@
+"""Tests for the plan cache in front of plan_generator."""
+
+import asyncio
+from typing import Any
+
+import pytest
+from google.adk.agents import LlmAgent
+from google.adk.tools.agent_tool import AgentTool
+
+from app.agent import plan_generator
+from app.agent_cache import PlanCache, normalize_topic
+from app.replay import run_conversation
+from benchmarks.stubs import StubLlm
+
+MODEL = "gemini-2.5-pro"
+
+
+def make_cache(**kwargs: Any) -> PlanCache:
+    options = {"ttl_seconds": 3600, "max_entries": 10, "min_similarity": 0.9}
+    return PlanCache(":memory:", **{**options, **kwargs})
+
+
+def test_normalize_topic_ignores_case_accents_order_and_stop_words() -> None:
+    assert normalize_topic("Research the ADK Callbacks") == normalize_topic(
+        "ADK callbacks:  research,  research"
+    )
+    assert normalize_topic("Sessões") == "sessoes"
+
+
+def test_lookup_falls_back_to_similar_topics_of_the_same_model() -> None:
+    cache = make_cache()
+    cache.put(MODEL, "Research ADK callbacks", "- [RESEARCH] Analyze callbacks.", 12.5)
+
+    entry, similarity = cache.lookup(MODEL, "research the ADK callbacks")
+    assert similarity == 1.0
+    assert entry == {
+        "request": "Research ADK callbacks",
+        "plan": "- [RESEARCH] Analyze callbacks.",
+        "latency_s": 12.5,
+    }
+    entry, similarity = cache.lookup(MODEL, "Research ADK callback")
+    assert 0.9 <= similarity < 1.0
+    assert entry["plan"] == "- [RESEARCH] Analyze callbacks."
+    assert cache.lookup(MODEL, "Research ADK session state") is None
+    assert cache.lookup("gemini-2.5-flash", "Research ADK callbacks") is None
+    assert make_cache(min_similarity=1.0).lookup(MODEL, "Research ADK callback") is None
+
+
+def test_size_cap_evicts_least_recently_used_and_invalidate_removes() -> None:
+    cache = make_cache(max_entries=2)
+    for topic in ("callbacks", "sessions", "LoopAgent"):
+        cache.put(MODEL, topic, f"plan for {topic}", 1.0)
+
+    assert len(cache.store) == 2
+    assert cache.lookup(MODEL, "callbacks") is None
+    cache.invalidate(MODEL, "sessions")
+    assert cache.lookup(MODEL, "sessions") is None
+    cache.invalidate()
+    assert len(cache.store) == 0
+
+
+def test_misses_scan_the_in_memory_index_not_the_store(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    cache = make_cache()
+    cache.put(MODEL, "Research ADK callbacks", "plan for callbacks", 1.0)
+    assert cache.lookup(MODEL, "Research ADK session state") is None
+
+    def keys() -> list[str]:
+        raise AssertionError("store.keys() called on a miss")
+
+    monkeypatch.setattr(cache.store, "keys", keys)
+    cache.put(MODEL, "Research ADK sessions", "plan for sessions", 1.0)
+    assert cache.lookup(MODEL, "Research ADK memory") is None
+    entry, _ = cache.lookup(MODEL, "Research ADK session")
+    assert entry["plan"] == "plan for sessions"
+    cache.invalidate(MODEL, "Research ADK sessions")
+    assert cache.lookup(MODEL, "Research ADK session") is None
+
+
+def planner_with_cache(cache: PlanCache, stub: StubLlm) -> LlmAgent:
+    generator = plan_generator.model_copy(
+        update={
+            "model": stub,
+            "tools": [],
+            "before_agent_callback": cache.before_agent,
+            "after_agent_callback": cache.after_agent,
+            "parent_agent": None,
+        }
+    )
+    return LlmAgent(
+        name="interactive_planner_agent",
+        model=stub,
+        tools=[AgentTool(generator)],
+        output_key="research_plan",
+    )
+
+
+def test_hit_skips_the_model_and_refinements_reach_it() -> None:
+    cache = make_cache()
+    stub = StubLlm(goals=2, delay_s=0.05)
+    planner = planner_with_cache(cache, stub)
+
+    first = asyncio.run(run_conversation(planner, ["Research ADK callbacks"]))
+    second = asyncio.run(
+        run_conversation(planner, ["Research ADK callbacks", "Add tools"])
+    )
+
+    assert first["plan_cache"]["result"] == "miss"
+    assert stub._calls["plan_generator"] == 2
+    # The refinement turn of the second conversation reached the model.
+    assert second["plan_cache"]["result"] == "bypassed"
+    assert "(revision 2)" in second["research_plan"]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["hit_rate"] == 0.5
+    assert cache.stats()["saved_s_total"] >= 0.05
+    assert len(cache.store) == 1
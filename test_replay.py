@@ -0,0 +1,81 @@
+"""Tests for the record/replay harness and the offline end-to-end flow."""
+
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from app.agent import interactive_planner_agent, root_agent
+from app.replay import (
+    Fixture,
+    FixtureRecorder,
+    RecordingLlm,
+    RecordingSearchBackend,
+    ReplayLlm,
+    ReplaySearchBackend,
+    run_conversation,
+    substitute_backends,
+)
+from benchmarks.stubs import StubLlm, StubSearchBackend
+
+MESSAGES = ["Research ADK callbacks", "sim"]
+
+
+def test_stub_runs_planner_and_pipeline_offline() -> None:
+    stub = StubLlm(goals=3, iterations=2)
+    original_model = interactive_planner_agent.model
+    with substitute_backends(
+        root_agent, lambda agent: stub, lambda tool: StubSearchBackend()
+    ):
+        state = asyncio.run(run_conversation(root_agent, MESSAGES))
+    assert interactive_planner_agent.model == original_model
+
+    assert state["confirmation_decision"] == "approval"
+    assert state["research_plan"].count("[RESEARCH]") == 3
+    assert state["refinement_stop_reason"] == "pass"
+    assert state["refinement_iteration"] == 2
+    # Three goals and one refinement pass, three new pages each.
+    assert len(state["sources"]) == 12
+    assert (
+        "](https://google.github.io/adk-docs/stub/"
+        in state["final_report_with_citations"]
+    )
+    assert "<cite" not in state["final_report_with_citations"]
+
+
+def test_recorded_session_replays_offline(tmp_path: Path) -> None:
+    path = tmp_path / "fixture.jsonl"
+    recorder = FixtureRecorder(path)
+    stub = StubLlm(goals=2, iterations=2)
+    with substitute_backends(
+        root_agent,
+        lambda agent: RecordingLlm(model=stub.model, inner=stub, recorder=recorder),
+    ):
+        recorded = asyncio.run(run_conversation(root_agent, MESSAGES))
+
+    replay = ReplayLlm(model="gemini-2-replay", fixture=Fixture(path))
+    with substitute_backends(root_agent, lambda agent: replay):
+        replayed = asyncio.run(run_conversation(root_agent, MESSAGES))
+
+    for key in ("research_plan", "sources", "final_report_with_citations"):
+        assert replayed[key] == recorded[key]
+
+    with substitute_backends(root_agent, lambda agent: replay):
+        with pytest.raises(LookupError, match="interactive_planner_agent"):
+            asyncio.run(run_conversation(root_agent, MESSAGES))
+
+
+def test_search_results_replay_by_normalized_query(tmp_path: Path) -> None:
+    path = tmp_path / "fixture.jsonl"
+    recording = RecordingSearchBackend(StubSearchBackend(), FixtureRecorder(path))
+    result = asyncio.run(
+        recording.search("site:google.github.io/adk-docs/ ADK Callbacks")
+    )
+
+    replay = ReplaySearchBackend(Fixture(path))
+    replayed = asyncio.run(
+        replay.search("site:google.github.io/adk-docs/  adk callbacks")
+    )
+    assert replayed == result
+    with pytest.raises(LookupError):
+        asyncio.run(replay.search("site:google.github.io/adk-docs/ sessions"))
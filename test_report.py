@@ -0,0 +1,151 @@
+"""Tests for per-section report composition."""
+
+import asyncio
+import re
+import time
+from collections.abc import AsyncGenerator
+
+from google.adk.agents import LlmAgent
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.genai import types as genai_types
+
+from app.agent import SectionedReportComposer, citation_replacement_callback
+from app.findings import sections_from_text
+from app.report import remap_citations, route_section, split_outline
+
+OUTLINE = """# Loop agents
+How LoopAgent repeats and stops.
+## Escalation
+- escalate events
+
+# Callbacks
+Where before and after callbacks run.
+"""
+
+FINDINGS = """## [RESEARCH] Analyze LoopAgent
+
+LoopAgent repeats sub-agents until max_iterations or an escalate event.
+
+## [RESEARCH] Investigate callbacks
+
+before_model_callback and after_agent_callback run around calls.
+"""
+
+
+def source(short_id: str, title: str, claim: str) -> dict:
+    return {
+        "short_id": short_id,
+        "title": title,
+        "url": f"https://google.github.io/adk-docs/{short_id}/",
+        "domain": "google.github.io",
+        "supported_claims": [{"text_segment": claim, "confidence": 0.9}],
+    }
+
+
+SOURCES = {
+    "src-1": source("src-1", "Sessions", "Session state holds values."),
+    "src-2": source("src-2", "Loop agents", "LoopAgent stops on escalate."),
+    "src-3": source("src-3", "Callbacks", "before_model_callback runs before calls."),
+}
+
+
+def test_outline_splits_on_top_level_headings() -> None:
+    sections = split_outline(OUTLINE)
+
+    assert [s.heading for s in sections] == ["# Loop agents", "# Callbacks"]
+    assert "## Escalation" in sections[0].outline
+
+
+def test_routing_renumbers_sources_locally() -> None:
+    _loop_section, callbacks_section = split_outline(OUTLINE)
+    records = sections_from_text(FINDINGS)
+
+    route = route_section(callbacks_section, records, SOURCES, 1, 1)
+
+    assert route.findings.startswith("## [RESEARCH] Investigate callbacks")
+    assert route.local_to_global == {"src-1": "src-3"}
+    assert route.sources["src-1"]["title"] == "Callbacks"
+    remapped = remap_citations(
+        'Runs first <cite source="src-1"/>. <cite source="src-2" />',
+        route.local_to_global,
+    )
+    assert remapped == 'Runs first <cite source="src-3"/>. '
+
+
+class SectionLlm(BaseLlm):
+    """Writes a section citing local src-1; the first section is the slowest."""
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        assert llm_request.config
+        instruction = str(llm_request.config.system_instruction)
+        match = re.search(r"Section Heading: `(.+?)`", instruction)
+        assert match
+        heading = match.group(1)
+        await asyncio.sleep(0.3 if "Loop" in heading else 0.1)
+        yield LlmResponse(
+            content=genai_types.Content(
+                role="model",
+                parts=[
+                    genai_types.Part(text=f'Body of {heading} <cite source="src-1"/>.')
+                ],
+            )
+        )
+
+
+def test_sections_are_composed_concurrently_and_stitched_in_order() -> None:
+    composer = SectionedReportComposer(
+        name="sectioned_report_composer",
+        section_writer=LlmAgent(
+            name="report_section_writer",
+            model=SectionLlm(model="stub"),
+            include_contents="none",
+        ),
+        sources_per_section=1,
+        after_agent_callback=citation_replacement_callback,
+    )
+
+    async def run() -> tuple[dict, list[str], float]:
+        runner = InMemoryRunner(agent=composer, app_name="test")
+        session = await runner.session_service.create_session(
+            app_name="test",
+            user_id="u",
+            state={
+                "report_sections": OUTLINE,
+                "findings_sections": sections_from_text(FINDINGS),
+                "sources": SOURCES,
+            },
+        )
+        streamed = []
+        start = time.perf_counter()
+        async for event in runner.run_async(
+            user_id="u",
+            session_id=session.id,
+            new_message=genai_types.Content(
+                role="user", parts=[genai_types.Part(text="go")]
+            ),
+        ):
+            if event.partial and event.content and event.content.parts:
+                streamed.append(event.content.parts[0].text or "")
+        elapsed = time.perf_counter() - start
+        stored = await runner.session_service.get_session(
+            app_name="test", user_id="u", session_id=session.id
+        )
+        assert stored is not None
+        return stored.state, streamed, elapsed
+
+    state, streamed, elapsed = asyncio.run(run())
+
+    assert elapsed < 0.39
+    assert state["final_cited_report"] == (
+        '# Loop agents\n\nBody of # Loop agents <cite source="src-2"/>.\n\n'
+        '# Callbacks\n\nBody of # Callbacks <cite source="src-3"/>.'
+    )
+    assert streamed[0].startswith("# Loop agents")
+    assert "(https://google.github.io/adk-docs/src-2/)." in streamed[0]
+    assert (
+        "[Callbacks](https://google.github.io/adk-docs/src-3/)"
+        in (state["final_report_with_citations"])
+    )
@@ -0,0 +1,145 @@
+"""Tests for the cited report cache in front of research_pipeline."""
+
+import asyncio
+from typing import Any
+
+import pytest
+from google.adk.models import LlmRequest, LlmResponse
+
+from app.agent import citation_replacement_callback, research_pipeline, root_agent
+from app.agent_cache import ReportCache
+from app.plan import normalize_plan
+from app.replay import run_conversation, substitute_backends
+from app.sources import SOURCES_CURSOR_KEY
+from benchmarks.stubs import StubLlm, StubSearchBackend
+
+PLAN = """Here is the plan:
+- [RESEARCH] Investigate ADK   callbacks.
+- **[DELIVERABLE][IMPLIED]** Create a summary table.
+"""
+VALUES = {
+    "final_cited_report": 'Callbacks.<cite source="src-1"/>',
+    "sources": {
+        "src-1": {"short_id": "src-1", "title": "Callbacks", "url": "https://a/"}
+    },
+    "final_report_with_citations": "Callbacks.[Callbacks](https://a/)",
+}
+
+
+def make_cache(**kwargs: Any) -> ReportCache:
+    options: dict[str, Any] = {
+        "ttl_seconds": 3600,
+        "max_entries": 10,
+        "max_entry_bytes": 64 * 1024,
+        "fingerprint": {"worker_model": "gemini-2.5-pro", "corpus_version": "v1"},
+        "replay": citation_replacement_callback,
+    }
+    return ReportCache(":memory:", **{**options, **kwargs})
+
+
+def test_key_ignores_plan_formatting_but_not_models_or_corpus() -> None:
+    assert normalize_plan(PLAN) == (
+        "RESEARCH: investigate adk callbacks.\nDELIVERABLE: create a summary table."
+    )
+    cache = make_cache()
+    same_goals = (
+        "- [RESEARCH][MODIFIED] Investigate ADK callbacks.\n" + PLAN.splitlines()[2]
+    )
+    assert cache.key(PLAN) == cache.key(same_goals)
+    assert cache.key(PLAN) != cache.key(PLAN.replace("callbacks", "sessions"))
+    for fingerprint in (
+        {"worker_model": "gemini-2.5-flash", "corpus_version": "v1"},
+        {"worker_model": "gemini-2.5-pro", "corpus_version": "v2"},
+    ):
+        assert make_cache(fingerprint=fingerprint).key(PLAN) != cache.key(PLAN)
+
+
+def test_put_get_and_invalidate() -> None:
+    cache = make_cache()
+    assert not cache.put(PLAN, {**VALUES, "sources": {}}, 1.0)
+    assert not make_cache(max_entry_bytes=100).put(PLAN, VALUES, 1.0)
+
+    assert cache.put(PLAN, VALUES, 42.0)
+    assert cache.get(PLAN) == {**VALUES, "latency_s": 42.0}
+    cache.invalidate(PLAN)
+    assert cache.get(PLAN) is None
+    cache.put(PLAN, VALUES, 42.0)
+    cache.invalidate()
+    assert len(cache.store) == 0
+
+
+def test_hit_skips_the_pipeline_and_replays_citations() -> None:
+    cache = make_cache()
+    stub = StubLlm(goals=2, iterations=2)
+    with substitute_backends(
+        root_agent, lambda agent: stub, lambda tool: StubSearchBackend()
+    ):
+        saved = (
+            research_pipeline.before_agent_callback,
+            research_pipeline.after_agent_callback,
+        )
+        research_pipeline.before_agent_callback = cache.before_agent
+        research_pipeline.after_agent_callback = cache.after_agent
+        try:
+            first = asyncio.run(
+                run_conversation(root_agent, ["Research ADK callbacks", "sim"])
+            )
+            # Restart the stub, so the planner proposes the same plan again.
+            stub._calls.clear()
+            second = asyncio.run(
+                run_conversation(root_agent, ["Research ADK callbacks", "sim"])
+            )
+        finally:
+            (
+                research_pipeline.before_agent_callback,
+                research_pipeline.after_agent_callback,
+            ) = saved
+
+    assert first["report_cache"]["result"] == "miss"
+    assert second["report_cache"]["result"] == "hit"
+    assert stub._calls["plan_generator"] == 1
+    assert stub._calls["section_planner"] == 0
+    assert "report_sections" not in second
+    for name in ("final_cited_report", "sources", "final_report_with_citations"):
+        assert second[name] == first[name]
+    assert set(second["url_to_short_id"].values()) == set(second["sources"])
+    assert second[SOURCES_CURSOR_KEY] > 0
+
+
+class FailingStubLlm(StubLlm):
+    """Fails the first section planner call, like a pipeline that raises."""
+
+    def _respond(self, agent: str, call: int, llm_request: LlmRequest) -> LlmResponse:
+        if agent == "section_planner":
+            raise RuntimeError("model unavailable")
+        return super()._respond(agent, call, llm_request)
+
+
+def test_failed_runs_leave_no_pending_lookup() -> None:
+    cache = make_cache()
+    stub = FailingStubLlm(goals=1, iterations=1)
+    with substitute_backends(
+        root_agent, lambda agent: stub, lambda tool: StubSearchBackend()
+    ):
+        saved = (
+            research_pipeline.before_agent_callback,
+            research_pipeline.after_agent_callback,
+            root_agent.on_run_end,
+        )
+        research_pipeline.before_agent_callback = cache.before_agent
+        research_pipeline.after_agent_callback = cache.after_agent
+        root_agent.on_run_end = cache.discard
+        try:
+            with pytest.raises(RuntimeError):
+                asyncio.run(
+                    run_conversation(root_agent, ["Research ADK callbacks", "sim"])
+                )
+        finally:
+            (
+                research_pipeline.before_agent_callback,
+                research_pipeline.after_agent_callback,
+                root_agent.on_run_end,
+            ) = saved
+
+    assert cache.misses == 1
+    assert cache._pending == {}
@@ -0,0 +1,283 @@
+"""Tests for deadlines, retries and hedging against a local fake Gemini endpoint."""
+
+import asyncio
+import collections
+import json
+import threading
+import time
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import httpx
+import pytest
+from google.adk.agents import LlmAgent
+from google.adk.models import LlmRequest
+from google.adk.runners import InMemoryRunner
+from google.genai import errors as genai_errors
+from google.genai import types as genai_types
+
+from app.resilience import (
+    CallPolicy,
+    DeadlineExceededError,
+    ResilientCaller,
+    ResilientLlm,
+    apply_resilience,
+    backoff_delay,
+    retry_after_seconds,
+)
+
+MODEL = "gemini-2.5-flash"
+
+
+class FakeGeminiEndpoint:
+    """A local `generateContent` endpoint that injects latency and 429s.
+
+    Each request takes the next scripted action: ("ok", seconds) answers
+    after a delay, ("throttle", seconds) answers 429 with that retry hint.
+    Without a script, requests are answered after `latency_s`.
+    """
+
+    def __init__(self, latency_s: float = 0.0) -> None:
+        self.latency_s = latency_s
+        self.script: collections.deque[tuple[str, float]] = collections.deque()
+        self.requests: list[float] = []
+        self._lock = threading.Lock()
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                self.rfile.read(int(self.headers.get("content-length", 0)))
+                with endpoint._lock:
+                    endpoint.requests.append(time.monotonic())
+                    action = (
+                        endpoint.script.popleft()
+                        if endpoint.script
+                        else ("ok", endpoint.latency_s)
+                    )
+                kind, seconds = action
+                if kind == "throttle":
+                    body = {
+                        "error": {
+                            "code": 429,
+                            "message": "Resource has been exhausted.",
+                            "status": "RESOURCE_EXHAUSTED",
+                            "details": [
+                                {
+                                    "@type": "type.googleapis.com/google.rpc.RetryInfo",
+                                    "retryDelay": f"{seconds}s",
+                                }
+                            ],
+                        }
+                    }
+                    self._reply(429, body)
+                    return
+                time.sleep(seconds)
+                self._reply(
+                    200,
+                    {
+                        "candidates": [
+                            {
+                                "content": {
+                                    "role": "model",
+                                    "parts": [{"text": "answer"}],
+                                },
+                                "finishReason": "STOP",
+                            }
+                        ],
+                        "usageMetadata": {
+                            "promptTokenCount": 10,
+                            "candidatesTokenCount": 2,
+                        },
+                    },
+                )
+
+            def _reply(self, status: int, body: dict) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def endpoint(monkeypatch: pytest.MonkeyPatch) -> Iterator[FakeGeminiEndpoint]:
+    fake = FakeGeminiEndpoint(latency_s=0.01)
+    monkeypatch.setenv("GOOGLE_GEMINI_BASE_URL", fake.url)
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    monkeypatch.setenv("GOOGLE_GENAI_USE_VERTEXAI", "False")
+    yield fake
+    fake.close()
+
+
+def resilient_llm(
+    caller: ResilientCaller, policy: CallPolicy, route: str = "test"
+) -> ResilientLlm:
+    return ResilientLlm(model=MODEL, route=route, policy=policy, caller=caller)
+
+
+async def ask(llm: ResilientLlm) -> str:
+    request = LlmRequest(
+        model=MODEL,
+        contents=[
+            genai_types.Content(role="user", parts=[genai_types.Part(text="hi")])
+        ],
+        config=genai_types.GenerateContentConfig(),
+    )
+    responses = [response async for response in llm.generate_content_async(request)]
+    content = responses[-1].content
+    assert content and content.parts
+    return content.parts[0].text or ""
+
+
+def test_retry_hints_and_jittered_backoff() -> None:
+    response = httpx.Response(429, headers={"retry-after": "3"})
+    assert retry_after_seconds(genai_errors.ClientError(429, {}, response)) == 3.0
+    error = genai_errors.ClientError(
+        429,
+        {
+            "error": {
+                "details": [
+                    {
+                        "@type": "type.googleapis.com/google.rpc.RetryInfo",
+                        "retryDelay": "1.5s",
+                    }
+                ]
+            }
+        },
+    )
+    assert retry_after_seconds(error) == 1.5
+    assert retry_after_seconds(genai_errors.ServerError(503, {})) is None
+
+    policy = CallPolicy(backoff_base_s=1.0, backoff_max_s=4.0)
+    delays = [
+        backoff_delay(attempt, policy) for attempt in (1, 3, 6) for _ in range(50)
+    ]
+    assert (
+        max(delays[:50]) <= 1.0
+        and max(delays[50:100]) <= 4.0
+        and max(delays[100:]) <= 4.0
+    )
+    assert len(set(delays)) > 100
+    assert 1.5 <= backoff_delay(1, policy, retry_after=1.5) <= 2.5
+
+
+def test_throttled_agent_waits_for_the_retry_hint(endpoint: FakeGeminiEndpoint) -> None:
+    endpoint.script.extend([("throttle", 0.3)])
+    caller = ResilientCaller()
+    agent = LlmAgent(
+        name="evaluator", model=MODEL, instruction="Answer.", output_key="answer"
+    )
+    apply_resilience(agent, caller, lambda name: CallPolicy(backoff_base_s=0.01))
+
+    async def scenario() -> dict:
+        runner = InMemoryRunner(agent=agent, app_name="test")
+        session = await runner.session_service.create_session(
+            app_name="test", user_id="u"
+        )
+        async for _ in runner.run_async(
+            user_id="u",
+            session_id=session.id,
+            new_message=genai_types.Content(
+                role="user", parts=[genai_types.Part(text="go")]
+            ),
+        ):
+            pass
+        stored = await runner.session_service.get_session(
+            app_name="test", user_id="u", session_id=session.id
+        )
+        assert stored is not None
+        return stored.state
+
+    assert isinstance(agent.model, ResilientLlm)
+    assert asyncio.run(scenario())["answer"] == "answer"
+    first, second = endpoint.requests
+    assert second - first >= 0.3
+    metrics = caller.metrics()[f"evaluator/{MODEL}"]
+    assert (metrics["attempts"], metrics["retries"], metrics["throttled"]) == (2, 1, 1)
+
+
+def test_attempt_timeouts_retry_and_deadlines_give_up(
+    endpoint: FakeGeminiEndpoint,
+) -> None:
+    caller = ResilientCaller()
+    llm = resilient_llm(caller, CallPolicy(attempt_timeout_s=0.2, backoff_base_s=0.01))
+
+    async def timed_out_once() -> tuple[float, int]:
+        # Connect first, so only the scripted attempt is slow.
+        await ask(llm)
+        timeouts = caller.metrics()[f"test/{MODEL}"]["timeouts"]
+        endpoint.script.append(("ok", 1.0))
+        started = time.monotonic()
+        assert await ask(llm) == "answer"
+        return time.monotonic() - started, timeouts
+
+    elapsed, timeouts = asyncio.run(timed_out_once())
+    assert elapsed < 0.9
+    assert caller.metrics()[f"test/{MODEL}"]["timeouts"] == timeouts + 1
+
+    endpoint.script.extend([("ok", 1.0)] * 3)
+    started = time.monotonic()
+    llm = resilient_llm(caller, CallPolicy(deadline_s=0.3, backoff_base_s=0.01), "late")
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(ask(llm))
+    assert time.monotonic() - started < 0.9
+    assert caller.metrics()[f"late/{MODEL}"]["failures"] == 1
+
+
+def test_slow_attempts_are_hedged_after_the_route_p95(
+    endpoint: FakeGeminiEndpoint,
+) -> None:
+    caller = ResilientCaller()
+    llm = resilient_llm(caller, CallPolicy(hedge=True, hedge_min_samples=5))
+
+    async def scenario() -> float:
+        for _ in range(5):
+            await ask(llm)
+        endpoint.script.append(("ok", 1.0))
+        started = time.monotonic()
+        assert await ask(llm) == "answer"
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) < 0.5
+    metrics = caller.metrics()[f"test/{MODEL}"]
+    assert (metrics["hedges"], metrics["hedge_wins"]) == (1, 1)
+
+
+def test_rate_limit_is_shared_by_the_routes_of_a_model(
+    endpoint: FakeGeminiEndpoint,
+) -> None:
+    caller = ResilientCaller(rate_limits={MODEL: (20.0, 1)})
+    llms = [resilient_llm(caller, CallPolicy(), route) for route in ("a", "b")]
+
+    async def scenario() -> None:
+        # Connect both clients first, so arrivals follow the token bucket.
+        await asyncio.gather(*(ask(llm) for llm in llms))
+        endpoint.requests.clear()
+        await asyncio.gather(*(ask(llms[i % 2]) for i in range(6)))
+
+    asyncio.run(scenario())
+    gaps = [
+        later - earlier
+        for earlier, later in zip(
+            endpoint.requests, endpoint.requests[1:], strict=False
+        )
+    ]
+    assert min(gaps) >= 0.03
+    assert endpoint.requests[-1] - endpoint.requests[0] >= 0.2
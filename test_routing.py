@@ -0,0 +1,206 @@
+"""Tests for model routing across tiers."""
+
+import asyncio
+import json
+from collections.abc import AsyncGenerator
+from typing import Any
+
+import pytest
+from google.adk.agents import LlmAgent
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.genai import errors as genai_errors
+from google.genai import types as genai_types
+
+from app.agent import Feedback, record_route_metrics_callback, route_model_callback
+from app.routing import ModelRouter, RouteRule
+
+VALID_FEEDBACK = json.dumps(
+    {"grade": "pass", "comment": "Complete.", "follow_up_queries": []}
+)
+
+
+class FixedLlm(BaseLlm):
+    """Answers every call with `text`, counting the calls."""
+
+    text: str
+    calls: int = 0
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        self.calls += 1
+        yield LlmResponse(
+            content=genai_types.Content(
+                role="model", parts=[genai_types.Part(text=self.text)]
+            ),
+            usage_metadata=genai_types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=1000, candidates_token_count=100
+            ),
+        )
+
+
+def make_router(**rules: RouteRule) -> ModelRouter:
+    return ModelRouter(
+        ["weak", "strong"],
+        rules=rules,
+        prices={"weak": (1.0, 2.0), "strong": (10.0, 20.0)},
+        window=4,
+    )
+
+
+async def run_agent(agent: LlmAgent, state: dict) -> dict:
+    runner = InMemoryRunner(agent=agent, app_name="test")
+    session = await runner.session_service.create_session(
+        app_name="test", user_id="u", state=state
+    )
+    async for _ in runner.run_async(
+        user_id="u",
+        session_id=session.id,
+        new_message=genai_types.Content(
+            role="user", parts=[genai_types.Part(text="go")]
+        ),
+    ):
+        pass
+    stored = await runner.session_service.get_session(
+        app_name="test", user_id="u", session_id=session.id
+    )
+    assert stored is not None
+    return stored.state
+
+
+def routed_agent(
+    router: ModelRouter, task_class: str, weak: str, strong: str, **kwargs: Any
+) -> tuple[LlmAgent, dict[str, Any]]:
+    model = router.llm(task_class)
+    model.models = {
+        "weak": FixedLlm(model="weak", text=weak),
+        "strong": FixedLlm(model="strong", text=strong),
+    }
+    agent = LlmAgent(
+        name=f"{task_class}_agent",
+        model=model,
+        output_key="answer",
+        before_model_callback=route_model_callback,
+        after_model_callback=record_route_metrics_callback,
+        **kwargs,
+    )
+    return agent, model.models
+
+
+def test_choose_applies_revision_size_iteration_and_pass_rate() -> None:
+    router = make_router(
+        plan=RouteRule(tier=1, revision_tier=0),
+        evaluation=RouteRule(
+            max_prompt_tokens=500,
+            escalate_from_iteration=3,
+            min_pass_rate=0.5,
+            min_samples=2,
+        ),
+    )
+
+    assert router.choose("plan") == "strong"
+    assert router.choose("plan", revision=True) == "weak"
+    assert router.choose("evaluation", prompt_tokens=100, iteration=1) == "weak"
+    assert router.choose("evaluation", prompt_tokens=600) == "strong"
+    assert router.choose("evaluation", iteration=3) == "strong"
+    assert router.choose("unknown") == "strong"
+
+    for passed in (False, False, True):
+        router.record("evaluation", "weak", passed, 0.1, None)
+    assert router.choose("evaluation") == "strong"
+    router.record("evaluation", "weak", True, 0.1, None)
+    router.record("evaluation", "weak", True, 0.1, None)
+    # The window holds the last 4 outcomes: 3 of 4 passed.
+    assert router.pass_rate("evaluation", "weak") == 0.75
+    assert router.choose("evaluation") == "weak"
+
+
+def test_invalid_structured_output_escalates_to_the_stronger_tier() -> None:
+    router = make_router(evaluation=RouteRule())
+    agent, models = routed_agent(
+        router,
+        "evaluation",
+        weak="not json",
+        strong=VALID_FEEDBACK,
+        output_schema=Feedback,
+    )
+
+    state = asyncio.run(run_agent(agent, {}))
+
+    assert state["answer"]["grade"] == "pass"
+    assert models["weak"].calls == models["strong"].calls == 1
+    metrics = state["model_routing"]
+    assert metrics["evaluation/weak"]["failures"] == 1
+    assert metrics["evaluation/weak"]["pass_rate"] == 0.0
+    assert metrics["evaluation/strong"]["escalated_in"] == 1
+    assert metrics["evaluation/strong"]["cost_usd"] == (1000 * 10.0 + 100 * 20.0) / 1e6
+
+
+def test_plan_refinements_and_late_iterations_use_their_tiers() -> None:
+    router = make_router(
+        plan=RouteRule(tier=1, revision_tier=0),
+        evaluation=RouteRule(escalate_from_iteration=3),
+    )
+    plan_agent, plan_models = routed_agent(
+        router, "plan", weak="weak plan", strong="strong plan"
+    )
+    eval_agent, _ = routed_agent(
+        router, "evaluation", weak="weak eval", strong="strong eval"
+    )
+
+    assert asyncio.run(run_agent(plan_agent, {}))["answer"] == "strong plan"
+    refining = {"research_plan": "- [RESEARCH] a", "executed_research_plan": None}
+    assert asyncio.run(run_agent(plan_agent, refining))["answer"] == "weak plan"
+    executed = {
+        "research_plan": "- [RESEARCH] a",
+        "executed_research_plan": "- [RESEARCH] a",
+    }
+    assert asyncio.run(run_agent(plan_agent, executed))["answer"] == "strong plan"
+    assert plan_models["weak"].calls == 1
+
+    assert (
+        asyncio.run(run_agent(eval_agent, {"refinement_iteration": 2}))["answer"]
+        == "weak eval"
+    )
+    assert (
+        asyncio.run(run_agent(eval_agent, {"refinement_iteration": 3}))["answer"]
+        == "strong eval"
+    )
+
+
+class FailingLlm(BaseLlm):
+    """Raises a 429 on every call, like an exhausted quota."""
+
+    calls: int = 0
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        self.calls += 1
+        raise genai_errors.ClientError(429, {"error": {"status": "RESOURCE_EXHAUSTED"}})
+        yield  # type: ignore[unreachable]
+
+
+def test_api_errors_escalate_and_count_as_failures() -> None:
+    router = make_router(evaluation=RouteRule())
+    agent, models = routed_agent(
+        router, "evaluation", weak="unused", strong=VALID_FEEDBACK
+    )
+    models["weak"] = FailingLlm(model="weak")
+
+    state = asyncio.run(run_agent(agent, {}))
+
+    assert state["answer"] == VALID_FEEDBACK
+    assert models["weak"].calls == models["strong"].calls == 1
+    metrics = state["model_routing"]
+    assert (
+        metrics["evaluation/weak"]["calls"],
+        metrics["evaluation/weak"]["failures"],
+    ) == (1, 1)
+    assert metrics["evaluation/strong"]["escalated_in"] == 1
+
+    models["strong"] = FailingLlm(model="strong")
+    with pytest.raises(genai_errors.ClientError):
+        asyncio.run(run_agent(agent, {}))
+    assert router.metrics()["evaluation/strong"]["failures"] == 1
@@ -0,0 +1,240 @@
+"""Tests for admission control and scheduling of research runs."""
+
+import asyncio
+
+import pytest
+from google.adk.runners import InMemoryRunner
+from google.genai import types as genai_types
+
+from app.agent import root_agent
+from app.replay import substitute_backends
+from app.scheduling import QueueFullError, RunScheduler
+from benchmarks.stubs import StubLlm, StubSearchBackend
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_limits_priorities_and_cancellation() -> None:
+    scheduler = RunScheduler(
+        max_concurrent=2, max_per_user=1, max_per_session=1, max_queued=2
+    )
+
+    first = scheduler.submit("alice", "s1", priority=5)
+    second = scheduler.submit("alice", "s2", priority=1)
+    third = scheduler.submit("bob", "s3", priority=5)
+    assert (first.status, second.status, third.status) == (
+        "running",
+        "queued",
+        "running",
+    )
+    assert second.position == 1
+
+    fourth = scheduler.submit("carol", "s4", priority=2)
+    assert [ticket.position for ticket in (second, fourth)] == [1, 2]
+    with pytest.raises(QueueFullError):
+        scheduler.submit("dave", "s5")
+
+    scheduler.cancel(second)
+    assert second.cancelled and fourth.position == 1
+    scheduler.release(third)
+    assert fourth.status == "running"
+    assert scheduler.cancel_session("alice", "s1") == 1
+    # A cancelled run holds its slot until its owner releases it.
+    assert first.cancelled and first in scheduler.running
+    fifth = scheduler.submit("erin", "s6")
+    assert fifth.status == "queued"
+    scheduler.release(first)
+    assert (first.cancelled, fifth.status) == (True, "running")
+    assert scheduler.running == [fourth, fifth]
+
+
+def test_waiting_runs_age_ahead_of_later_short_plans() -> None:
+    clock = FakeClock()
+    scheduler = RunScheduler(
+        max_concurrent=1,
+        max_per_user=1,
+        max_per_session=1,
+        max_queued=5,
+        aging_seconds=10,
+        clock=clock,
+    )
+    running = scheduler.submit("a", "s1")
+    long_plan = scheduler.submit("b", "s2", priority=6)
+    clock.now = 30.0
+    short_plan = scheduler.submit("c", "s3", priority=4)
+    assert scheduler.queued == [long_plan, short_plan]
+
+    scheduler.release(running)
+    assert long_plan.status == "running"
+    assert long_plan.waited_s == 30.0
+
+
+def test_wait_reports_positions_until_admitted() -> None:
+    scheduler = RunScheduler(
+        max_concurrent=1, max_per_user=5, max_per_session=5, max_queued=5
+    )
+
+    async def scenario() -> list[int]:
+        running = scheduler.submit("a", "s1")
+        ahead = scheduler.submit("b", "s2")
+        ticket = scheduler.submit("c", "s3")
+        positions = []
+
+        async def free_slots() -> None:
+            await asyncio.sleep(0.01)
+            scheduler.release(running)
+            await asyncio.sleep(0.01)
+            scheduler.release(ahead)
+
+        task = asyncio.create_task(free_slots())
+        async for position in scheduler.wait(ticket):
+            positions.append(position)
+        await task
+        assert ticket.status == "running"
+        return positions
+
+    assert asyncio.run(scenario()) == [2, 1]
+
+
+async def converse(
+    runner: InMemoryRunner, user_id: str, messages: list[str]
+) -> tuple[dict, list[str]]:
+    session = await runner.session_service.create_session(
+        app_name="test", user_id=user_id
+    )
+    notices = []
+    for message in messages:
+        async for event in runner.run_async(
+            user_id=user_id,
+            session_id=session.id,
+            new_message=genai_types.Content(
+                role="user", parts=[genai_types.Part(text=message)]
+            ),
+        ):
+            if (
+                event.author == root_agent.name
+                and event.content
+                and event.content.parts
+            ):
+                notices.append(event.content.parts[0].text or "")
+    stored = await runner.session_service.get_session(
+        app_name="test", user_id=user_id, session_id=session.id
+    )
+    assert stored is not None
+    return stored.state, notices
+
+
+def test_gate_queues_concurrent_runs_and_rejects_when_full() -> None:
+    stub = StubLlm(goals=2, iterations=1, delay_s=0.01)
+    saved = root_agent.scheduler
+    root_agent.scheduler = RunScheduler(
+        max_concurrent=1, max_per_user=1, max_per_session=1, max_queued=1
+    )
+
+    async def scenario() -> list[tuple[dict, list[str]]]:
+        runner = InMemoryRunner(agent=root_agent, app_name="test")
+        return await asyncio.gather(
+            *(
+                converse(runner, f"user{i}", ["Research ADK callbacks", "sim"])
+                for i in range(3)
+            )
+        )
+
+    try:
+        with substitute_backends(
+            root_agent, lambda agent: stub, lambda tool: StubSearchBackend()
+        ):
+            results = asyncio.run(scenario())
+    finally:
+        root_agent.scheduler = saved
+
+    decisions = sorted(state["confirmation_decision"] for state, _ in results)
+    assert decisions == ["approval", "approval", "rejected"]
+    for state, notices in results:
+        if state["confirmation_decision"] == "rejected":
+            assert state.get("executed_research_plan") is None
+            assert "busy" in notices[-1]
+        else:
+            assert state["final_report_with_citations"]
+    waited = [state["run_queue"].get("waited_s", 0) for state, _ in results]
+    assert sum(seconds > 0 for seconds in waited) == 1
+    assert any(
+        "queued at position 1" in text for _, notices in results for text in notices
+    )
+
+
+def test_cancel_reply_stops_the_queued_and_running_runs() -> None:
+    stub = StubLlm(goals=2, iterations=3, delay_s=0.05)
+    saved = root_agent.scheduler
+    scheduler = root_agent.scheduler = RunScheduler(
+        max_concurrent=1, max_per_user=1, max_per_session=1, max_queued=1
+    )
+
+    async def send(
+        runner: InMemoryRunner, session_id: str, user_id: str, text: str
+    ) -> list[str]:
+        notices = []
+        async for event in runner.run_async(
+            user_id=user_id,
+            session_id=session_id,
+            new_message=genai_types.Content(
+                role="user", parts=[genai_types.Part(text=text)]
+            ),
+        ):
+            if (
+                event.author == root_agent.name
+                and event.content
+                and event.content.parts
+            ):
+                notices.append(event.content.parts[0].text or "")
+        return notices
+
+    async def scenario() -> list[dict]:
+        runner = InMemoryRunner(agent=root_agent, app_name="test")
+        sessions = [
+            await runner.session_service.create_session(
+                app_name="test", user_id=user_id
+            )
+            for user_id in ("a", "b")
+        ]
+        for session in sessions:
+            await send(runner, session.id, session.user_id, "Research ADK callbacks")
+        runs = [
+            asyncio.create_task(send(runner, session.id, session.user_id, "sim"))
+            for session in sessions
+        ]
+        while not scheduler.queued:
+            await asyncio.sleep(0.01)
+        for session in sessions:
+            assert await send(runner, session.id, session.user_id, "cancela") == [
+                "Cancelling your research run."
+            ]
+        for notices in await asyncio.gather(*runs):
+            assert notices[-1] == "The research run was cancelled."
+        states = []
+        for session in sessions:
+            stored = await runner.session_service.get_session(
+                app_name="test", user_id=session.user_id, session_id=session.id
+            )
+            assert stored is not None
+            states.append(stored.state)
+        return states
+
+    try:
+        with substitute_backends(
+            root_agent, lambda agent: stub, lambda tool: StubSearchBackend()
+        ):
+            states = asyncio.run(scenario())
+    finally:
+        root_agent.scheduler = saved
+
+    assert not scheduler.running and not scheduler.queued
+    for state in states:
+        assert "final_report_with_citations" not in state
+        assert state["run_queue"]["status"] == "cancelled"
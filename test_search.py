@@ -0,0 +1,311 @@
+"""Tests for the cached search layer."""
+
+import asyncio
+import json
+from collections.abc import AsyncGenerator
+from typing import Any
+
+import pytest
+from google.adk.agents import LlmAgent
+from google.adk.events import Event
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.genai import types as genai_types
+
+from app.agent import (
+    EXECUTED_QUERIES_KEY,
+    SEARCH_DEDUP_KEY,
+    Feedback,
+    dedup_search_callback,
+    filter_follow_up_queries_callback,
+)
+from app.config import config
+from app.search import (
+    SEARCH_TOOL_NAME,
+    SearchResult,
+    SearchTool,
+    SqliteCache,
+    dedup_queries,
+    find_executed,
+    normalize_query,
+    scope_query,
+    search_response,
+)
+from app.sources import collect_sources
+
+
+class FakeSearchBackend:
+    """Local search backend returning one grounded chunk per query."""
+
+    def __init__(self) -> None:
+        self.calls: list[str] = []
+
+    async def search(self, query: str) -> SearchResult:
+        self.calls.append(query)
+        url = f"https://google.github.io/adk-docs/{len(self.calls)}/"
+        return SearchResult(
+            query=query,
+            text=f"Results for {query}",
+            grounding_metadata=genai_types.GroundingMetadata(
+                grounding_chunks=[
+                    genai_types.GroundingChunk(
+                        web=genai_types.GroundingChunkWeb(
+                            uri=url, title="Callbacks", domain="google.github.io"
+                        )
+                    )
+                ],
+                grounding_supports=[
+                    genai_types.GroundingSupport(
+                        segment=genai_types.Segment(text="Callbacks run before tools."),
+                        grounding_chunk_indices=[0],
+                        confidence_scores=[0.9],
+                    )
+                ],
+            ),
+        )
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_cache(**overrides: Any) -> SqliteCache:
+    options: dict[str, Any] = {
+        "path": ":memory:",
+        "namespace": "search",
+        "ttl_seconds": 60,
+        "max_entries": 10,
+        "max_entry_bytes": 10_000,
+    }
+    options.update(overrides)
+    return SqliteCache(**options)
+
+
+def test_scope_query_replaces_site_operator() -> None:
+    assert (
+        scope_query("site:example.com  LoopAgent  max_iterations")
+        == "site:google.github.io/adk-docs/ LoopAgent max_iterations"
+    )
+    assert normalize_query("LoopAgent") == normalize_query(
+        "site:google.github.io/adk-docs/   loopagent "
+    )
+
+
+def test_cache_hit_skips_backend() -> None:
+    backend = FakeSearchBackend()
+    tool = SearchTool(backend, make_cache())
+
+    first = asyncio.run(tool.search("LoopAgent escalation"))
+    second = asyncio.run(tool.search("site:other.dev loopagent   ESCALATION"))
+
+    assert len(backend.calls) == 1
+    assert backend.calls[0] == "site:google.github.io/adk-docs/ LoopAgent escalation"
+    assert second == first
+    assert (tool.hits, tool.misses) == (1, 1)
+
+
+def test_cache_expires_entries_after_ttl() -> None:
+    clock = FakeClock()
+    cache = make_cache(clock=clock)
+    cache.put("q", "value")
+
+    clock.now += 61
+
+    assert cache.get("q") is None
+    assert len(cache) == 0
+
+
+def test_cache_evicts_least_recently_used() -> None:
+    clock = FakeClock()
+    cache = make_cache(max_entries=2, clock=clock)
+    cache.put("a", "1")
+    clock.now += 1
+    cache.put("b", "2")
+    clock.now += 1
+    cache.get("a")
+    clock.now += 1
+    cache.put("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_cache_skips_oversized_entries() -> None:
+    cache = make_cache(max_entry_bytes=4)
+
+    assert not cache.put("q", "too large")
+    assert cache.get("q") is None
+
+
+def test_search_responses_feed_source_collection() -> None:
+    result = asyncio.run(FakeSearchBackend().search("callbacks"))
+    event = Event(
+        author="section_researcher",
+        content=genai_types.Content(
+            role="user",
+            parts=[
+                genai_types.Part.from_function_response(
+                    name=SEARCH_TOOL_NAME, response=search_response(result)
+                )
+            ],
+        ),
+    )
+    sources: dict[str, Any] = {}
+    url_to_short_id: dict[str, str] = {}
+
+    collect_sources([event], sources, url_to_short_id)
+
+    assert url_to_short_id == {"https://google.github.io/adk-docs/1/": "src-1"}
+    assert sources["src-1"]["supported_claims"] == [
+        {"text_segment": "Callbacks run before tools.", "confidence": 0.9}
+    ]
+
+
+def test_find_executed_matches_exact_and_near_duplicate_queries() -> None:
+    ledger = [normalize_query("ADK callback types")]
+
+    assert (
+        find_executed("site:example.com adk  Callback types", ledger, 0.8) == ledger[0]
+    )
+    assert find_executed("callback types adk", ledger, 0.8) == ledger[0]
+    assert find_executed("ADK callback return values", ledger, 0.8) is None
+
+
+def test_dedup_queries_drops_executed_and_repeated_queries() -> None:
+    kept, dropped = dedup_queries(
+        ["ADK sessions", "adk callbacks", "ADK sessions ", "ADK memory"],
+        [normalize_query("ADK callbacks")],
+        0.8,
+    )
+
+    assert kept == [scope_query("ADK sessions"), scope_query("ADK memory")]
+    assert dropped == ["adk callbacks", "ADK sessions "]
+
+
+class BatchSearchLlm(BaseLlm):
+    """Issues the same batch of searches once, then answers."""
+
+    queries: list[str]
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        last = llm_request.contents[-1].parts or []
+        if last and last[0].function_response:
+            parts = [genai_types.Part(text="done")]
+        else:
+            parts = [
+                genai_types.Part(
+                    function_call=genai_types.FunctionCall(
+                        id=f"call-{i}", name=SEARCH_TOOL_NAME, args={"query": query}
+                    )
+                )
+                for i, query in enumerate(self.queries)
+            ]
+        yield LlmResponse(content=genai_types.Content(role="model", parts=parts))
+
+
+async def run_agent(agent: LlmAgent, state: dict) -> dict:
+    runner = InMemoryRunner(agent=agent, app_name="test")
+    session = await runner.session_service.create_session(
+        app_name="test", user_id="u", state=state
+    )
+    async for _ in runner.run_async(
+        user_id="u",
+        session_id=session.id,
+        new_message=genai_types.Content(
+            role="user", parts=[genai_types.Part(text="go")]
+        ),
+    ):
+        pass
+    stored = await runner.session_service.get_session(
+        app_name="test", user_id="u", session_id=session.id
+    )
+    assert stored is not None
+    return stored.state
+
+
+def test_dedup_callback_scopes_queries_and_skips_repeats(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(config, "search_dedup", True)
+    backend = FakeSearchBackend()
+    agent = LlmAgent(
+        name="researcher",
+        model=BatchSearchLlm(
+            model="stub",
+            queries=[
+                "ADK callbacks",
+                "site:example.com adk  Callbacks",
+                "ADK sessions",
+                "ADK memory",
+            ],
+        ),
+        tools=[SearchTool(backend)],
+        before_tool_callback=dedup_search_callback,
+    )
+
+    state = asyncio.run(
+        run_agent(agent, {EXECUTED_QUERIES_KEY: [normalize_query("ADK memory")]})
+    )
+
+    assert backend.calls == [scope_query("ADK callbacks"), scope_query("ADK sessions")]
+    assert state[SEARCH_DEDUP_KEY] == {
+        "executed": 2,
+        "rescoped": 4,
+        "duplicates_avoided": 2,
+        "follow_ups_dropped": 0,
+    }
+    assert state[EXECUTED_QUERIES_KEY][1:] == [
+        normalize_query("ADK callbacks"),
+        normalize_query("ADK sessions"),
+    ]
+
+
+class FeedbackLlm(BaseLlm):
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        feedback = {
+            "grade": "fail",
+            "comment": "Needs more depth.",
+            "follow_up_queries": [
+                {"search_query": "ADK callbacks"},
+                {"search_query": "ADK tool context"},
+            ],
+        }
+        yield LlmResponse(
+            content=genai_types.Content(
+                role="model", parts=[genai_types.Part(text=json.dumps(feedback))]
+            )
+        )
+
+
+def test_follow_up_queries_are_filtered_against_the_ledger(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(config, "search_dedup", True)
+    agent = LlmAgent(
+        name="research_evaluator",
+        model=FeedbackLlm(model="stub"),
+        output_schema=Feedback,
+        output_key="research_evaluation",
+        after_agent_callback=filter_follow_up_queries_callback,
+    )
+
+    state = asyncio.run(
+        run_agent(agent, {EXECUTED_QUERIES_KEY: [normalize_query("adk Callbacks")]})
+    )
+
+    assert state["research_evaluation"]["follow_up_queries"] == [
+        {"search_query": scope_query("ADK tool context")}
+    ]
+    assert state["research_evaluation"]["dropped_follow_up_queries"] == [
+        "ADK callbacks"
+    ]
+    assert state[SEARCH_DEDUP_KEY]["follow_ups_dropped"] == 1
@@ -0,0 +1,147 @@
+"""Tests for the source registry helpers and callbacks."""
+
+from typing import Any
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.adk.sessions import InMemorySessionService, Session
+from google.genai import types as genai_types
+
+from app.agent import collect_research_sources_callback
+from app.sources import SOURCES_CURSOR_KEY, collect_sources, render_source_digest
+
+
+def make_grounding_event(
+    urls: list[str], claims: list[tuple[str, int, float]]
+) -> Event:
+    """Builds an event whose grounding metadata cites `urls` for `claims`."""
+    chunks = [
+        genai_types.GroundingChunk(
+            web=genai_types.GroundingChunkWeb(
+                uri=url, title=f"Title {url}", domain="google.github.io"
+            )
+        )
+        for url in urls
+    ]
+    supports = [
+        genai_types.GroundingSupport(
+            segment=genai_types.Segment(text=text),
+            grounding_chunk_indices=[chunk_idx],
+            confidence_scores=[confidence],
+        )
+        for text, chunk_idx, confidence in claims
+    ]
+    return Event(
+        author="section_researcher",
+        grounding_metadata=genai_types.GroundingMetadata(
+            grounding_chunks=chunks, grounding_supports=supports
+        ),
+    )
+
+
+def make_callback_context(session: Session) -> CallbackContext:
+    invocation_context = InvocationContext(
+        session_service=InMemorySessionService(),
+        invocation_id="inv-1",
+        agent=BaseAgent(name="section_researcher"),
+        session=session,
+    )
+    return CallbackContext(invocation_context)
+
+
+def test_collect_sources_assigns_short_ids_in_event_order() -> None:
+    events = [
+        make_grounding_event(["https://a"], [("claim a", 0, 0.9)]),
+        make_grounding_event(["https://b", "https://a"], [("claim b", 0, 0.8)]),
+    ]
+    sources: dict[str, Any] = {}
+    url_to_short_id: dict[str, str] = {}
+
+    cursor = collect_sources(events, sources, url_to_short_id)
+
+    assert cursor == 2
+    assert url_to_short_id == {"https://a": "src-1", "https://b": "src-2"}
+    assert sources["src-2"]["supported_claims"] == [
+        {"text_segment": "claim b", "confidence": 0.8}
+    ]
+
+
+def test_callback_only_processes_new_events_and_dedups_claims() -> None:
+    session = Session(id="s1", app_name="app", user_id="u")
+    session.events.append(make_grounding_event(["https://a"], [("claim a", 0, 0.9)]))
+    collect_research_sources_callback(make_callback_context(session))
+
+    # The same grounding shows up again in a later loop iteration.
+    session.events.append(make_grounding_event(["https://a"], [("claim a", 0, 0.9)]))
+    session.events.append(make_grounding_event(["https://b"], [("claim b", 0, 0.7)]))
+    callback_context = make_callback_context(session)
+    collect_research_sources_callback(callback_context)
+
+    sources = callback_context.state["sources"]
+    assert callback_context.state[SOURCES_CURSOR_KEY] == 3
+    assert [
+        claim["text_segment"] for claim in sources["src-1"]["supported_claims"]
+    ] == ["claim a"]
+    assert sources["src-2"]["url"] == "https://b"
+
+
+def test_callback_rescans_safely_when_events_were_removed() -> None:
+    session = Session(id="s2", app_name="app", user_id="u")
+    session.events.extend(
+        make_grounding_event([f"https://{i}"], [(f"claim {i}", 0, 0.5)])
+        for i in range(3)
+    )
+    collect_research_sources_callback(make_callback_context(session))
+    del session.events[:2]
+
+    callback_context = make_callback_context(session)
+    collect_research_sources_callback(callback_context)
+
+    assert callback_context.state[SOURCES_CURSOR_KEY] == 1
+    assert len(callback_context.state["sources"]) == 3
+    assert _claim_count(callback_context.state["sources"]) == 3
+
+
+def _claim_count(sources: dict) -> int:
+    return sum(len(source["supported_claims"]) for source in sources.values())
+
+
+def make_sources(count: int, claims_per_source: int) -> dict:
+    return {
+        f"src-{i}": {
+            "short_id": f"src-{i}",
+            "title": f"Page {i}",
+            "url": f"https://google.github.io/adk-docs/page-{i}/",
+            "domain": "google.github.io",
+            "supported_claims": [
+                {"text_segment": f"claim {i}.{j} " + "x" * 80, "confidence": j / 10}
+                for j in range(claims_per_source)
+            ],
+        }
+        for i in range(1, count + 1)
+    }
+
+
+def test_source_digest_lists_top_claims_per_source() -> None:
+    digest, stats = render_source_digest(
+        make_sources(2, 5), max_chars=10_000, claims_per_source=2
+    )
+
+    assert "| src-1 | Page 1 | google.github.io |" in digest
+    assert "- src-2 (0.40): claim 2.4" in digest
+    assert "claim 2.2" not in digest
+    assert stats == {"sources_total": 2, "sources_included": 2, "claims_included": 4}
+
+
+def test_source_digest_respects_budget_and_keeps_best_sources() -> None:
+    sources = make_sources(50, 5)
+    sources["src-50"]["supported_claims"][0]["confidence"] = 0.99
+
+    digest, stats = render_source_digest(sources, max_chars=600, claims_per_source=3)
+
+    assert len(digest) <= 600
+    assert "| src-50 |" in digest
+    assert stats["sources_included"] < 50
+    assert len(str(sources)) > 10 * len(digest)
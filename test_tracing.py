@@ -0,0 +1,165 @@
+"""Tests for per-agent tracing."""
+
+import asyncio
+import json
+from collections.abc import AsyncGenerator
+from pathlib import Path
+
+from google.adk.agents import LlmAgent, SequentialAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.genai import types as genai_types
+
+from app.search import SEARCH_TOOL_NAME, SearchTool
+from app.tracing import JsonlSpanExporter, Tracer, load_spans, summarize
+from test_search import FakeSearchBackend
+
+
+class SearchingLlm(BaseLlm):
+    """Searches once, then answers; reports fixed token usage."""
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        searched = any(
+            part.function_response
+            for content in llm_request.contents
+            for part in content.parts or []
+        )
+        part = (
+            genai_types.Part(text="ADK callbacks run around every model call.")
+            if searched
+            else genai_types.Part(
+                function_call=genai_types.FunctionCall(
+                    name=SEARCH_TOOL_NAME, args={"query": "adk callbacks"}
+                )
+            )
+        )
+        yield LlmResponse(
+            content=genai_types.Content(role="model", parts=[part]),
+            usage_metadata=genai_types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=100,
+                candidates_token_count=10,
+                thoughts_token_count=5,
+            ),
+        )
+
+
+def record_answer_callback(callback_context: CallbackContext) -> None:
+    callback_context.state["answered"] = True
+
+
+async def run_traced(tmp_path: Path) -> list[dict]:
+    researcher = LlmAgent(
+        name="researcher",
+        model=SearchingLlm(model="stub"),
+        instruction="Research ADK callbacks.",
+        tools=[SearchTool(FakeSearchBackend())],
+        output_key="findings",
+        after_agent_callback=record_answer_callback,
+    )
+    root = SequentialAgent(name="pipeline", sub_agents=[researcher])
+    path = tmp_path / "traces.jsonl"
+    Tracer([JsonlSpanExporter(path)]).instrument(root)
+
+    runner = InMemoryRunner(agent=root, app_name="test")
+    session = await runner.session_service.create_session(app_name="test", user_id="u")
+    async for _ in runner.run_async(
+        user_id="u",
+        session_id=session.id,
+        new_message=genai_types.Content(
+            role="user", parts=[genai_types.Part(text="go")]
+        ),
+    ):
+        pass
+    stored = await runner.session_service.get_session(
+        app_name="test", user_id="u", session_id=session.id
+    )
+    assert stored is not None
+    assert stored.state["answered"] is True
+    return load_spans(path)
+
+
+def test_spans_record_agent_model_tool_and_callback_work(tmp_path: Path) -> None:
+    spans = asyncio.run(run_traced(tmp_path))
+    by_kind: dict[str, list[dict]] = {}
+    for span in spans:
+        by_kind.setdefault(span["kind"], []).append(span)
+
+    agents = {span["name"]: span for span in by_kind["agent"]}
+    assert set(agents) == {"pipeline", "researcher"}
+    researcher = agents["researcher"]["attributes"]
+    assert researcher["model_calls"] == 2
+    assert researcher["prompt_tokens"] == 200
+    assert researcher["output_tokens"] == 20
+    assert researcher["thought_tokens"] == 10
+    assert researcher["search_calls"] == 1
+    assert researcher["state_bytes_delta"] > 0
+    assert agents["researcher"]["parent_id"] == agents["pipeline"]["span_id"]
+
+    assert [s["name"] for s in by_kind["tool"]] == [SEARCH_TOOL_NAME]
+    assert len(by_kind["model"]) == 2
+    assert all(
+        s["parent_id"] == agents["researcher"]["span_id"]
+        for s in by_kind["model"] + by_kind["tool"]
+    )
+    assert [s["name"] for s in by_kind["callback"]] == ["record_answer_callback"]
+    assert by_kind["callback"][0]["parent_id"] == agents["researcher"]["span_id"]
+    assert all(s["duration_s"] >= 0 for s in spans)
+    json.dumps(spans)
+
+
+def test_summary_lists_agents_and_slowest_spans(tmp_path: Path) -> None:
+    summary = summarize(asyncio.run(run_traced(tmp_path)), top=5)
+    assert "researcher" in summary
+    assert "slowest spans:" in summary
+
+
+def test_instrument_is_idempotent(tmp_path: Path) -> None:
+    agent = LlmAgent(
+        name="writer",
+        model=SearchingLlm(model="stub"),
+        after_agent_callback=record_answer_callback,
+    )
+    tracer = Tracer([JsonlSpanExporter(tmp_path / "traces.jsonl")])
+    tracer.instrument(agent)
+    tracer.instrument(agent)
+    assert len(agent.canonical_before_agent_callbacks) == 1
+    assert len(agent.canonical_after_agent_callbacks) == 2
+
+
+def cite_report_callback(callback_context: CallbackContext) -> genai_types.Content:
+    callback_context.state["final_report_with_citations"] = "x" * 1000
+    return genai_types.Content(role="model", parts=[genai_types.Part(text="cited")])
+
+
+def test_agent_spans_close_after_callbacks_that_end_the_chain(tmp_path: Path) -> None:
+    agent = LlmAgent(
+        name="composer",
+        model=SearchingLlm(model="stub"),
+        tools=[SearchTool(FakeSearchBackend())],
+        after_agent_callback=cite_report_callback,
+    )
+    path = tmp_path / "traces.jsonl"
+    Tracer([JsonlSpanExporter(path)]).instrument(agent)
+
+    async def scenario() -> None:
+        runner = InMemoryRunner(agent=agent, app_name="test")
+        session = await runner.session_service.create_session(
+            app_name="test", user_id="u"
+        )
+        async for _ in runner.run_async(
+            user_id="u",
+            session_id=session.id,
+            new_message=genai_types.Content(
+                role="user", parts=[genai_types.Part(text="go")]
+            ),
+        ):
+            pass
+
+    asyncio.run(scenario())
+    spans = {span["kind"]: span for span in load_spans(path)}
+    assert spans["callback"]["parent_id"] == spans["agent"]["span_id"]
+    assert spans["agent"]["attributes"]["model_calls"] == 2
+    assert spans["agent"]["attributes"]["state_bytes_delta"] >= 1000